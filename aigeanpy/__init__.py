@@ -1,7 +1,38 @@
-from aigeanpy.net import query_isa, download_isa
-from aigeanpy.analysis import kmeans
-from aigeanpy.satmap import get_satmap
-from aigeanpy import satmap
-from aigeanpy import clustering, clustering_numpy
-from aigeanpy import analysis
-from aigeanpy import utilis
+import importlib
+
+# The functions and modules of the package are imported on first use, so
+# that `import aigeanpy` and the console scripts only load the dependencies
+# (requests, matplotlib, scikit-image, asdf, h5py) of the code they run.
+_functions = {'query_isa': 'aigeanpy.net',
+              'download_isa': 'aigeanpy.net',
+              'kmeans': 'aigeanpy.analysis',
+              'KMeansModel': 'aigeanpy.analysis',
+              'get_satmap': 'aigeanpy.satmap',
+              'sample_maps': 'aigeanpy.satmap',
+              'segment': 'aigeanpy.segmentation',
+              'render_many': 'aigeanpy.rendering',
+              'export_tiles': 'aigeanpy.tiles',
+              'TemporalStats': 'aigeanpy.temporal',
+              'get_ecne': 'aigeanpy.ecne',
+              'EcneTable': 'aigeanpy.ecne'}
+_modules = ['satmap', 'clustering', 'clustering_numpy', 'clustering_minibatch',
+            'clustering_hamerly', 'clustering_parallel', 'analysis', 'utilis',
+            'profiling', 'rendering', 'quicklook', 'tiles',
+            'temporal', 'expression', 'dtypes', 'masks', 'ecne']
+
+__all__ = list(_functions) + _modules
+
+
+def __getattr__(name):
+    if name in _functions:
+        value = getattr(importlib.import_module(_functions[name]), name)
+    elif name in _modules:
+        value = importlib.import_module('aigeanpy.' + name)
+    else:
+        raise AttributeError(f"module 'aigeanpy' has no attribute '{name}'")
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
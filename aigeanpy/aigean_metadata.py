@@ -1,12 +1,15 @@
 import argparse
 from aigeanpy.satmap import get_satmap
+from aigeanpy import profiling
 
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('filename', nargs='+',
                         help='All information about the file in meta data')
+    profiling.add_profile_argument(parser)
     args = parser.parse_args()
+    profiling.start_profile(args)
     errorlist = []
     if len(args.filename) == 1:
         try:
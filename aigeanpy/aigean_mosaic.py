@@ -1,5 +1,6 @@
 import argparse
 from aigeanpy.satmap import get_satmap
+from aigeanpy import profiling
 from aigeanpy.utilis import print_err
 
 
@@ -8,7 +9,9 @@ def main():
     parser.add_argument('-r', '--resolution',
                         help='Resolution of the instrument')
     parser.add_argument('filename', nargs='+', help='Name of the files')
+    profiling.add_profile_argument(parser)
     args = parser.parse_args()
+    profiling.start_profile(args)
     if len(args.filename) < 2:
         print_err("You should provide at least 2 filenames")
 
@@ -2,6 +2,7 @@ import argparse
 from datetime import date
 from aigeanpy.net import download_isa, query_isa
 from aigeanpy.satmap import get_satmap
+from aigeanpy import profiling
 from aigeanpy.utilis import print_err
 import os
 
@@ -12,7 +13,9 @@ def main():
         '-i', '--instrument', help='Select a specific instrument to get data (lir, manannan, fand, or ecne)')
     parser.add_argument('-s', '--saveplot', default=False,
                         help='Save the plot if the file downloaded is from one of the three imagers')
+    profiling.add_profile_argument(parser)
     args = parser.parse_args()
+    profiling.start_profile(args)
 
     if args.instrument is not None:
         if args.instrument.casefold() == 'lir'.casefold():
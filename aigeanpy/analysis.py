@@ -1,35 +1,398 @@
-from typing import Union
+from typing import Union, List
 from pathlib import Path
-from aigeanpy.clustering import cluster
-from aigeanpy.clustering_numpy import cluster_num
+import json
+import numpy as np
+from aigeanpy import clustering, clustering_numpy
+from aigeanpy.utilis import read_csv
+from functools import partial
 
 
-def kmeans(filename: Union[Path, str], clusters: int = 3, iterations: int = 10, Numpy=False):
+class KMeansResult(object):
+
+    """
+    The outcome of a k-means run.
+
+    Attributes
+    ----------
+    labels : numpy array
+        The cluster of every point, in the smallest unsigned integer type
+        that holds the number of clusters. None in mini-batch mode, where the
+        labels are written to a file instead.
+    centres : numpy array
+        (clusters, d) array of the cluster centres.
+    inertia : float
+        Sum of squared distances from every point to its centre (None in
+        mini-batch mode).
+    n_iter : int
+        Number of iterations performed (passes over the data in mini-batch
+        mode).
+
+    Iterating over the result, or indexing it, gives for each cluster the list
+    of indices of its points, as `kmeans` returned in earlier versions.
+
+    Example
+    -------
+    >>> result = KMeansResult(np.array([0, 1, 1]), np.array([[0.], [2.]]), 0.5, 2)
+    >>> list(result)
+    [[0], [1, 2]]
+    >>> result.labels.dtype
+    dtype('uint8')
+
     """
-    Function to call the cluster_numpy and cluster functions 
+
+    def __init__(self, labels, centres, inertia, n_iter):
+        self.centres = np.asarray(centres)
+        if labels is not None:
+            labels = np.asarray(labels)
+            labels = labels.astype(np.min_scalar_type(max(len(self.centres) - 1, 0)),
+                                   copy=False)
+        self.labels = labels
+        self.inertia = inertia
+        self.n_iter = n_iter
+        # The labels `indices` was worked out from, and its value.
+        self._indices = (None, None)
+
+    @property
+    def indices(self):
+        """
+        For each cluster, the list of indices of the points in it, worked
+        out once (again only if `labels` is replaced).
+        """
+        if self.labels is None:
+            raise ValueError(
+                "The labels of a mini-batch run are in its labels file.")
+        if self._indices[0] is not self.labels:
+            order = np.argsort(self.labels, kind='stable')
+            counts = np.bincount(self.labels, minlength=len(self.centres))
+            self._indices = (self.labels, [group.tolist() for group in
+                                           np.split(order, np.cumsum(counts)[:-1])])
+        return self._indices[1]
+
+    def __iter__(self):
+        return iter(self.indices)
+
+    def __len__(self):
+        return len(self.centres)
+
+    def __getitem__(self, i):
+        return self.indices[i]
+
+    def __str__(self):
+        """
+        A summary of the clusters, in the format printed by the backends.
+        """
+        counts = None
+        if self.labels is not None:
+            counts = np.bincount(self.labels, minlength=len(self.centres))
+        lines = []
+        for i, centre in enumerate(self.centres):
+            line = "Cluster " + str(i) + " is centred at " + str(centre)
+            if counts is not None:
+                line += " and has " + str(counts[i]) + " points."
+            lines.append(line)
+        if self.inertia is not None:
+            lines.append("Inertia " + str(self.inertia) + " after " +
+                         str(self.n_iter) + " iterations.")
+        return "\n".join(lines)
+
+
+class KMeansModel(object):
+
+    """
+    A k-means model that can be fitted, saved, loaded and used to allocate
+    new points to its clusters.
+
+    Refitting a model that already has centres starts from them (a warm
+    start), so when the data barely changes, e.g. from one day's Ecne file
+    to the next, it converges in one or two iterations.
+
+    Models are saved as a small JSON file holding the centres and metadata.
+
+    Example
+    -------
+    >>> model = KMeansModel(clusters=2, seed=0)
+    >>> result = model.fit(np.array([[0.], [0.2], [5.], [5.2]]), verbose=False)
+    >>> model.predict(np.array([[0.1], [4.9]])).tolist() == [result.labels[0], result.labels[2]]
+    True
+
+    """
+
+    def __init__(self, clusters: int = 3, iterations: int = 10,
+                 backend: str = 'numpy', tol: float = 1e-4, init: str = 'k-means++',
+                 n_init: int = 1, seed: int = None, centres=None, meta: dict = None):
+        """
+        Parameters
+        ----------
+        clusters : int
+            number of clusters to form.
+        iterations : int
+            maximum number of iterations of each fit.
+        backend : str, optional
+            'numpy' or 'hamerly'.
+        tol : float, optional
+            relative tolerance on the movement of the centres.
+        init, n_init, seed : optional
+            seeding of a fit without previous centres, as for `kmeans`.
+        centres : numpy array, optional
+            (clusters, d) starting centres.
+        meta : dict, optional
+            extra information saved with the model, e.g. the dates of the
+            data it was fitted to.
+        """
+        if backend not in ('numpy', 'hamerly'):
+            raise ValueError("Unknown clustering backend: " + str(backend))
+        self.clusters = clusters
+        self.iterations = iterations
+        self.backend = backend
+        self.tol = tol
+        self.init = init
+        self.n_init = n_init
+        self.seed = seed
+        self.centres = None if centres is None else _as_array(centres)
+        self.meta = dict(meta or {})
+        self.inertia = None
+        self.n_iter = None
+
+    def fit(self, data, warm_start: bool = True, verbose: bool = True):
+        """
+        Fits the model to a CSV file or an array of points.
+
+        Parameters
+        ----------
+        data : Path or array
+            CSV filename or (n, d) array of points.
+        warm_start : bool, optional
+            When True (the default) and the model already has centres, the
+            iterations start from them instead of from new random centres.
+        verbose : bool, optional
+            whether to print a summary of the clusters.
+
+        Returns
+        -------
+        KMeansResult
+            the labels of the points fitted, the centres, inertia and
+            number of iterations.
+
+        """
+        points = _load_points(data)
+        if self.backend == 'hamerly':
+            from aigeanpy.clustering_hamerly import hamerly as kernel
+        else:
+            kernel = clustering_numpy.lloyd
+
+        if warm_start and self.centres is not None:
+            if self.centres.shape[1] != points.shape[1]:
+                raise ValueError("The data does not have the same number of "
+                                 "columns as the model.")
+            centres, alloc, n_iter = kernel(points, self.centres,
+                                            self.iterations, self.tol)
+            inertia = clustering_numpy.inertia(points, centres, alloc)
+        else:
+            centres, alloc, n_iter, inertia = clustering_numpy.best_run(
+                points, self.clusters, self.iterations, self.tol, self.init,
+                self.n_init, self.seed, kernel=kernel)
+
+        self.centres = centres
+        self.inertia = inertia
+        self.n_iter = n_iter
+        result = KMeansResult(alloc, centres, inertia, n_iter)
+        if verbose:
+            print(result)
+        return result
+
+    def predict(self, data):
+        """
+        Allocates each point of a CSV file or array to the nearest centre.
+
+        Returns
+        -------
+        labels : numpy array
+            the cluster of every point, as a compact unsigned integer array.
+
+        """
+        if self.centres is None:
+            raise ValueError("The model has not been fitted.")
+        points = _load_points(data)
+        alloc = clustering_numpy.nearest_centre(
+            points, self.centres.astype(points.dtype, copy=False))
+        return KMeansResult(alloc, self.centres, None, None).labels
+
+    def save(self, filename: Union[Path, str]):
+        """
+        Saves the centres and metadata of the model to a JSON file.
+        """
+        if self.centres is None:
+            raise ValueError("The model has not been fitted.")
+        model = {'clusters': self.clusters,
+                 'iterations': self.iterations,
+                 'backend': self.backend,
+                 'tol': self.tol,
+                 'init': self.init,
+                 'n_init': self.n_init,
+                 'seed': self.seed,
+                 'dtype': str(self.centres.dtype),
+                 'centres': self.centres.tolist(),
+                 'inertia': self.inertia,
+                 'n_iter': self.n_iter,
+                 'meta': self.meta}
+        with open(filename, 'w') as f:
+            json.dump(model, f, indent=1)
+
+    @classmethod
+    def load(cls, filename: Union[Path, str]):
+        """
+        Loads a model saved with `save`.
+        """
+        with open(filename, 'r') as f:
+            model = json.load(f)
+        centres = np.array(model['centres'], dtype=model['dtype'])
+        loaded = cls(model['clusters'], model['iterations'], model['backend'],
+                     model['tol'], model['init'], model['n_init'],
+                     model['seed'], centres, model['meta'])
+        loaded.inertia = model['inertia']
+        loaded.n_iter = model['n_iter']
+        return loaded
+
+
+def _is_filename(data):
+    return isinstance(data, (str, Path))
+
+
+def _as_array(data):
+    """
+    Points as a 2D float array. Contiguous float32 or float64 arrays, and
+    memoryviews of them, are used as they are without copying.
+    """
+    points = np.asarray(data)
+    if points.dtype not in (np.float32, np.float64):
+        points = points.astype(np.float64)
+    if points.ndim == 1:
+        points = points.reshape(-1, 1)
+    return points
+
+
+def _load_points(data):
+    """
+    Points from a CSV filename or an array, as a 2D float array.
+    """
+    if _is_filename(data):
+        if Path(data).suffix != '.csv':
+            raise ValueError("Input file must be a CSV file.")
+        return np.loadtxt(data, delimiter=",", ndmin=2)
+    return _as_array(data)
+
+
+def kmeans(filename: Union[Path, str, List[Union[Path, str]], np.ndarray],
+           clusters: int = 3, iterations: int = 10, Numpy=False,
+           batch_size: int = None, labels_file: Union[Path, str] = None,
+           init: str = 'k-means++', n_init: int = 1, seed: int = None,
+           backend: str = None, verbose: bool = True, workers: int = None):
+    """
+    Function to call the cluster_numpy and cluster functions
+
+    The data can be a CSV file, or points already in memory: a numpy array,
+    a memoryview or a list of tuples with one row per point. Float arrays are
+    clustered in place, without being copied.
+
+    When `batch_size` is given the data is instead streamed from disk and
+    clustered with mini-batch k-means, so files larger than memory (or a list
+    of daily files) can be clustered.
 
     Parameters
     ----------
-    filename : Path
-        filename of CSV that you wish to read into the algorithm
+    filename : Path or array
+        filename of CSV that you wish to read into the algorithm (or a list of
+        CSV filenames in mini-batch mode), or an (n, d) array of points
     clusters : int
         number of clusters you want to form
     iterations: int
-        number of iterations for the code to perform
+        maximum number of iterations for the code to perform (number of
+        passes over the data in mini-batch mode)
     Numpy: bool
         whether to run clustering with pure python or with numpy
+    batch_size: int, optional
+        number of rows held in memory at once; enables mini-batch mode
+    labels_file: Path, optional
+        in mini-batch mode, file to write the cluster of every row to
+    init: str, optional
+        'k-means++' (default) or 'random' starting centres
+    n_init: int, optional
+        number of independent runs, made in parallel processes; the run with
+        the lowest inertia is kept (not used in mini-batch mode)
+    seed: int, optional
+        seed for the starting centres, to make the result reproducible
+    backend: str, optional
+        'python', 'numpy', 'hamerly' (numpy with Hamerly's bounds, which
+        skips distance computations that cannot change the result and gives
+        the same clusters as 'numpy' for the same seed) or 'parallel' (numpy
+        with the assignment step spread over `workers` processes sharing the
+        points in memory). Overrides `Numpy`.
+    verbose: bool, optional
+        whether to print a summary of the clusters. The default is True.
+    workers: int, optional
+        number of processes used by the 'parallel' backend, and for the
+        independent runs of the other backends; one per core by default.
 
     Returns
     -------
-    list
-        a list with the measurement indices that belong to each group
+    KMeansResult
+        the labels, centres, inertia and number of iterations. Iterating over
+        it gives a list with the measurement indices that belong to each
+        group.
 
     """
-    file = Path(filename)
-    if file.suffix != '.csv':
-        raise ValueError("Input file must be a CSV file.")
-        
-    if Numpy:
-        return cluster_num(filename, clusters, iterations)
+    is_files = _is_filename(filename) or (
+        isinstance(filename, (list, tuple)) and len(filename) > 0 and
+        all(_is_filename(name) for name in filename))
+
+    if is_files:
+        filenames = [filename] if _is_filename(filename) else list(filename)
+        for name in filenames:
+            if Path(name).suffix != '.csv':
+                raise ValueError("Input file must be a CSV file.")
+
+    if batch_size is not None:
+        if not is_files:
+            raise ValueError("Mini-batch mode streams data from CSV files.")
+        from aigeanpy.clustering_minibatch import cluster_minibatch
+        centres = cluster_minibatch(filenames, clusters, iterations,
+                                    batch_size, labels_file, seed,
+                                    verbose=verbose)
+        return KMeansResult(None, centres, None, iterations)
+
+    if is_files and len(filenames) > 1:
+        raise ValueError("Several files can only be clustered in mini-batch mode.")
+
+    if backend is None:
+        backend = 'numpy' if Numpy else 'python'
+
+    if backend in ('numpy', 'hamerly', 'parallel'):
+        points = _load_points(filenames[0] if is_files else filename)
+        run_workers = workers
+        if backend == 'hamerly':
+            from aigeanpy.clustering_hamerly import hamerly as kernel
+        elif backend == 'parallel':
+            from aigeanpy.clustering_parallel import parallel_lloyd
+            # The cores are used by each run, so the runs are made in turn.
+            kernel = partial(parallel_lloyd, workers=workers)
+            run_workers = 1
+        else:
+            kernel = None
+        centres, alloc, n_iter, inertia = clustering_numpy.best_run(
+            points, clusters, iterations, init=init, n_init=n_init,
+            seed=seed, workers=run_workers, kernel=kernel)
+    elif backend == 'python':
+        if is_files:
+            points = read_csv(filenames[0])
+        else:
+            points = [tuple(row) for row in _as_array(filename).tolist()]
+        centres, alloc, n_iter, inertia = clustering.best_run(
+            points, clusters, iterations, init, n_init, seed, workers)
+        alloc = np.frombuffer(alloc, dtype=np.dtype(alloc.typecode))
     else:
-        return cluster(filename, clusters, iterations)
+        raise ValueError("Unknown clustering backend: " + str(backend))
+
+    result = KMeansResult(alloc, centres, inertia, n_iter)
+    if verbose:
+        print(result)
+    return result
@@ -1,14 +1,177 @@
 from math import *
 from random import *
+from array import array
+import os
+from concurrent.futures import ProcessPoolExecutor
 from typing import Union
 from pathlib import Path
 from aigeanpy.utilis import read_csv
+from aigeanpy import profiling
 from argparse import ArgumentParser
 
 
-def cluster(filename: Union[Path, str], clusters: int, iterations: int):
+def kmeans_plusplus(points, clusters: int, rng):
     """
-    Picks three points randomly to be the initial centres of the clusters, assigns each data
+    Chooses starting centres with k-means++: the first centre is a random
+    point, and each following one is a point picked with probability
+    proportional to its squared distance from the nearest centre so far.
+
+    Parameters
+    ----------
+    points : list
+        list of point tuples.
+    clusters : int
+        number of centres to choose.
+    rng : random.Random
+        source of randomness, so the seeding can be reproduced.
+
+    Returns
+    -------
+    centres : list
+        list of starting centres.
+
+    """
+    centres = [points[rng.randrange(len(points))]]
+    min_distance = [dist(p, centres[0])**2 for p in points]
+    while len(centres) < clusters:
+        if sum(min_distance) > 0:
+            centre = rng.choices(points, weights=min_distance)[0]
+        else:
+            centre = points[rng.randrange(len(points))]
+        centres.append(centre)
+        min_distance = [min(d, dist(p, centre)**2)
+                        for p, d in zip(points, min_distance)]
+    return centres
+
+
+def assign(points, centres, alloc):
+    """
+    Allocates every point to its nearest centre in a single pass, adding it
+    to the running sum of its cluster as it goes.
+
+    Centres are ranked with math.dist, which works for any number of
+    dimensions and runs in C. Its square root does not change which centre
+    is nearest, and it is faster than a squared distance summed in Python.
+
+    Parameters
+    ----------
+    points : list
+        list of point tuples.
+    centres : list
+        list of centres.
+    alloc : array
+        cluster of every point, updated in place.
+
+    Returns
+    -------
+    sums : list
+        sum of the points of each cluster, as an array('d').
+    counts : array
+        number of points in each cluster.
+    changed : bool
+        whether any point changed cluster.
+
+    """
+    dims = range(len(centres[0]))
+    sums = [array('d', bytes(8 * len(dims))) for _ in centres]
+    counts = array('l', [0]) * len(centres)
+    changed = False
+    for j, point in enumerate(points):
+        best = 0
+        best_distance = inf
+        for i, centre in enumerate(centres):
+            distance = dist(point, centre)
+            if distance < best_distance:
+                best_distance = distance
+                best = i
+        if alloc[j] != best:
+            alloc[j] = best
+            changed = True
+        counts[best] += 1
+        total = sums[best]
+        for d in dims:
+            total[d] += point[d]
+    return sums, counts, changed
+
+
+def single_run(points, clusters: int, iterations: int,
+               init: str = 'k-means++', seed=None):
+    """
+    One k-means run: seeds the centres, then iterates until the allocation
+    stops changing or `iterations` iterations have been made.
+
+    The points may have any number of dimensions. Each iteration makes one
+    pass over the points, which keeps a running sum and count for each
+    cluster, and each centre is then the mean of its points; a cluster left
+    empty keeps its centre.
+
+    Returns
+    -------
+    centres, alloc, n_iter, inertia
+        final centres, cluster of every point (as an array), number of
+        iterations performed and the sum of squared distances to the centres.
+
+    """
+    rng = Random(seed)
+    if init == 'k-means++':
+        centres = kmeans_plusplus(points, clusters, rng)
+    elif init == 'random':
+        centres = rng.sample(points, clusters)
+    else:
+        raise ValueError("init must be 'k-means++' or 'random'.")
+
+    alloc = array('l', [-1]) * len(points)
+
+    n = 0
+    while n < iterations:
+        sums, counts, changed = assign(points, centres, alloc)
+        n = n+1
+
+        if not changed:
+            break
+
+        for i, (total, count) in enumerate(zip(sums, counts)):
+            if count == 0:
+                continue
+            centres[i] = tuple(value / count for value in total)
+
+    if n == 0:
+        assign(points, centres, alloc)
+
+    inertia = sum(dist(p, centres[a])**2 for p, a in zip(points, alloc))
+    return centres, alloc, n, inertia
+
+
+@profiling.instrument('kmeans[python]',
+                      sizes=lambda run, points, *args, **kwargs: {'points': len(points)})
+def best_run(points, clusters: int, iterations: int, init: str = 'k-means++',
+             n_init: int = 1, seed=None, workers: int = None):
+    """
+    Runs `n_init` independent k-means runs, in a pool of `workers` processes
+    when there is more than one, and keeps the one with the lowest inertia.
+
+    The seeds of the runs are drawn from `seed`, so the result is reproducible
+    whatever the number of workers.
+    """
+    seed_rng = Random(seed)
+    seeds = [seed_rng.getrandbits(64) for _ in range(n_init)]
+    if n_init == 1:
+        runs = [single_run(points, clusters, iterations, init, seeds[0])]
+    else:
+        workers = min(n_init, workers or os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(single_run, points, clusters, iterations,
+                                   init, run_seed) for run_seed in seeds]
+            runs = [future.result() for future in futures]
+
+    return min(runs, key=lambda run: run[3])
+
+
+def cluster(filename: Union[Path, str], clusters: int, iterations: int,
+            init: str = 'k-means++', n_init: int = 1, seed=None,
+            verbose: bool = True):
+    """
+    Picks starting centres for the clusters (with k-means++ by default), assigns each data
     point to a cluster and updates the centre of each cluster by setting it to the average
     of all points assigned to the cluster
 
@@ -19,7 +182,16 @@ def cluster(filename: Union[Path, str], clusters: int, iterations: int):
     clusters : int
         number of clusters you want to form
     iterations: int
-        number of iterations for the code to perform
+        maximum number of iterations for the code to perform
+    init : str, optional
+        'k-means++' (default) or 'random' starting centres.
+    n_init : int, optional
+        number of independent runs, made in parallel processes; the run with
+        the lowest inertia is kept.
+    seed : int, optional
+        seed for the starting centres, to make the result reproducible.
+    verbose : bool, optional
+        whether to print a summary of the clusters. The default is True.
 
     Returns
     -------
@@ -29,39 +201,17 @@ def cluster(filename: Union[Path, str], clusters: int, iterations: int):
     """
     points = read_csv(filename)
 
-    centres = sample(points, clusters)
-
-    alloc = [None]*len(points)
-
-    n = 0
-    while n < iterations:
-
-        for i in range(len(points)):
-            select_point = points[i]
-            distance = [None] * clusters
-
-            for s, centre in enumerate(centres):
-                distance[s] = sqrt((select_point[0]-centre[0])**2 +
-                                   (select_point[1]-centre[1])**2 + (select_point[2]-centre[2])**2)
-
-            alloc[i] = distance.index(min(distance))
+    centres, alloc, n_iter, inertia = best_run(points, clusters, iterations,
+                                               init, n_init, seed)
 
+    class_indice = [[] for _ in range(clusters)]
+    for j, i in enumerate(alloc):
+        class_indice[i].append(j)
+    if verbose:
         for i in range(clusters):
-
-            alloc_ps = [p for j, p in enumerate(points) if alloc[j] == i]
-            dim1 = sum([a[0] for a in alloc_ps]) / len(alloc_ps)
-            dim2 = sum([a[1] for a in alloc_ps]) / len(alloc_ps)
-            dim3 = sum([a[2] for a in alloc_ps]) / len(alloc_ps)
-            new_mean = (dim1, dim2, dim3)
-            centres[i] = new_mean
-        n = n+1
-
-    class_indice = []
-    for i in range(clusters):
-        alloc_ps = [j for j, p in enumerate(points) if alloc[j] == i]
-        class_indice.append(alloc_ps.copy())
-        print("Cluster " + str(i) + " is centred at " +
-              str(centres[i]) + " and has " + str(len(alloc_ps)) + " points.")
+            print("Cluster " + str(i) + " is centred at " +
+                  str(centres[i]) + " and has " + str(len(class_indice[i])) + " points.")
+        print("Inertia " + str(inertia) + " after " + str(n_iter) + " iterations.")
 
     return class_indice
 
@@ -85,9 +235,14 @@ def process():
                         help='Please give file path to your csv file')
     parser.add_argument('--iters', default=10, type=int,
                         help='Please give number of iterations')
+    parser.add_argument('--n-init', default=1, type=int,
+                        help='Please give number of independent runs')
+    parser.add_argument('--seed', default=None, type=int,
+                        help='Please give seed for the starting centres')
     arguments = parser.parse_args()
 
-    cluster(arguments.filename, 3, arguments.iters)
+    cluster(arguments.filename, 3, arguments.iters,
+            n_init=arguments.n_init, seed=arguments.seed)
 
 
 if __name__ == "__main__":
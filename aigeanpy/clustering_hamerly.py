@@ -0,0 +1,154 @@
+import numpy as np
+from aigeanpy.clustering_numpy import update_centres
+
+
+def _slack(points_sq, centres, dtype):
+    """
+    Bound on the rounding error, in squared distance, of the scores
+    clustering_numpy.nearest_centre compares for each point.
+    """
+    centres_sq = np.einsum('ij,ij->i', centres, centres).astype(np.float64)
+    return 8 * np.finfo(dtype).eps * (points_sq + np.max(centres_sq))
+
+
+def _all_distances(points, centres, points_sq):
+    """
+    Nearest centre, an upper bound on the distance to it and a lower bound
+    on the distance to the second nearest centre, for every point in
+    `points`.
+
+    The nearest centre is found with the same expression as
+    clustering_numpy.nearest_centre so that both backends make the same
+    choice. The bounds are loosened by the rounding error of that
+    expression so a point is never wrongly skipped later on.
+    """
+    score = points @ (-2 * centres.T)
+    score += np.einsum('ij,ij->i', centres, centres)
+    alloc = np.argmin(score, axis=1)
+
+    score = score.astype(np.float64)
+    score += points_sq[:, None]
+    slack = _slack(points_sq, centres, points.dtype)
+
+    rows = np.arange(points.shape[0])
+    upper = np.sqrt(np.maximum(score[rows, alloc] + slack, 0))
+    if centres.shape[0] > 1:
+        score[rows, alloc] = np.inf
+        second = np.min(score, axis=1)
+        lower = np.sqrt(np.maximum(second - slack, 0))
+    else:
+        lower = np.full(points.shape[0], np.inf)
+    return alloc, upper, lower
+
+
+def hamerly(points, centres, iters: int, tol: float = 1e-4, stats: dict = None):
+    """
+    Lloyd's k-means iterations accelerated with Hamerly's bounds.
+
+    Every point keeps an upper bound on the distance to its own centre and a
+    lower bound on the distance to any other centre. After the centres move
+    the bounds are loosened by how far the centres moved; a point whose upper
+    bound is still below its lower bound (or below half the distance from its
+    centre to the nearest other centre) cannot change cluster, so no distance
+    is computed for it. The bounds are kept in float64 and a point is only
+    skipped if it is clear of the other centres by more than the rounding
+    error of the standard backend's distances, so float32 data gives the
+    same clusters too.
+
+    The result is the same as clustering_numpy.lloyd for the same starting
+    centres, including the stopping rule and the handling of empty clusters.
+
+    Parameters
+    ----------
+    points : numpy array
+        (n, d) array of points, float32 or float64.
+    centres : numpy array
+        (k, d) array of starting centres.
+    iters : int
+        maximum number of iterations.
+    tol : float, optional
+        relative tolerance on the squared movement of the centres.
+    stats : dict, optional
+        when given, 'distances' is set to the number of point-centre and
+        centre-centre distances computed, and 'lloyd_distances' to the number
+        the standard backend would have computed.
+
+    Returns
+    -------
+    centres : numpy array
+        the final centres.
+    alloc : numpy array
+        index of the cluster each point is allocated to.
+    n_iter : int
+        number of iterations performed.
+
+    """
+    dtype = points.dtype if points.dtype == np.float32 else np.float64
+    points = np.asarray(points, dtype=dtype)
+    centres = np.array(centres, dtype=dtype)
+    n_points, cluster_num = points.shape[0], centres.shape[0]
+    points_sq = np.einsum('ij,ij->i', points, points).astype(np.float64)
+    threshold = tol * np.mean(np.var(points, axis=0))
+
+    distances = 0
+    alloc = None
+    n_iter = 0
+    for n_iter in range(1, iters + 1):
+        if alloc is None:
+            new_alloc, upper, lower = _all_distances(points, centres, points_sq)
+            distances += n_points * cluster_num
+        else:
+            new_alloc = alloc.copy()
+            exact = centres.astype(np.float64)
+            centre_gap = np.sqrt(np.maximum(
+                np.einsum('ij,kj->ik', exact, exact) * -2
+                + np.einsum('ij,ij->i', exact, exact)[:, None]
+                + np.einsum('ij,ij->i', exact, exact)[None, :], 0))
+            np.fill_diagonal(centre_gap, np.inf)
+            half_gap = np.min(centre_gap, axis=1) / 2
+            distances += cluster_num * cluster_num
+            slack = _slack(points_sq, centres, dtype)
+
+            # A lower bound on the distance to any other centre: the other
+            # centres are at least 2 * half_gap - upper away.
+            bound = np.maximum(lower, 2 * half_gap[new_alloc] - upper)
+            check = np.flatnonzero(upper**2 + slack >= bound**2)
+            if len(check):
+                difference = points[check] - exact[new_alloc[check]]
+                upper[check] = np.sqrt(
+                    np.einsum('ij,ij->i', difference, difference))
+                distances += len(check)
+                bound[check] = np.maximum(
+                    lower[check], 2 * half_gap[new_alloc[check]] - upper[check])
+                check = check[upper[check]**2 + slack[check] >= bound[check]**2]
+            if len(check):
+                new_alloc[check], upper[check], lower[check] = _all_distances(
+                    points[check], centres, points_sq[check])
+                distances += len(check) * cluster_num
+
+        if alloc is not None and np.array_equal(alloc, new_alloc):
+            break
+        alloc = new_alloc
+
+        new_centres = update_centres(points, alloc, centres)
+        moved = np.sqrt(np.sum((new_centres.astype(np.float64) - centres)**2,
+                               axis=1))
+        shift = np.sum((new_centres - centres)**2)
+        centres = new_centres
+        if shift <= threshold:
+            break
+
+        upper += moved[alloc]
+        if cluster_num > 1:
+            largest = np.argmax(moved)
+            others = np.delete(moved, largest)
+            lower -= np.where(alloc == largest, np.max(others), moved[largest])
+
+    if alloc is None:
+        alloc, _, _ = _all_distances(points, centres, points_sq)
+        distances += n_points * cluster_num
+
+    if stats is not None:
+        stats['distances'] = distances
+        stats['lloyd_distances'] = n_iter * n_points * cluster_num
+    return centres, alloc, n_iter
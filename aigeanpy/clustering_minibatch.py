@@ -0,0 +1,246 @@
+from itertools import islice
+import numpy as np
+from typing import Union, List
+from pathlib import Path
+from argparse import ArgumentParser
+from aigeanpy.clustering_numpy import nearest_centre, cluster_sums, kmeans_plusplus
+from aigeanpy import profiling
+
+
+def read_chunks(filenames, chunk_size: int, dtype=np.float64):
+    """
+    Reads one or more CSV files as a stream of arrays of at most `chunk_size`
+    rows, so that only one chunk is ever held in memory.
+
+    Parameters
+    ----------
+    filenames : Path or list of Path
+        CSV file, or list of CSV files read one after the other.
+    chunk_size : int
+        maximum number of rows in each chunk.
+    dtype : numpy dtype, optional
+        precision of the returned arrays.
+
+    Yields
+    ------
+    chunk : numpy array
+        (m, d) array of the next m <= chunk_size rows.
+
+    """
+    if isinstance(filenames, (str, Path)):
+        filenames = [filenames]
+
+    for filename in filenames:
+        with open(filename, 'r') as f:
+            while True:
+                lines = list(islice(f, chunk_size))
+                if not lines:
+                    break
+                yield np.loadtxt(lines, delimiter=",", dtype=dtype, ndmin=2)
+
+
+def reservoir_sample(filenames, size: int, chunk_size: int, dtype, rng):
+    """
+    A uniform random sample of `size` rows of the CSV files, drawn in one
+    streaming pass with reservoir sampling, so that only the sample and one
+    chunk are ever held in memory.
+
+    Parameters
+    ----------
+    filenames : Path or list of Path
+        CSV file, or list of CSV files.
+    size : int
+        number of rows to sample (all the rows if there are fewer).
+    chunk_size : int
+        number of rows read at a time.
+    dtype : numpy dtype
+        precision of the sample.
+    rng : numpy.random.Generator
+        source of randomness, so the sample can be reproduced.
+
+    Returns
+    -------
+    sample : numpy array
+        (m, d) array of the m = min(size, rows) sampled rows.
+
+    """
+    sample, seen = None, 0
+    for chunk in read_chunks(filenames, chunk_size, dtype):
+        if sample is None:
+            sample = np.empty((size, chunk.shape[1]), dtype=dtype)
+        # The first rows fill the reservoir...
+        fill = min(max(size - seen, 0), chunk.shape[0])
+        sample[seen:seen + fill] = chunk[:fill]
+        # ...and each following row t replaces a random one with
+        # probability size / (t + 1), later rows last as in a serial pass.
+        slots = rng.integers(0, np.arange(seen + fill, seen + chunk.shape[0]) + 1)
+        replace = slots < size
+        sample[slots[replace]] = chunk[fill:][replace]
+        seen += chunk.shape[0]
+    if sample is None:
+        return np.empty((0, 0), dtype=dtype)
+    return sample[:min(size, seen)]
+
+
+@profiling.instrument('kmeans[minibatch]')
+def minibatch_fit(filenames, cluster_num: int, epochs: int,
+                  batch_size: int = 10000, dtype=np.float64, seed=None):
+    """
+    Mini-batch k-means over data streamed from CSV files.
+
+    Each batch is allocated to the nearest centres and every centre is moved
+    towards the mean of its new points with a learning rate of one over the
+    number of points it has seen so far. Memory use is bounded by the batch
+    size, whatever the size of the files.
+
+    The initial centres are chosen with k-means++ from a reservoir sample of
+    `batch_size` rows drawn uniformly from all the files, in a first
+    streaming pass, so that they do not depend on the order of the rows
+    (the first batch of a file sorted by date or location can hold only
+    some of the clusters).
+
+    Parameters
+    ----------
+    filenames : Path or list of Path
+        CSV file, or list of CSV files.
+    cluster_num : int
+        number of clusters you want to form
+    epochs : int
+        number of passes over the whole data.
+    batch_size : int, optional
+        number of rows in each mini-batch.
+    dtype : numpy dtype, optional
+        precision used for the points.
+    seed : int, optional
+        seed for the starting centres, to make the result reproducible.
+
+    Returns
+    -------
+    centres : numpy array
+        (k, d) array of the fitted centres.
+
+    """
+    rng = np.random.default_rng(seed)
+    sample = reservoir_sample(filenames, batch_size, batch_size, dtype, rng)
+    if sample.shape[0] == 0:
+        raise ValueError("No points to cluster.")
+    if sample.shape[0] < cluster_num:
+        raise ValueError("There are fewer points than clusters.")
+    centres = kmeans_plusplus(sample, cluster_num, rng).astype(np.float64)
+    del sample
+
+    seen = np.zeros(cluster_num)
+    for _ in range(epochs):
+        for batch in read_chunks(filenames, batch_size, dtype):
+            alloc = nearest_centre(batch, centres.astype(batch.dtype))
+            sums, counts = cluster_sums(batch, alloc, cluster_num)
+            seen += counts
+            moved = counts > 0
+            centres[moved] += (sums[moved] - counts[moved, None] * centres[moved]) \
+                / seen[moved, None]
+
+    return centres.astype(dtype)
+
+
+def write_labels(filenames, centres, labels_file: Union[Path, str],
+                 batch_size: int = 10000):
+    """
+    Streams the CSV files once more, writing the cluster index of every row
+    to `labels_file`, one per line and in the order of the input rows.
+
+    Returns
+    -------
+    counts : numpy array
+        number of points in each cluster.
+
+    """
+    counts = np.zeros(centres.shape[0], dtype=np.int64)
+    with open(labels_file, 'w') as out:
+        for batch in read_chunks(filenames, batch_size, centres.dtype):
+            alloc = nearest_centre(batch, centres)
+            counts += np.bincount(alloc, minlength=centres.shape[0])
+            np.savetxt(out, alloc, fmt='%d')
+    return counts
+
+
+def cluster_minibatch(filenames: Union[Path, str, List[Union[Path, str]]],
+                      cluster_num: int, iters: int, batch_size: int = 10000,
+                      labels_file: Union[Path, str, None] = None, seed=None,
+                      verbose: bool = True):
+    """
+    Clusters data too large to fit in memory, streaming one or more CSV files
+    in batches with mini-batch k-means.
+
+    Parameters
+    ----------
+    filenames : Path or list of Path
+        CSV file, or list of CSV files, that you wish to read into the algorithm
+    cluster_num : int
+        number of clusters you want to form
+    iters : int
+        number of passes over the data
+    batch_size : int, optional
+        number of rows held in memory at once
+    labels_file : Path, optional
+        when given, the cluster of every row is written to this file, one per
+        line, in a final streaming pass.
+    seed : int, optional
+        seed for the starting centres, to make the result reproducible.
+    verbose : bool, optional
+        whether to print a summary of the clusters. The default is True.
+
+    Returns
+    -------
+    centres : numpy array
+        (k, d) array of the fitted centres.
+
+    """
+    centres = minibatch_fit(filenames, cluster_num, iters, batch_size,
+                            seed=seed)
+
+    counts = None
+    if labels_file is not None:
+        counts = write_labels(filenames, centres, labels_file, batch_size)
+
+    if verbose:
+        for i in range(cluster_num):
+            if counts is not None:
+                print("Cluster " + str(i) + " is centred at " +
+                      str(centres[i]) + " and has " + str(counts[i]) + " points.")
+            else:
+                print("Cluster " + str(i) + " is centred at " + str(centres[i]))
+
+    return centres
+
+
+def process():
+    """
+    function to create command line interface
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    -------
+    None
+
+    """
+    parser = ArgumentParser(
+        description='Cluster points streamed from csv files into 3 classes')
+    parser.add_argument('filename', type=str, nargs='+',
+                        help='Please give file paths to your csv files')
+    parser.add_argument('--iters', default=3, type=int,
+                        help='Please give number of passes over the data')
+    parser.add_argument('--batch-size', default=10000, type=int,
+                        help='Please give number of rows held in memory')
+    parser.add_argument('--labels', default=None, type=str,
+                        help='File to write the cluster of every row to')
+    arguments = parser.parse_args()
+
+    cluster_minibatch(arguments.filename, 3, arguments.iters,
+                      arguments.batch_size, arguments.labels)
+
+
+if __name__ == "__main__":
+    process()
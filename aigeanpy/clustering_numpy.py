@@ -1,18 +1,320 @@
 from math import *
 from random import *
+import os
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 from typing import Union
 from pathlib import Path
 from aigeanpy.utilis import read_csv
+from aigeanpy import profiling
 from argparse import ArgumentParser
 
 
-def cluster_num(filename: Union[Path, str], cluster_num: int, iters: int):
+def squared_distances(points, centres, points_sq=None):
     """
-    Picks three points randomly to be the initial centres of the clusters, assigns each data
+    Squared euclidean distance between every point and every centre, computed
+    as a single matrix expression ||x||^2 - 2 x.c^T + ||c||^2.
+
+    Parameters
+    ----------
+    points : numpy array
+        (n, d) array of points.
+    centres : numpy array
+        (k, d) array of cluster centres.
+    points_sq : numpy array, optional
+        Precomputed squared norms of the points, so they are not recomputed
+        on every iteration.
+
+    Returns
+    -------
+    distance : numpy array
+        (n, k) array of squared distances.
+
+    Example
+    -------
+    >>> squared_distances(np.array([[0., 0.], [3., 4.]]), np.array([[0., 0.]]))
+    array([[ 0.],
+           [25.]])
+
+    """
+    if points_sq is None:
+        points_sq = np.einsum('ij,ij->i', points, points)
+    centres_sq = np.einsum('ij,ij->i', centres, centres)
+    distance = points @ centres.T
+    distance *= -2
+    distance += points_sq[:, None]
+    distance += centres_sq[None, :]
+    # Cancellation can leave tiny negative values for points on a centre.
+    np.maximum(distance, 0, out=distance)
+    return distance
+
+
+def nearest_centre(points, centres, chunk_size: int = 16384):
+    """
+    Index of the nearest centre to every point.
+
+    Only -2 x.c^T + ||c||^2 is needed to find the nearest centre, since
+    ||x||^2 is the same for every centre. The points are processed in chunks
+    so the intermediate array stays in cache.
+
+    Example
+    -------
+    >>> nearest_centre(np.array([[0., 0.], [3., 4.]]), np.array([[0., 1.], [3., 3.]]))
+    array([0, 1])
+
+    """
+    alloc = np.empty(points.shape[0], dtype=np.intp)
+    centres_t = -2 * centres.T
+    centres_sq = np.einsum('ij,ij->i', centres, centres)
+    for i in range(0, points.shape[0], chunk_size):
+        score = points[i:i + chunk_size] @ centres_t
+        score += centres_sq
+        alloc[i:i + chunk_size] = np.argmin(score, axis=1)
+    return alloc
+
+
+def cluster_sums(points, alloc, cluster_num):
+    """
+    Per-cluster coordinate sums and point counts, in a single pass over the
+    points for each dimension.
+
+    Sums are accumulated in float64 whatever the precision of the points.
+    """
+    counts = np.bincount(alloc, minlength=cluster_num)
+    sums = np.empty((cluster_num, points.shape[1]), dtype=np.float64)
+    for dim in range(points.shape[1]):
+        sums[:, dim] = np.bincount(alloc, weights=points[:, dim],
+                                   minlength=cluster_num)
+    return sums, counts
+
+
+def update_centres(points, alloc, centres):
+    """
+    Moves each centre to the mean of the points allocated to it.
+
+    A centre that has lost all its points is moved onto the point that is
+    furthest from its own centre, so no cluster is left empty.
+
+    Parameters
+    ----------
+    points : numpy array
+        (n, d) array of points.
+    alloc : numpy array
+        Index of the cluster each point is allocated to.
+    centres : numpy array
+        (k, d) array of the current centres.
+
+    Returns
+    -------
+    new_centres : numpy array
+        (k, d) array of updated centres, with the dtype of `centres`.
+
+    """
+    cluster_num = centres.shape[0]
+    sums, counts = cluster_sums(points, alloc, cluster_num)
+    new_centres = centres.copy()
+    filled = counts > 0
+    new_centres[filled] = sums[filled] / counts[filled, None]
+
+    empty = np.flatnonzero(~filled)
+    if len(empty):
+        min_distance = np.einsum('ij,ij->i', points - centres[alloc],
+                                 points - centres[alloc])
+        furthest = np.argsort(min_distance)[::-1][:len(empty)]
+        new_centres[empty] = points[furthest]
+    return new_centres
+
+
+def lloyd(points, centres, iters: int, tol: float = 1e-4):
+    """
+    Runs Lloyd's k-means iterations from the given starting centres.
+
+    Iteration stops after `iters` iterations, or earlier once the centres move
+    by less than `tol` (relative to the mean variance of the data), or the
+    allocation stops changing.
+
+    Parameters
+    ----------
+    points : numpy array
+        (n, d) array of points, float32 or float64.
+    centres : numpy array
+        (k, d) array of starting centres.
+    iters : int
+        maximum number of iterations.
+    tol : float, optional
+        relative tolerance on the squared movement of the centres.
+
+    Returns
+    -------
+    centres : numpy array
+        the final centres.
+    alloc : numpy array
+        index of the cluster each point is allocated to.
+    n_iter : int
+        number of iterations performed.
+
+    """
+    dtype = points.dtype if points.dtype == np.float32 else np.float64
+    points = np.asarray(points, dtype=dtype)
+    centres = np.array(centres, dtype=dtype)
+    threshold = tol * np.mean(np.var(points, axis=0))
+
+    alloc = None
+    n_iter = 0
+    for n_iter in range(1, iters + 1):
+        new_alloc = nearest_centre(points, centres)
+        if alloc is not None and np.array_equal(alloc, new_alloc):
+            break
+        alloc = new_alloc
+
+        new_centres = update_centres(points, alloc, centres)
+        shift = np.sum((new_centres - centres)**2)
+        centres = new_centres
+        if shift <= threshold:
+            break
+
+    if alloc is None:
+        alloc = nearest_centre(points, centres)
+
+    return centres, alloc, n_iter
+
+
+def kmeans_plusplus(points, cluster_num: int, rng):
+    """
+    Chooses starting centres with k-means++: the first centre is a random
+    point, and each following one is a point picked with probability
+    proportional to its squared distance from the nearest centre so far.
+
+    Parameters
+    ----------
+    points : numpy array
+        (n, d) array of points.
+    cluster_num : int
+        number of centres to choose.
+    rng : numpy.random.Generator
+        source of randomness, so the seeding can be reproduced.
+
+    Returns
+    -------
+    centres : numpy array
+        (k, d) array of starting centres.
+
+    """
+    n_points = points.shape[0]
+    centres = np.empty((cluster_num, points.shape[1]), dtype=points.dtype)
+    centres[0] = points[rng.integers(n_points)]
+    min_distance = squared_distances(points, centres[:1])[:, 0]
+    for i in range(1, cluster_num):
+        total = min_distance.sum()
+        if total > 0:
+            index = np.searchsorted(np.cumsum(min_distance),
+                                    rng.random() * total, side='right')
+            index = min(index, n_points - 1)
+        else:
+            index = rng.integers(n_points)
+        centres[i] = points[index]
+        np.minimum(min_distance, squared_distances(points, centres[i:i + 1])[:, 0],
+                   out=min_distance)
+    return centres
+
+
+def inertia(points, centres, alloc):
+    """
+    Sum of squared distances from every point to its allocated centre.
+    """
+    difference = points - centres[alloc]
+    return float(np.einsum('ij,ij->', difference, difference))
+
+
+def single_run(points, cluster_num: int, iters: int, tol: float = 1e-4,
+               init: str = 'k-means++', seed=None, kernel=None):
+    """
+    One k-means run: seeds the centres, then runs Lloyd's iterations.
+
+    Parameters
+    ----------
+    points : numpy array
+        (n, d) array of points.
+    cluster_num : int
+        number of clusters you want to form
+    iters : int
+        maximum number of iterations
+    tol : float, optional
+        relative tolerance on the movement of the centres.
+    init : str, optional
+        'k-means++' (default) or 'random' for a uniform sample of the points.
+    seed : int or numpy.random.SeedSequence, optional
+        seed of the random generator used to choose the starting centres.
+    kernel : function, optional
+        the iteration kernel, taking (points, centres, iters, tol) and
+        returning (centres, alloc, n_iter). The default is lloyd.
+
+    Returns
+    -------
+    centres, alloc, n_iter, inertia
+        final centres, cluster of every point, number of iterations performed
+        and the sum of squared distances to the centres.
+
+    """
+    rng = np.random.default_rng(seed)
+    if init == 'k-means++':
+        centres = kmeans_plusplus(points, cluster_num, rng)
+    elif init == 'random':
+        centres = points[rng.choice(points.shape[0], cluster_num, replace=False)]
+    else:
+        raise ValueError("init must be 'k-means++' or 'random'.")
+
+    kernel = kernel or lloyd
+    centres, alloc, n_iter = kernel(points, centres, iters, tol)
+    return centres, alloc, n_iter, inertia(points, centres, alloc)
+
+
+@profiling.instrument('kmeans[numpy]',
+                      sizes=lambda run, points, *args, **kwargs: {
+                          'points': points.shape[0], 'bytes': points.nbytes})
+def best_run(points, cluster_num: int, iters: int, tol: float = 1e-4,
+             init: str = 'k-means++', n_init: int = 1, seed=None,
+             workers: int = None, kernel=None):
+    """
+    Runs `n_init` independent k-means runs and keeps the one with the lowest
+    inertia.
+
+    The seeds of the runs are spawned from `seed`, so the result is
+    reproducible whatever the number of workers. When there is more than one
+    run they are spread over a pool of `workers` processes (by default one per
+    core).
+
+    Returns
+    -------
+    centres, alloc, n_iter, inertia
+        the run with the lowest inertia, as returned by single_run.
+
+    """
+    seeds = np.random.SeedSequence(seed).spawn(n_init)
+    if n_init == 1 or workers == 1:
+        runs = [single_run(points, cluster_num, iters, tol, init, run_seed,
+                           kernel) for run_seed in seeds]
+    else:
+        workers = min(n_init, workers or os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(single_run, points, cluster_num, iters,
+                                   tol, init, run_seed, kernel)
+                       for run_seed in seeds]
+            runs = [future.result() for future in futures]
+
+    return min(runs, key=lambda run: run[3])
+
+
+def cluster_num(filename: Union[Path, str], cluster_num: int, iters: int,
+                tol: float = 1e-4, dtype=np.float64, init: str = 'k-means++',
+                n_init: int = 1, seed=None, kernel=None, verbose: bool = True):
+    """
+    Picks starting centres for the clusters (with k-means++ by default), assigns each data
     point to a cluster and updates the centre of each cluster by setting it to the average
     of all points assigned to the cluster, using numpy. 
 
+    The points may have any number of columns.
+
     Parameters
     ----------
     filename : Path
@@ -20,7 +322,24 @@ def cluster_num(filename: Union[Path, str], cluster_num: int, iters: int):
     clusters : int
         number of clusters you want to form
     iterations: int
-        number of iterations for the code to perform
+        maximum number of iterations for the code to perform
+    tol : float, optional
+        stop early once the centres move less than this (relative to the
+        variance of the data).
+    dtype : numpy dtype, optional
+        precision used for the points, float64 (default) or float32.
+    init : str, optional
+        'k-means++' (default) or 'random' starting centres.
+    n_init : int, optional
+        number of independent runs, made in parallel processes; the run with
+        the lowest inertia is kept.
+    seed : int, optional
+        seed for the starting centres, to make the result reproducible.
+    kernel : function, optional
+        the iteration kernel, lloyd by default (see clustering_hamerly for an
+        accelerated one).
+    verbose : bool, optional
+        whether to print a summary of the clusters. The default is True.
 
     Returns
     -------
@@ -28,30 +347,20 @@ def cluster_num(filename: Union[Path, str], cluster_num: int, iters: int):
         list of points where the point is in the cluster. 
 
     """
-    points = np.genfromtxt(filename, delimiter=",", dtype='float')
-    random_index = np.arange(points.shape[0])
-    np.random.shuffle(random_index)
-    centres = points[random_index[0:cluster_num]]
-
-    for j in range(iters):
-
-        distance = np.zeros([points.shape[0], cluster_num])
-        for i in range(cluster_num):
-            distance[:, i] = ((points[:, 0]-centres[i, 0])**2 + (points[:, 1] -
-                              centres[i, 1])**2 + (points[:, 2]-centres[i, 2])**2)**0.5
-
-        alloc = np.argmin(distance, axis=1)
+    points = np.loadtxt(filename, delimiter=",", dtype=dtype, ndmin=2)
 
-        for i in range(cluster_num):
-            centres[i] = np.sum(points[np.argwhere(alloc == i)],
-                                axis=0)/len(np.argwhere(alloc == i))
+    centres, alloc, n_iter, total = best_run(points, cluster_num, iters, tol,
+                                             init, n_init, seed, kernel=kernel)
 
     class_indice = []
     for i in range(cluster_num):
-        alloc_index = np.argwhere(alloc == i).flatten().tolist()
-        class_indice.append(alloc_index.copy())
-        print("Cluster " + str(i) + " is centred at " +
-              str(centres[i]) + " and has " + str(len(alloc_index)) + " points.")
+        alloc_index = np.flatnonzero(alloc == i).tolist()
+        class_indice.append(alloc_index)
+        if verbose:
+            print("Cluster " + str(i) + " is centred at " +
+                  str(centres[i]) + " and has " + str(len(alloc_index)) + " points.")
+    if verbose:
+        print("Inertia " + str(total) + " after " + str(n_iter) + " iterations.")
 
     return class_indice
 
@@ -75,9 +384,14 @@ def process():
                         help='Please give file path to your csv file')
     parser.add_argument('--iters', default=10, type=int,
                         help='Please give number of iterations')
+    parser.add_argument('--n-init', default=1, type=int,
+                        help='Please give number of independent runs')
+    parser.add_argument('--seed', default=None, type=int,
+                        help='Please give seed for the starting centres')
     arguments = parser.parse_args()
 
-    cluster_num(arguments.filename, 3, arguments.iters)
+    cluster_num(arguments.filename, 3, arguments.iters,
+                n_init=arguments.n_init, seed=arguments.seed)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,137 @@
+import os
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+from aigeanpy.clustering_numpy import nearest_centre, cluster_sums
+
+# Arrays attached to the shared memory blocks in each worker process.
+_worker = {}
+
+
+def _init_worker(points_name, alloc_name, shape, dtype):
+    # Workers share the resource tracker of the parent, which unlinks the
+    # blocks, so attaching here does not register them a second time.
+    points_block = shared_memory.SharedMemory(name=points_name)
+    alloc_block = shared_memory.SharedMemory(name=alloc_name)
+    _worker['blocks'] = (points_block, alloc_block)
+    _worker['points'] = np.ndarray(shape, dtype=dtype, buffer=points_block.buf)
+    _worker['alloc'] = np.ndarray(shape[0], dtype=np.intp, buffer=alloc_block.buf)
+
+
+def _assign_range(args):
+    """
+    Allocates the points in [start, stop) to their nearest centres, writing
+    the allocation into shared memory, and returns only the per-cluster sums
+    and counts and how many points changed cluster.
+    """
+    start, stop, centres = args
+    points = _worker['points'][start:stop]
+    alloc = _worker['alloc'][start:stop]
+    new_alloc = nearest_centre(points, centres)
+    changed = int(np.count_nonzero(new_alloc != alloc))
+    alloc[:] = new_alloc
+    sums, counts = cluster_sums(points, new_alloc, centres.shape[0])
+    return sums, counts, changed
+
+
+def parallel_lloyd(points, centres, iters: int, tol: float = 1e-4,
+                   workers: int = None):
+    """
+    Lloyd's k-means iterations with the assignment step spread over worker
+    processes.
+
+    The points are copied once into a `multiprocessing.shared_memory` block
+    that every worker maps, together with a shared array for the allocation.
+    At each iteration the workers receive the centres, allocate their share of
+    the points and send back only per-cluster sums and counts, from which the
+    new centres are computed. The stopping rule and the handling of empty
+    clusters are those of clustering_numpy.lloyd.
+
+    Parameters
+    ----------
+    points : numpy array
+        (n, d) array of points, float32 or float64.
+    centres : numpy array
+        (k, d) array of starting centres.
+    iters : int
+        maximum number of iterations.
+    tol : float, optional
+        relative tolerance on the squared movement of the centres.
+    workers : int, optional
+        number of worker processes; one per core by default.
+
+    Returns
+    -------
+    centres : numpy array
+        the final centres.
+    alloc : numpy array
+        index of the cluster each point is allocated to.
+    n_iter : int
+        number of iterations performed.
+
+    """
+    dtype = points.dtype if points.dtype == np.float32 else np.float64
+    points = np.asarray(points, dtype=dtype)
+    centres = np.array(centres, dtype=dtype)
+    n_points, cluster_num = points.shape[0], centres.shape[0]
+    workers = max(1, min(workers or os.cpu_count() or 1, n_points))
+    threshold = tol * np.mean(np.var(points, axis=0))
+
+    bounds = np.linspace(0, n_points, workers + 1).astype(int)
+    ranges = list(zip(bounds[:-1], bounds[1:]))
+
+    points_block = shared_memory.SharedMemory(create=True,
+                                              size=max(points.nbytes, 1))
+    alloc_block = shared_memory.SharedMemory(
+        create=True, size=max(n_points * np.dtype(np.intp).itemsize, 1))
+    shared_points = shared_alloc = None
+    try:
+        shared_points = np.ndarray(points.shape, dtype=dtype,
+                                   buffer=points_block.buf)
+        shared_points[:] = points
+        shared_alloc = np.ndarray(n_points, dtype=np.intp,
+                                  buffer=alloc_block.buf)
+        shared_alloc[:] = -1
+
+        with multiprocessing.Pool(workers, _init_worker,
+                                  (points_block.name, alloc_block.name,
+                                   points.shape, dtype)) as pool:
+            n_iter = 0
+            for n_iter in range(1, iters + 1):
+                partials = pool.map(_assign_range,
+                                    [(start, stop, centres) for start, stop in ranges])
+                changed = sum(partial[2] for partial in partials)
+                if n_iter > 1 and changed == 0:
+                    break
+
+                sums = sum(partial[0] for partial in partials)
+                counts = sum(partial[1] for partial in partials)
+                new_centres = centres.copy()
+                filled = counts > 0
+                new_centres[filled] = sums[filled] / counts[filled, None]
+                empty = np.flatnonzero(~filled)
+                if len(empty):
+                    difference = shared_points - centres[shared_alloc]
+                    min_distance = np.einsum('ij,ij->i', difference, difference)
+                    furthest = np.argsort(min_distance)[::-1][:len(empty)]
+                    new_centres[empty] = shared_points[furthest]
+
+                shift = np.sum((new_centres - centres)**2)
+                centres = new_centres
+                if shift <= threshold:
+                    break
+
+            if n_iter == 0:
+                pool.map(_assign_range,
+                         [(start, stop, centres) for start, stop in ranges])
+
+        alloc = shared_alloc.copy()
+    finally:
+        # The views must be released before the blocks can be closed.
+        shared_points = shared_alloc = None
+        points_block.close()
+        points_block.unlink()
+        alloc_block.close()
+        alloc_block.unlink()
+
+    return centres, alloc, n_iter
@@ -0,0 +1,154 @@
+"""
+The policy setting the types of the data of SatMaps.
+
+working : the floating point type SatMap arithmetic, mosaics and rescaling
+    compute in, and maps are read from files as. By default (None) the
+    maps keep the type of their data, only integers being promoted to
+    float64 where a float is needed. 'float32' halves the memory and
+    bandwidth of large mosaics at a precision (7 digits) well beyond that
+    of the depth measurements.
+storage : the type the results of SatMap arithmetic and mosaics are stored
+    in. None keeps the working type; an unsigned integer type ('uint16' or
+    'uint8') stores them scaled (see `pack`). The functions of the package
+    reading maps unpack them; other code should read the data of maps that
+    may be packed with `values(satmap)` rather than `satmap.data`.
+
+The policy is set for the process with `set_policy`, for a block of code
+with the `policy` context manager, or from the AIGEANPY_WORKING_DTYPE and
+AIGEANPY_STORAGE_DTYPE environment variables.
+"""
+import os
+import contextlib
+import numpy as np
+
+# Metadata of a packed SatMap: the value of a stored integer i is
+# add_offset + i * scale_factor, and fill_value stands for NaN.
+PACKING_KEYS = ('scale_factor', 'add_offset', 'fill_value')
+
+_policy = {'working': os.environ.get('AIGEANPY_WORKING_DTYPE') or None,
+           'storage': os.environ.get('AIGEANPY_STORAGE_DTYPE') or None}
+
+
+def _check(working, storage):
+    if working is not None and not np.issubdtype(np.dtype(working), np.floating):
+        raise ValueError("The working type must be a floating point type.")
+    if storage is not None and not np.issubdtype(np.dtype(storage), np.unsignedinteger):
+        raise ValueError("The storage type must be an unsigned integer type.")
+
+
+def set_policy(working=None, storage=None):
+    """
+    Sets the working and storage types (None for the defaults).
+    """
+    _check(working, storage)
+    _policy['working'] = working
+    _policy['storage'] = storage
+
+
+def get_policy():
+    """
+    The current policy, as a dict of its 'working' and 'storage' types.
+    """
+    return dict(_policy)
+
+
+@contextlib.contextmanager
+def policy(working=None, storage=None):
+    """
+    Context in which the working and storage types are those given.
+    """
+    previous = get_policy()
+    set_policy(working, storage)
+    try:
+        yield
+    finally:
+        _policy.update(previous)
+
+
+def working_dtype(*dtypes, floating: bool = True):
+    """
+    The type to compute in on data of the types given: that of the policy
+    if set, otherwise their common type, promoted to float64 if `floating`
+    and it is not a float.
+    """
+    if _policy['working'] is not None:
+        return np.dtype(_policy['working'])
+    dtype = np.result_type(*dtypes)
+    if floating and not np.issubdtype(dtype, np.floating):
+        return np.dtype(np.float64)
+    return dtype
+
+
+def is_packed(meta: dict):
+    return 'scale_factor' in meta
+
+
+def pack(data, dtype='uint16'):
+    """
+    Stores data as scaled unsigned integers.
+
+    The range of the data is spread over the integers but the largest, which
+    stands for NaN; a uint16 so keeps 1/65534 of the range, about a
+    centimeter for the depths of the Aigean instruments.
+
+    Returns
+    -------
+    packed : numpy array
+    meta : dict
+        the 'scale_factor', 'add_offset' and 'fill_value' to unpack it.
+    """
+    dtype = np.dtype(dtype)
+    _check(None, dtype)
+    fill = np.iinfo(dtype).max
+    valid = np.isfinite(data)
+    if valid.all():
+        offset, top = float(np.min(data)), float(np.max(data))
+    elif valid.any():
+        offset = float(np.min(data, where=valid, initial=np.inf))
+        top = float(np.max(data, where=valid, initial=-np.inf))
+    else:
+        offset = top = 0.0
+    scale = (top - offset) / (fill - 1) if top > offset else 1.0
+    packed = np.empty(np.shape(data), dtype=dtype)
+    with np.errstate(invalid='ignore'):
+        np.rint((np.asarray(data) - offset) / scale, out=packed, casting='unsafe')
+    packed[~valid] = fill
+    return packed, {'scale_factor': scale, 'add_offset': offset, 'fill_value': int(fill)}
+
+
+def unpack(packed, meta: dict, dtype=None):
+    """
+    The values of packed data (see `pack`), in the working type by default.
+    """
+    dtype = dtype or working_dtype(np.float64)
+    result = np.multiply(packed, meta['scale_factor'], dtype=dtype)
+    result += np.asarray(meta['add_offset'], dtype=dtype)
+    result[packed == meta['fill_value']] = np.nan
+    return result
+
+
+def values(satmap, dtype=None):
+    """
+    The data of a SatMap, unpacked if it is packed, and cast to `dtype` if
+    given (without copying when it already has that type).
+    """
+    if is_packed(satmap.meta):
+        return unpack(satmap.data, satmap.meta, dtype)
+    if dtype is None:
+        return satmap.data
+    return satmap.data.astype(dtype, copy=False)
+
+
+def stored(data):
+    """
+    Data converted for storage by the policy.
+
+    Returns
+    -------
+    data : numpy array
+    meta : dict
+        the packing metadata if the data was packed, else empty.
+    """
+    if _policy['storage'] is None:
+        return data, {}
+    return pack(data, _policy['storage'])
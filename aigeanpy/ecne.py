@@ -0,0 +1,337 @@
+"""
+Tables of the measurements of the Ecne radar.
+
+Ecne files are CSVs with one row per measured point: its turbulence,
+salinity and algal density, optionally preceded by its x and y coordinates
+(in meters), or with a header line naming the columns. An EcneTable keeps
+each quantity in one contiguous numpy array (a column) for any number of
+files, with the date and time of each row's file, so that filtering,
+grouping and spatial queries over years of measurements run at numpy
+speed.
+"""
+import re
+from pathlib import Path
+from typing import List, Union
+import numpy as np
+from aigeanpy import profiling
+
+MEASUREMENTS = ('turbulence', 'salinity', 'algal_density')
+LOCATION = ('x', 'y')
+
+_TIMESTAMP = re.compile(r'_(\d{4})(\d{2})(\d{2})_(\d{2})(\d{2})(\d{2})')
+# Keys derived from the date column by `group`.
+_DATE_PARTS = {'year': 'datetime64[Y]', 'month': 'datetime64[M]',
+               'day': 'datetime64[D]'}
+
+
+def _file_date(filename):
+    """
+    Date and time of an archive file, from its name (NaT if it has none).
+    """
+    match = _TIMESTAMP.search(Path(filename).name)
+    if match is None:
+        return np.datetime64('NaT', 's')
+    year, month, day, hour, minute, second = match.groups()
+    return np.datetime64(f'{year}-{month}-{day}T{hour}:{minute}:{second}', 's')
+
+
+def _read_csv(filename):
+    """
+    Names and values of the columns of an Ecne CSV file.
+    """
+    with open(filename) as f:
+        first = f.readline()
+        try:
+            # Rows of numbers, including 1e-3, nan or inf, are data.
+            [float(value) for value in first.split(',')]
+            header = False
+        except ValueError:
+            header = True
+        if header:
+            names = [name.strip().lower().replace(' ', '_') for name in first.split(',')]
+        else:
+            f.seek(0)
+        values = np.loadtxt(f, delimiter=',', ndmin=2)
+    if not header:
+        if values.shape[1] == len(MEASUREMENTS):
+            names = list(MEASUREMENTS)
+        elif values.shape[1] == len(LOCATION + MEASUREMENTS):
+            names = list(LOCATION + MEASUREMENTS)
+        else:
+            raise ValueError(f"{filename}: Ecne files without a header have "
+                             "3 columns (or 5, with x and y).")
+    if values.shape[1] != len(names) and values.size:
+        raise ValueError(f"{filename}: the header names {len(names)} columns, "
+                         f"the rows have {values.shape[1]}.")
+    return names, values
+
+
+class EcneTable(object):
+    """
+    Columns of Ecne measurements, one numpy array per quantity.
+
+    Columns are read with `table['salinity']`, and rows selected with a
+    boolean mask or indices, `table[table['salinity'] > 35]`, which gives a
+    new table. Tables with x and y columns can be queried by location:
+    each distinct location is a station, indexed with a KD-tree.
+
+    Parameters
+    ----------
+    columns : dict
+        arrays of the same length, keyed by column name.
+    """
+
+    def __init__(self, columns: dict):
+        lengths = {len(values) for values in columns.values()}
+        if len(lengths) > 1:
+            raise ValueError("The columns of a table must have the same length.")
+        self.columns = {name: np.ascontiguousarray(values)
+                        for name, values in columns.items()}
+        self._stations = None
+        self._tree = None
+
+    def __len__(self):
+        return len(next(iter(self.columns.values()))) if self.columns else 0
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self.columns[key]
+        return EcneTable({name: values[key] for name, values in self.columns.items()})
+
+    def __repr__(self):
+        return f"<EcneTable: {len(self)} rows of {', '.join(self.columns)}>"
+
+    @property
+    def names(self):
+        return list(self.columns)
+
+    def filter(self, **ranges):
+        """
+        The rows whose columns lie in the given ranges.
+
+        Each keyword names a column (or 'year', 'month' or 'day' of the date)
+        and gives a (low, high) range, both ends included and either one
+        None for no bound, or a single value the column must equal. Dates
+        can be given as strings.
+
+        Example
+        -------
+        >>> table = EcneTable({'salinity': np.array([30., 35., 40.]), 'turbulence': np.array([1., 2., 3.])})
+        >>> table.filter(salinity=(32, None), turbulence=(None, 2))['salinity']
+        array([35.])
+
+        """
+        keep = np.ones(len(self), dtype=bool)
+        for name, bounds in ranges.items():
+            values = self._key(name)
+            if not isinstance(bounds, tuple):
+                keep &= values == self._like(values, bounds)
+                continue
+            low, high = bounds
+            if low is not None:
+                keep &= values >= self._like(values, low)
+            if high is not None:
+                keep &= values <= self._like(values, high)
+        return self[keep]
+
+    @staticmethod
+    def _like(values, bound):
+        if np.issubdtype(values.dtype, np.datetime64):
+            return np.datetime64(bound)
+        return bound
+
+    def _key(self, name):
+        """
+        A column, or the year, month or day of the dates, or the station.
+        """
+        if name in self.columns:
+            return self.columns[name]
+        if name in _DATE_PARTS and 'date' in self.columns:
+            return self.columns['date'].astype(_DATE_PARTS[name])
+        if name == 'station':
+            return self.station_ids
+        raise KeyError(f"No column '{name}' in the table.")
+
+    def group(self, by, column: str, statistic: str = 'mean'):
+        """
+        A statistic of a column for each value of a key, or of a combination
+        of keys, computed in one pass over the sorted column.
+
+        Parameters
+        ----------
+        by : str or tuple of str
+            the column(s) grouped by; 'year', 'month' and 'day' group by
+            the date, and 'station' by location.
+        column : str
+            the column summarised.
+        statistic : str, optional
+            'count', 'sum', 'mean', 'std', 'min' or 'max'.
+
+        Returns
+        -------
+        keys : numpy array, or tuple of arrays for several keys
+            the distinct values of the key(s), sorted.
+        values : numpy array
+            the statistic for each of them.
+
+        Example
+        -------
+        >>> table = EcneTable({'day': np.array([2, 1, 2, 1]), 'salinity': np.array([30., 32., 34., 36.])})
+        >>> table.group('day', 'salinity')
+        (array([1, 2]), array([34., 32.]))
+
+        """
+        names = (by,) if isinstance(by, str) else tuple(by)
+        uniques, codes = [], np.zeros(len(self), dtype=np.int64)
+        for name in names:
+            unique, inverse = np.unique(self._key(name), return_inverse=True)
+            uniques.append(unique)
+            codes = codes * len(unique) + inverse.ravel()
+        groups, inverse = np.unique(codes, return_inverse=True)
+        inverse = inverse.ravel()
+
+        order = np.argsort(inverse, kind='stable')
+        values = self.columns[column][order]
+        starts = np.searchsorted(inverse[order], np.arange(len(groups)))
+        counts = np.diff(np.append(starts, len(values)))
+        if statistic == 'count':
+            result = counts
+        elif statistic in ('sum', 'mean', 'std'):
+            result = np.add.reduceat(values, starts) if len(values) else values
+            if statistic != 'sum':
+                result = result / counts
+            if statistic == 'std':
+                squares = (values - np.repeat(result, counts)) ** 2
+                result = np.sqrt(np.add.reduceat(squares, starts) / counts)
+        elif statistic in ('min', 'max'):
+            reduce = np.minimum if statistic == 'min' else np.maximum
+            result = reduce.reduceat(values, starts) if len(values) else values
+        else:
+            raise ValueError(f"Unknown statistic '{statistic}'.")
+
+        # Splits the combined codes back into the values of each key.
+        keys = []
+        for unique in reversed(uniques):
+            keys.append(unique[groups % len(unique)])
+            groups = groups // len(unique)
+        keys = keys[::-1]
+        return (keys[0] if isinstance(by, str) else tuple(keys)), result
+
+    @property
+    def stations(self):
+        """
+        The (x, y) coordinates of the distinct locations in the table, as a
+        (stations, 2) array.
+        """
+        self._locate()
+        return self._stations[0]
+
+    @property
+    def station_ids(self):
+        """
+        The station of each row, as an index of `stations`.
+        """
+        self._locate()
+        return self._stations[1]
+
+    def _locate(self):
+        if self._stations is not None:
+            return
+        if not all(name in self.columns for name in LOCATION):
+            raise ValueError("The table has no locations (x and y columns).")
+        # Coding each location by the ranks of its x and y is much faster
+        # than np.unique(axis=0), which sorts the rows as raw bytes.
+        xs, x_ids = np.unique(self.columns['x'], return_inverse=True)
+        ys, y_ids = np.unique(self.columns['y'], return_inverse=True)
+        codes, inverse = np.unique(x_ids.ravel().astype(np.int64) * len(ys) + y_ids.ravel(),
+                                   return_inverse=True)
+        stations = np.column_stack([xs[codes // len(ys)], ys[codes % len(ys)]])
+        self._stations = (stations, inverse.ravel())
+
+    def _index(self):
+        if self._tree is None:
+            from scipy.spatial import cKDTree  # slow to import, so only when used
+            self._tree = cKDTree(self.stations)
+        return self._tree
+
+    def nearest(self, points, k: int = 1):
+        """
+        The stations nearest to points.
+
+        Parameters
+        ----------
+        points : array
+            (x, y) of a point, or an (n, 2) array of points.
+        k : int, optional
+            number of stations to find for each point.
+
+        Returns
+        -------
+        distances : numpy array
+            distances to the stations, in meters.
+        stations : numpy array
+            the stations, as indices of `stations` (use `at` for their rows).
+        """
+        return self._index().query(np.asarray(points, dtype=float), k)
+
+    def within(self, point, radius: float):
+        """
+        The stations within `radius` meters of a point, as sorted indices of
+        `stations`.
+        """
+        return np.array(sorted(self._index().query_ball_point(point, radius)),
+                        dtype=np.intp)
+
+    def at(self, stations):
+        """
+        The rows measured at the given stations (indices of `stations`).
+        """
+        return self[np.isin(self.station_ids, stations)]
+
+
+@profiling.instrument('get_ecne', sizes=lambda result, *args, **kwargs:
+                      {'points': len(result)})
+def get_ecne(filenames: Union[Path, str, List[Union[Path, str]]]):
+    """
+    Reads Ecne CSV files into one EcneTable.
+
+    Each file is parsed into arrays, and the columns of all of them are
+    then concatenated, so the table is built with a single copy of the
+    data. A 'date' column holds the date and time of each row's file, taken
+    from its name.
+
+    Parameters
+    ----------
+    filenames : str or list of str
+        the CSV file, or files (e.g. a year of daily files).
+
+    Returns
+    -------
+    EcneTable
+
+    Example
+    -------
+    >>> table = get_ecne('aigeanpy/tests/test-files/aigean_ecn_20230105_135624.csv')
+    >>> table
+    <EcneTable: 300 rows of turbulence, salinity, algal_density, date>
+
+    """
+    if isinstance(filenames, (str, Path)):
+        filenames = [filenames]
+    names, parts, dates = None, [], []
+    for filename in filenames:
+        file_names, values = _read_csv(filename)
+        if names is None:
+            names = file_names
+        elif file_names != names:
+            raise ValueError(f"{filename}: its columns differ from those of "
+                             f"{filenames[0]}.")
+        parts.append(values)
+        dates.append(np.full(len(values), _file_date(filename)))
+    if names is None:
+        raise ValueError("No Ecne file was given.")
+    columns = {name: np.concatenate([values[:, i] for values in parts])
+               for i, name in enumerate(names)}
+    if 'date' not in columns:
+        columns['date'] = np.concatenate(dates)
+    return EcneTable(columns)
@@ -0,0 +1,290 @@
+"""
+Deferred arithmetic on SatMaps.
+
+Every `a + b` or `a - b` of SatMaps normally computes a new SatMap, so an
+expression like `(a + b) - (c + d)` allocates the data of each
+intermediate result. In deferred mode the operators build an expression
+graph instead, which `Expression.compute` evaluates in a single pass: the
+grid of the result is worked out once, from the metadata, and every pixel
+of every map is added into (or subtracted from) one output array, in
+place. No intermediate array is made, so the memory needed is that of the
+result whatever the depth of the expression.
+
+    with deferred():
+        expression = (a + b) - (c + d)
+    result = expression.compute()
+
+or, without changing the mode, `(defer(a) + b) - (defer(c) + d)`.
+
+The results are those of the eager operators, up to the rounding of
+floating point sums (`a - (b - c)` is summed as `a - b + c`). The graph
+only tracks the rectangles the maps cover, so a map with a validity mask
+is combined with the eager operators as soon as it is an operand: the
+other operand is computed, and the result is a map of the expression
+again.
+"""
+import contextlib
+import numpy as np
+from aigeanpy import satmap as _satmap, dtypes, masks
+from aigeanpy.satmap import (SatMap, _add, _added_meta, _subtract, _subtracted_meta,
+                             _result, _unpacked)
+
+
+class Expression(object):
+    """
+    A node of an expression graph of SatMaps: a map, or the sum or
+    difference of two expressions.
+
+    Its metadata, that of the result, is worked out (and the operands
+    checked, as the eager operators do) when the expression is built; the
+    data only by `compute`.
+    """
+
+    def __init__(self, operation: str, operands, meta: dict):
+        self.operation = operation
+        self.operands = operands
+        self.meta = meta
+
+    def __add__(self, other):
+        other = _operand(other)
+        if other is None:
+            return NotImplemented
+        if self._masked or other._masked:
+            return defer(_add(self.compute(), other.compute()))
+        return Expression('+', (self, other), _added_meta(self.meta, other.meta))
+
+    def __radd__(self, other):
+        other = _operand(other)
+        if other is None:
+            return NotImplemented
+        return other + self
+
+    def __sub__(self, other):
+        other = _operand(other)
+        if other is None:
+            return NotImplemented
+        if self._masked or other._masked:
+            return defer(_subtract(self.compute(), other.compute()))
+        return Expression('-', (self, other), _subtracted_meta(self.meta, other.meta))
+
+    def __rsub__(self, other):
+        other = _operand(other)
+        if other is None:
+            return NotImplemented
+        return other - self
+
+    def __repr__(self):
+        if self.operation == 'map':
+            return f"{self.meta['instrument']}@{self.meta['date']}"
+        return f"({self.operands[0]!r} {self.operation} {self.operands[1]!r})"
+
+    @property
+    def _masked(self):
+        """
+        Whether the expression is a map with a validity mask, which is
+        combined eagerly.
+        """
+        return self.operation == 'map' and self.operands[0].mask is not None
+
+    @property
+    def shape(self):
+        """
+        Shape of the data of the result.
+        """
+        if self.operation == 'map':
+            return self.operands[0].data.shape
+        return (int(round((self.meta['ycoords'][1] - self.meta['ycoords'][0])
+                          / self.meta['resolution'])),
+                int(round((self.meta['xcoords'][1] - self.meta['xcoords'][0])
+                          / self.meta['resolution'])))
+
+    @property
+    def dtype(self):
+        """
+        Type of the data of the result, following the dtype policy as the
+        eager operators do.
+        """
+        if self.operation == 'map':
+            if dtypes.is_packed(self.meta):
+                return dtypes.working_dtype(np.float64)
+            return self.operands[0].data.dtype
+        return dtypes.working_dtype(*[e.dtype for e in self.operands],
+                                    floating=self.operation == '+')
+
+    def compute(self, tile_rows: int = None):
+        """
+        Evaluates the expression.
+
+        Parameters
+        ----------
+        tile_rows : int, optional
+            number of rows of the result computed at a time. Computing it in
+            bands of a few hundred rows keeps the parts of the maps being
+            combined in the processor's cache. The default is the whole
+            result at once.
+
+        Returns
+        -------
+        SatMap
+
+        """
+        if self._masked:
+            return self.operands[0]
+        shape = self.shape
+        footprints, coverages = {}, {}
+        _footprints(self, self.meta, footprints)
+        out = np.zeros(shape, dtype=self.dtype)
+        tile_rows = tile_rows or max(shape[0], 1)
+        for start in range(0, shape[0], tile_rows):
+            band = (start, min(start + tile_rows, shape[0]), 0, shape[1])
+            _accumulate(self, out, band, 1, footprints, coverages)
+        mask = masks.rectangles(shape, [(slice(r0, r1), slice(c0, c1)) for r0, r1, c0, c1
+                                        in _coverage(self, footprints, coverages)])
+        return _result(_unpacked(self.meta), out, mask)
+
+
+def defer(satmap):
+    """
+    An expression of a single SatMap, whose sums and differences are
+    deferred (or, for a map with a validity mask, computed at once).
+    """
+    if isinstance(satmap, Expression):
+        return satmap
+    return Expression('map', (satmap,), satmap.meta)
+
+
+def _operand(value):
+    if isinstance(value, (SatMap, Expression)):
+        return defer(value)
+    return None
+
+
+@contextlib.contextmanager
+def deferred():
+    """
+    Context in which SatMap operators build expressions instead of
+    computing their results.
+    """
+    previous = _satmap._deferred
+    _satmap._deferred = True
+    try:
+        yield
+    finally:
+        _satmap._deferred = previous
+
+
+def _footprints(expression, grid, footprints):
+    """
+    Works out the rows and columns of the result each node of an expression
+    covers, as (first row, last row + 1, first column, last column + 1).
+    """
+    if id(expression) in footprints:
+        return
+    resolution = grid['resolution']
+    if expression.meta['resolution'] != resolution:
+        raise ValueError("Deferred expressions need maps of one resolution.")
+    rows, cols = expression.shape
+    top = int(round((grid['ycoords'][1] - expression.meta['ycoords'][1]) / resolution))
+    left = int(round((expression.meta['xcoords'][0] - grid['xcoords'][0]) / resolution))
+    footprints[id(expression)] = (top, top + rows, left, left + cols)
+    if expression.operation != 'map':
+        for operand in expression.operands:
+            _footprints(operand, grid, footprints)
+
+
+def _intersect(a, b):
+    region = (max(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), min(a[3], b[3]))
+    if region[0] >= region[1] or region[2] >= region[3]:
+        return None
+    return region
+
+
+def _outside(region, hole):
+    """
+    The (up to four) rectangles of `region` outside `hole`.
+    """
+    hole = _intersect(region, hole)
+    if hole is None:
+        return [region]
+    r0, r1, c0, c1 = region
+    h0, h1, g0, g1 = hole
+    pieces = [(r0, h0, c0, c1), (h1, r1, c0, c1), (h0, h1, c0, g0), (h0, h1, g1, c1)]
+    return [p for p in pieces if p[0] < p[1] and p[2] < p[3]]
+
+
+def _remainder(region, holes):
+    """
+    Disjoint rectangles covering the part of `region` outside all `holes`.
+    """
+    pieces = [region]
+    for hole in holes:
+        pieces = [p for piece in pieces for p in _outside(piece, hole)]
+    return pieces
+
+
+def _coverage(expression, footprints, coverages):
+    """
+    Disjoint rectangles of the result covered by the maps of an expression:
+    a sum covers both operands' rectangles, a difference their overlaps.
+
+    They are worked out once for each node, and kept in `coverages`.
+    """
+    if id(expression) in coverages:
+        return coverages[id(expression)]
+    footprint = footprints[id(expression)]
+    if expression.operation == 'map':
+        rectangles = [footprint]
+    else:
+        first, second = [_coverage(operand, footprints, coverages)
+                         for operand in expression.operands]
+        if expression.operation == '+':
+            # Both lists are disjoint already: only the parts of the first
+            # outside the second are added.
+            rectangles = second + [piece for rectangle in first
+                                   for piece in _remainder(rectangle, second)]
+        else:
+            # Overlaps of disjoint rectangles are disjoint.
+            rectangles = [_intersect(a, b) for a in first for b in second]
+        rectangles = [r for r in (_intersect(r, footprint) for r in rectangles if r) if r]
+    coverages[id(expression)] = rectangles
+    return rectangles
+
+
+def _accumulate(expression, out, region, sign, footprints, coverages):
+    """
+    Adds `sign` times the value of an expression to `out` over a region.
+
+    A difference adds its first operand and subtracts its second; in a sum,
+    the second operand covers the first where it has data (as in
+    SatMap.__add__), so the second is only added over the rectangles it
+    covers, and the first over the rest. The maps are read straight into
+    `out`, without intermediate arrays.
+    """
+    footprint = footprints[id(expression)]
+    region = _intersect(region, footprint)
+    if region is None:
+        return
+    if expression.operation == 'map':
+        r0, r1, c0, c1 = region
+        data = expression.operands[0].data[r0 - footprint[0]:r1 - footprint[0],
+                                           c0 - footprint[2]:c1 - footprint[2]]
+        if dtypes.is_packed(expression.meta):
+            data = dtypes.unpack(data, expression.meta, out.dtype)
+        target = out[r0:r1, c0:c1]
+        if sign > 0:
+            np.add(target, data, out=target)
+        else:
+            np.subtract(target, data, out=target)
+    elif expression.operation == '-':
+        first, second = expression.operands
+        _accumulate(first, out, region, sign, footprints, coverages)
+        _accumulate(second, out, region, -sign, footprints, coverages)
+    else:
+        first, second = expression.operands
+        covered = [piece for piece in (_intersect(region, rectangle) for rectangle
+                                       in _coverage(second, footprints, coverages))
+                   if piece]
+        for piece in _remainder(region, covered):
+            _accumulate(first, out, piece, sign, footprints, coverages)
+        for piece in covered:
+            _accumulate(second, out, piece, sign, footprints, coverages)
@@ -0,0 +1,105 @@
+"""
+Validity masks of SatMaps, stored as packed bitmasks.
+
+A mask has one bit per pixel, set where the pixel has data, packed eight to
+a byte along the rows with np.packbits: a (rows, ceil(cols / 8)) uint8
+array, 1/64 of the size of float64 data. A SatMap without a mask (None)
+has data at every pixel.
+"""
+import numpy as np
+
+# Number of bits set in each value of a byte (for numpy before 2.0, which
+# has no np.bitwise_count).
+_BITS = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(
+    axis=1).astype(np.uint8)
+
+
+def pack(valid):
+    """
+    The bitmask of a boolean array, True where there is data.
+    """
+    return np.packbits(np.asarray(valid, dtype=bool), axis=1)
+
+
+def unpack(mask, shape):
+    """
+    The boolean array, of the given shape, of a bitmask.
+    """
+    return np.unpackbits(mask, axis=1, count=shape[1]).view(bool)
+
+
+def from_valid(valid):
+    """
+    The bitmask of a boolean array, or None if it is True everywhere.
+    """
+    if valid.all():
+        return None
+    return pack(valid)
+
+
+def check(mask, shape):
+    """
+    A mask for data of the given shape, given as a boolean array of that
+    shape or as a bitmask (None for no mask).
+    """
+    if mask is None:
+        return None
+    mask = np.asarray(mask)
+    if mask.dtype == bool and mask.shape == tuple(shape):
+        return from_valid(mask)
+    if mask.dtype == np.uint8 and mask.shape == (shape[0], -(-shape[1] // 8)):
+        return mask
+    raise ValueError("The mask must be a boolean array of the shape of the "
+                     "data, or its bitmask.")
+
+
+def count(mask, shape):
+    """
+    Number of pixels with data.
+    """
+    if mask is None:
+        return shape[0] * shape[1]
+    # np.packbits pads the rows with clear bits, which add nothing.
+    if hasattr(np, 'bitwise_count'):
+        return int(np.bitwise_count(mask).sum(dtype=np.int64))
+    return int(_BITS[mask].sum(dtype=np.int64))
+
+
+def rectangles(shape, regions):
+    """
+    The bitmask of the pixels inside any of the given regions, each a pair
+    of slices of rows and columns, or None if they cover everything. It is
+    made without the boolean array of the whole mask.
+    """
+    mask = np.zeros((shape[0], -(-shape[1] // 8)), dtype=np.uint8)
+    row = np.zeros(shape[1], dtype=bool)
+    for rows, cols in regions:
+        row[...] = False
+        row[cols] = True
+        mask[rows] |= np.packbits(row)
+    if (mask == pack(np.ones((1, shape[1]), dtype=bool))).all():
+        return None
+    return mask
+
+
+def window(mask, shape, rows: slice, cols: slice):
+    """
+    The bitmask of a window of the data.
+    """
+    if mask is None:
+        return None
+    band = mask[rows]
+    return from_valid(unpack(band, (band.shape[0], shape[1]))[:, cols])
+
+
+def resample(mask, shape, new_shape):
+    """
+    The bitmask of data resampled to a new shape, each pixel taking the
+    validity of the nearest one.
+    """
+    if mask is None:
+        return None
+    valid = unpack(mask, shape)
+    rows = (np.arange(new_shape[0]) * shape[0] // new_shape[0])
+    cols = (np.arange(new_shape[1]) * shape[1] // new_shape[1])
+    return from_valid(valid[np.ix_(rows, cols)])
@@ -1,9 +1,14 @@
 import os
+import json
 import requests
 from pathlib import Path
 import datetime
+from aigeanpy import profiling
 
+VALIDATORS_FILE = '.aigean_validators.json'
 
+
+@profiling.instrument('query_isa')
 def query_isa(start_date: str, stop_date: str, instrument=None):
     """
     Query the Aigean database for JSON files that include information about the date and time of
@@ -61,10 +66,53 @@ def query_isa(start_date: str, stop_date: str, instrument=None):
     return r
 
 
-def download_isa(filename: str, save_dir: str):
+def _load_validators(save_dir: str):
+    """
+    Reads the sidecar database of HTTP validators kept in a download directory.
+
+    Returns an empty dictionary if there is no database yet, or if it cannot be
+    parsed (in which case every file is simply downloaded again).
+    """
+    db_path = os.path.join(save_dir, VALIDATORS_FILE)
+    try:
+        with open(db_path, 'r') as f:
+            validators = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(validators, dict):
+        return {}
+    return validators
+
+
+def _save_validators(save_dir: str, validators: dict):
+    """
+    Writes the sidecar database of HTTP validators, replacing it atomically so
+    an interrupted run never leaves a half-written file behind.
+    """
+    db_path = os.path.join(save_dir, VALIDATORS_FILE)
+    tmp_path = db_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(validators, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, db_path)
+
+
+def _downloaded_bytes(downloaded, filename, save_dir, *args, **kwargs):
+    if not downloaded:
+        return {}
+    return {'bytes': os.path.getsize(os.path.join(save_dir, filename))}
+
+
+@profiling.instrument('download_isa', sizes=_downloaded_bytes)
+def download_isa(filename: str, save_dir: str, revalidate: bool = True):
     """
     Downloads a file from the ISA archive. Appropriate filenames can be found using query_isa.
 
+    The validators returned by the archive (ETag, Last-Modified and the size of
+    the file) are stored in a small sidecar database (`.aigean_validators.json`)
+    inside `save_dir`. When the file is already present, the request is made
+    conditional on those validators, and the transfer is skipped if the archive
+    answers that the file has not changed (HTTP 304).
+
     Parameters
     ----------
     filename : str
@@ -74,6 +122,17 @@ def download_isa(filename: str, save_dir: str):
         A directory relative to the root to save the file into. If you wish to
         save into the current directory, enter ".".
 
+    revalidate : bool, optional
+        When True (the default) a file already in `save_dir` is only downloaded
+        again if the archive reports it has changed. When False the file is
+        always downloaded in full.
+
+    Returns
+    -------
+    downloaded : bool
+        True if the file was transferred, False if the local copy was
+        confirmed to be up to date.
+
     Example
     -------
     The filename needs to be exactly as given from a query; here the instrument name \'Ecne\' should appear as `ecn` in the filename.
@@ -89,9 +148,24 @@ def download_isa(filename: str, save_dir: str):
 
     url = 'http://dokku-app.dokku.arc.ucl.ac.uk/isa-archive/download/?filename={}'.format(
         filename)
-    response = requests.get(url, stream=True)
     file_path = os.path.join(save_dir, filename)
 
+    validators = _load_validators(save_dir)
+    stored = validators.get(filename)
+
+    headers = {}
+    if revalidate and stored is not None and os.path.isfile(file_path) and \
+            os.path.getsize(file_path) == stored.get('size'):
+        if stored.get('etag'):
+            headers['If-None-Match'] = stored['etag']
+        if stored.get('last_modified'):
+            headers['If-Modified-Since'] = stored['last_modified']
+
+    response = requests.get(url, stream=True, headers=headers)
+
+    if headers and response.status_code == 304:
+        return False
+
     if response.ok:
         download = response.content
         dir_path = Path(file_path)
@@ -99,6 +173,16 @@ def download_isa(filename: str, save_dir: str):
     else:
         raise Exception("Download file failed")
 
+    etag = response.headers.get('ETag')
+    last_modified = response.headers.get('Last-Modified')
+    if etag or last_modified:
+        validators[filename] = {'etag': etag,
+                                'last_modified': last_modified,
+                                'size': len(download)}
+        _save_validators(save_dir, validators)
+    elif validators.pop(filename, None) is not None:
+        _save_validators(save_dir, validators)
+    return True
 
 if __name__ == "__main__":
     import doctest
@@ -0,0 +1,255 @@
+"""
+Opt-in timers and counters for the operations aigeanpy spends its time in:
+querying and downloading from the archive, reading each file format, SatMap
+arithmetic and mosaics, plotting, and clustering.
+
+Recording is off by default, and then costs a single flag check per call.
+Turn it on with the AIGEANPY_PROFILE environment variable (any value other
+than '', '0' or 'false'), with `enable()`, or with the `--profile` flag of
+the console scripts. The totals can be printed, or exported as a JSON summary
+or as a Prometheus textfile.
+
+Times are inclusive: an operation that calls another one (a mosaic adding two
+maps, say) is timed as a whole and the inner operation is timed as well.
+"""
+import os
+import json
+import threading
+from functools import wraps
+from time import perf_counter
+
+_enabled = os.environ.get('AIGEANPY_PROFILE', '').lower() not in ('', '0', 'false')
+_lock = threading.Lock()
+_stats = {}
+
+COUNTERS = ('calls', 'seconds', 'bytes', 'pixels', 'points')
+
+
+def enable():
+    """
+    Starts recording timers and counters.
+    """
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    """
+    Stops recording; the totals so far are kept.
+    """
+    global _enabled
+    _enabled = False
+
+
+def is_enabled():
+    return _enabled
+
+
+def reset():
+    """
+    Forgets everything recorded so far.
+    """
+    with _lock:
+        _stats.clear()
+
+
+def record(name: str, seconds: float = 0.0, calls: int = 1, bytes: int = 0,
+           pixels: int = 0, points: int = 0):
+    """
+    Adds one call of the operation `name` to the totals.
+    """
+    with _lock:
+        stats = _stats.get(name)
+        if stats is None:
+            stats = _stats[name] = dict.fromkeys(COUNTERS, 0)
+        stats['calls'] += calls
+        stats['seconds'] += seconds
+        stats['bytes'] += int(bytes)
+        stats['pixels'] += int(pixels)
+        stats['points'] += int(points)
+
+
+class _Measurement(object):
+    """
+    Times a block of code, and collects the amounts it processed.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.sizes = dict(bytes=0, pixels=0, points=0)
+
+    def count(self, bytes=0, pixels=0, points=0):
+        self.sizes['bytes'] += bytes
+        self.sizes['pixels'] += pixels
+        self.sizes['points'] += points
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, perf_counter() - self.start, **self.sizes)
+        return False
+
+
+class _NullMeasurement(object):
+    """
+    Stands in for a measurement when recording is off.
+    """
+
+    def count(self, bytes=0, pixels=0, points=0):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL = _NullMeasurement()
+
+
+def measure(name: str):
+    """
+    Context manager timing the block it wraps as one call of `name`.
+
+    Example
+    -------
+    >>> enable(); reset()
+    >>> with measure('decode') as m:
+    ...     m.count(bytes=1024, pixels=256)
+    >>> summary()['decode']['bytes']
+    1024
+    >>> disable(); reset()
+
+    """
+    if not _enabled:
+        return _NULL
+    return _Measurement(name)
+
+
+def instrument(name, sizes=None):
+    """
+    Decorator timing every call of a function as the operation `name`.
+
+    Parameters
+    ----------
+    name : str or function
+        the name the operation is recorded under, or a function of the
+        call's arguments returning it.
+    sizes : function, optional
+        called as sizes(result, *args, **kwargs), returning a dict of the
+        'bytes', 'pixels' or 'points' the call processed.
+    """
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            start = perf_counter()
+            result = function(*args, **kwargs)
+            seconds = perf_counter() - start
+            counts = sizes(result, *args, **kwargs) if sizes else {}
+            label = name(*args, **kwargs) if callable(name) else name
+            record(label, seconds, **counts)
+            return result
+        return wrapper
+    return decorator
+
+
+def summary():
+    """
+    The totals recorded so far, keyed by operation name.
+    """
+    with _lock:
+        return {name: dict(stats) for name, stats in _stats.items()}
+
+
+def _write_atomic(path: str, text: str):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def write_json(path: str):
+    """
+    Writes the totals recorded so far as a JSON summary.
+    """
+    _write_atomic(path, json.dumps(summary(), indent=1, sort_keys=True))
+
+
+def prometheus_text():
+    """
+    The totals recorded so far in the Prometheus text exposition format.
+    """
+    help_text = {'calls': 'Number of calls of each operation.',
+                 'seconds': 'Time spent in each operation.',
+                 'bytes': 'Bytes processed by each operation.',
+                 'pixels': 'Pixels processed by each operation.',
+                 'points': 'Points processed by each operation.'}
+    stats = summary()
+    lines = []
+    for counter in COUNTERS:
+        metric = f'aigeanpy_operation_{counter}_total'
+        lines.append(f'# HELP {metric} {help_text[counter]}')
+        lines.append(f'# TYPE {metric} counter')
+        for name in sorted(stats):
+            label = name.replace('\\', '\\\\').replace('"', '\\"')
+            lines.append(f'{metric}{{operation="{label}"}} {stats[name][counter]}')
+    return '\n'.join(lines) + '\n'
+
+
+def write_prometheus(path: str):
+    """
+    Writes the totals recorded so far as a Prometheus textfile, replacing the
+    file atomically as the node exporter's textfile collector requires.
+    """
+    _write_atomic(path, prometheus_text())
+
+
+def print_summary():
+    """
+    Prints a table of the totals recorded so far, slowest operation first.
+    """
+    stats = summary()
+    print(f"{'operation':<28} {'calls':>6} {'seconds':>9} {'MB':>9} {'Mpixels':>8}")
+    for name in sorted(stats, key=lambda name: -stats[name]['seconds']):
+        s = stats[name]
+        print(f"{name:<28} {s['calls']:>6} {s['seconds']:>9.3f} "
+              f"{s['bytes']/1e6:>9.2f} {s['pixels']/1e6:>8.2f}")
+
+
+def report(destination: str = '-'):
+    """
+    Reports the totals: printed when `destination` is '-', written as a
+    Prometheus textfile when it ends in '.prom', and as JSON otherwise.
+    """
+    if destination == '-':
+        print_summary()
+    elif destination.endswith('.prom'):
+        write_prometheus(destination)
+    else:
+        write_json(destination)
+
+
+def add_profile_argument(parser):
+    """
+    Adds the --profile option to a console script's argument parser.
+    """
+    parser.add_argument('--profile', nargs='?', const='-', default=None,
+                        metavar='FILE',
+                        help='Time the work done and print a summary, or write '
+                             'it to FILE (.json, or .prom for Prometheus)')
+
+
+def start_profile(args):
+    """
+    Turns recording on if --profile was given, reporting when the script
+    exits (including through sys.exit).
+    """
+    if args.profile is not None:
+        import atexit
+        enable()
+        atexit.register(report, args.profile)
@@ -0,0 +1,143 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from aigeanpy import profiling, dtypes
+from aigeanpy.utilis import figure_name
+
+# The renderer of this process, made on first use (one per worker process
+# when rendering in a pool).
+_renderer = None
+
+
+class Renderer(object):
+    """
+    Draws SatMaps to image files with matplotlib's Agg canvas, without pyplot.
+
+    The same figure, image and colorbar are used for every map drawn, only
+    their data and limits being replaced, so rendering many maps neither
+    leaks figures nor piles colorbars up, and does not depend on a display.
+
+    Parameters
+    ----------
+    figsize : tuple, optional
+        size of the figure in inches.
+    dpi : int, optional
+        resolution of the image files.
+    cmap : str, optional
+        colour map of the images. The default is 'viridis'.
+    """
+
+    def __init__(self, figsize=(6.4, 4.8), dpi: int = 100, cmap: str = 'viridis'):
+        self.figure = Figure(figsize=figsize, dpi=dpi)
+        FigureCanvasAgg(self.figure)
+        self.axes = self.figure.add_subplot()
+        self.cmap = cmap
+        self.image = None
+        self.colorbar = None
+
+    def draw(self, satmap):
+        """
+        Draws a SatMap on the figure, in place of the previous one.
+        """
+        extent = (satmap.meta['xcoords'][0], satmap.meta['xcoords'][1],
+                  satmap.meta['ycoords'][0], satmap.meta['ycoords'][1])
+        if self.image is None:
+            self.image = self.axes.imshow(dtypes.values(satmap), cmap=self.cmap, extent=extent)
+            self.colorbar = self.figure.colorbar(self.image, ax=self.axes,
+                                                 label="Depth", orientation="vertical")
+        else:
+            self.image.set_data(dtypes.values(satmap))
+            self.image.set_extent(extent)
+            # Rescales the colours, and the colorbar with them.
+            self.image.autoscale()
+
+    @profiling.instrument('Renderer.render',
+                          sizes=lambda result, self, satmap, *args, **kwargs:
+                          {'bytes': satmap.data.nbytes, 'pixels': satmap.data.size})
+    def render(self, satmap, filename: str):
+        """
+        Draws a SatMap and saves the figure to `filename`.
+
+        Returns
+        -------
+        filename : str
+        """
+        self.draw(satmap)
+        self.figure.savefig(filename)
+        return filename
+
+
+def default_renderer():
+    """
+    The renderer of this process.
+    """
+    global _renderer
+    if _renderer is None:
+        _renderer = Renderer()
+    return _renderer
+
+
+def _init_worker(figsize, dpi, cmap):
+    global _renderer
+    _renderer = Renderer(figsize, dpi, cmap)
+
+
+def _load(satmap):
+    if isinstance(satmap, (str, os.PathLike)):
+        from aigeanpy.satmap import get_satmap
+        satmap = get_satmap(str(satmap))
+    return satmap
+
+
+def _render_one(renderer, satmap, outdir):
+    satmap = _load(satmap)
+    return renderer.render(satmap, os.path.join(outdir, figure_name(satmap.meta)))
+
+
+def _render_in_worker(args):
+    return _render_one(_renderer, *args)
+
+
+def render_many(maps, outdir: str = '.', workers: int = None,
+                figsize=(6.4, 4.8), dpi: int = 100, cmap: str = 'viridis'):
+    """
+    Renders many SatMaps to PNG files, in parallel processes.
+
+    Each worker process draws with one renderer of its own, so memory stays
+    flat whatever the number of maps. File names are those of
+    SatMap.visualise.
+
+    Parameters
+    ----------
+    maps : list of SatMap or str
+        the maps to render, or the names of their files, which are then
+        read by the workers (cheaper than sending the maps to them).
+    outdir : str, optional
+        directory to write the images to. The default is the working
+        directory.
+    workers : int, optional
+        number of worker processes; one per core by default. With 1, the
+        maps are rendered in this process.
+    figsize, dpi, cmap : optional
+        passed to Renderer.
+
+    Returns
+    -------
+    list of str
+        the paths of the images written, in the order of `maps`.
+
+    """
+    maps = list(maps)
+    workers = max(1, min(workers or os.cpu_count() or 1, len(maps)))
+
+    if workers == 1:
+        renderer = Renderer(figsize, dpi, cmap)
+        return [_render_one(renderer, satmap, outdir) for satmap in maps]
+
+    chunksize = max(1, len(maps) // (workers * 4))
+    with ProcessPoolExecutor(workers, initializer=_init_worker,
+                             initargs=(figsize, dpi, cmap)) as executor:
+        return list(executor.map(_render_in_worker,
+                                 [(satmap, outdir) for satmap in maps],
+                                 chunksize=chunksize))
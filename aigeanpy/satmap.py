@@ -1,16 +1,245 @@
-import asdf
-import h5py
 from zipfile import ZipFile
 import json
 import numpy as np
 import os
 import io
-import matplotlib.pyplot as plt
 from aigeanpy.utilis import get_meta
+from aigeanpy import profiling, dtypes, masks
 from pathlib import Path
-import copy
-from skimage.transform import rescale
-import io
+
+# matplotlib, scikit-image, asdf and h5py take most of the time needed to
+# import this module, so they are imported by the methods that use them.
+
+# Set by aigeanpy.expression.deferred: while True, adding and subtracting
+# SatMaps builds expressions, evaluated later, instead of new SatMaps.
+_deferred = False
+
+
+class NoOverlapError(ValueError):
+    """
+    Raised when a bounding box does not overlap an image.
+    """
+
+
+def _map_sizes(result, *args, **kwargs):
+    """
+    Size of the SatMap produced by an operation, for profiling.
+    """
+    if not isinstance(result, SatMap):
+        # A deferred expression, whose data is not computed yet.
+        return {}
+    return {'bytes': result.data.nbytes, 'pixels': result.data.size}
+
+
+def _own_sizes(result, self, *args, **kwargs):
+    """
+    Size of the SatMap an operation was called on, for profiling.
+    """
+    return {'bytes': self.data.nbytes, 'pixels': self.data.size}
+
+
+def _unpacked(meta):
+    """
+    Metadata without the keys describing packed data (see aigeanpy.dtypes).
+    """
+    return {key: value for key, value in meta.items()
+            if key not in dtypes.PACKING_KEYS}
+
+
+def _wrap(meta, data, mask=None):
+    """
+    A SatMap of a new array, which unlike SatMap(meta, data) is not copied.
+    """
+    satmap = SatMap(meta, data[:0, :0])
+    satmap.data, satmap.shape, satmap.mask = data, data.shape, mask
+    return satmap
+
+
+def _result(meta, data, mask=None):
+    """
+    The SatMap of the data computed by an operation, stored as set by the
+    dtype policy.
+    """
+    if data.base is not None:
+        # A view of the data of another map.
+        data = data.copy()
+    data, packing = dtypes.stored(data)
+    return _wrap(dict(meta, **packing), data, mask)
+
+
+def _loaded(meta, data):
+    """
+    The SatMap of data read from a file, in the working type of the dtype
+    policy if one is set, and masked where the data is not finite.
+    """
+    working = dtypes.get_policy()['working']
+    if working is None:
+        satmap = SatMap(meta, data)
+    else:
+        satmap = _wrap(meta, np.array(data, dtype=working))
+    # Summing is a cheap check: the sum is only NaN or infinite if some data
+    # is (or if it overflows).
+    if (np.issubdtype(satmap.data.dtype, np.floating) and
+            not np.isfinite(satmap.data.sum())):
+        satmap.mask = masks.from_valid(np.isfinite(satmap.data))
+    return satmap
+
+
+def _corner_region(meta, part, shape):
+    """
+    The slices of an array covering the area of `meta` where the data of
+    `part`, of the given shape, lies, found from the corner the two areas
+    share (None if they share none).
+    """
+    rows, cols = shape
+    if meta['xcoords'][0] == part['xcoords'][0] and meta['ycoords'][0] == part['ycoords'][0]:
+        return slice(-rows, None), slice(None, cols)
+    elif meta['xcoords'][1] == part['xcoords'][1] and meta['ycoords'][1] == part['ycoords'][1]:
+        return slice(None, rows), slice(-cols, None)
+    elif meta['xcoords'][0] == part['xcoords'][0] and meta['ycoords'][1] == part['ycoords'][1]:
+        return slice(None, rows), slice(None, cols)
+    elif meta['xcoords'][1] == part['xcoords'][1] and meta['ycoords'][0] == part['ycoords'][0]:
+        return slice(-rows, None), slice(-cols, None)
+    return None
+
+
+def _add(satmap, other, average: bool = False):
+    """
+    The sum of two SatMaps (see SatMap.__add__). Where both have data, that
+    of `other` covers that of `satmap`, or, with `average`, their mean is
+    taken.
+    """
+    new_meta = _added_meta(satmap.meta, other.meta)
+    data, other_data = dtypes.values(satmap), dtypes.values(other)
+
+    arry_shape_0 = round(
+        (new_meta['ycoords'][1] - new_meta['ycoords'][0])/new_meta['resolution'])
+    arry_shape_1 = round(
+        (new_meta['xcoords'][1] - new_meta['xcoords'][0])/new_meta['resolution'])
+
+    new_data = np.zeros((arry_shape_0, arry_shape_1),
+                        dtype=dtypes.working_dtype(data.dtype, other_data.dtype))
+    parts = [(part, part_data, _corner_region(new_meta, part.meta, part_data.shape))
+             for part, part_data in ((satmap, data), (other, other_data))]
+    parts = [part for part in parts if part[2] is not None]
+
+    if satmap.mask is None and other.mask is None and not average:
+        # The coverage is that of the two rectangles.
+        for part, part_data, region in parts:
+            new_data[region] = part_data
+        mask = masks.rectangles(new_data.shape, [region for *_, region in parts])
+        return _result(new_meta, new_data, mask)
+
+    valid = np.zeros(new_data.shape, dtype=bool)
+    for part, part_data, region in parts:
+        target, covered = new_data[region], valid[region]
+        part_valid = part.valid
+        if average:
+            both = covered & part_valid
+            target[both] = (target[both] + part_data[both]) / 2
+            part_valid = part_valid & ~covered
+        np.copyto(target, part_data, where=part_valid)
+        covered |= part_valid
+
+    return _result(new_meta, new_data, masks.from_valid(valid))
+
+
+def _subtract(satmap, other):
+    """
+    The difference of two SatMaps over their overlap (see SatMap.__sub__).
+    """
+    new_meta = _subtracted_meta(satmap.meta, other.meta)
+    data, other_data = dtypes.values(satmap), dtypes.values(other)
+    working = dtypes.working_dtype(data.dtype, other_data.dtype, floating=False)
+
+    arry_shape_0 = round(
+        (new_meta['ycoords'][1] - new_meta['ycoords'][0])
+        / new_meta['resolution'])
+    arry_shape_1 = round(
+        (new_meta['xcoords'][1] - new_meta['xcoords'][0])
+        / new_meta['resolution'])
+    shape = (arry_shape_0, arry_shape_1)
+
+    # Placing in positive data, then subtracting negative data
+    region = _corner_region(satmap.meta, new_meta, shape)
+    other_region = _corner_region(other.meta, new_meta, shape)
+    new_data = data[region] if region else np.zeros(shape, dtype=working)
+    if other_region:
+        new_data = np.subtract(new_data, other_data[other_region], dtype=working)
+
+    # Only pixels with data in both maps have data in the difference.
+    valid = None
+    for part, part_region in ((satmap, region), (other, other_region)):
+        if part_region is None:
+            part_valid = np.zeros(shape, dtype=bool)
+        elif part.mask is None:
+            continue
+        else:
+            part_valid = part.valid[part_region]
+        valid = part_valid if valid is None else valid & part_valid
+    mask = None if valid is None else masks.from_valid(valid)
+
+    return _result(new_meta, new_data, mask)
+
+
+def _added_meta(meta, other):
+    """
+    Metadata of the sum of two SatMaps (see SatMap.__add__), checking they
+    can be added.
+    """
+    if meta['resolution'] != other['resolution']:
+        raise Exception("Different resolution")
+
+    if meta['date'] != other['date']:
+        raise Exception("Different date")
+
+    new_meta = _unpacked(meta)
+    new_meta['time'] = meta['time']+',' + other['time']
+    new_meta['xcoords'] = (min(meta['xcoords'][0],
+                               other['xcoords'][0]),
+                           max(meta['xcoords'][1],
+                               other['xcoords'][1]))
+
+    new_meta['ycoords'] = (min(meta['ycoords'][0],
+                               other['ycoords'][0]),
+                           max(meta['ycoords'][1],
+                               other['ycoords'][1]))
+
+    new_meta['resolution'] = meta['resolution']
+    return new_meta
+
+
+def _subtracted_meta(meta, other):
+    """
+    Metadata of the difference of two SatMaps (see SatMap.__sub__), checking
+    they can be subtracted.
+    """
+    if meta['instrument'] != other['instrument']:
+        raise Exception("Different instrument")
+
+    if meta['date'] == other['date']:
+        raise Exception("Same date")
+
+    if (meta['xcoords'][1] < other['xcoords'][0] or
+        meta['xcoords'][0] > other['xcoords'][1] or
+        meta['ycoords'][1] < other['ycoords'][0] or
+            meta['ycoords'][0] > other['ycoords'][1]):
+        raise Exception("Non-overlapping images")
+
+    new_meta = _unpacked(meta)
+    new_meta['time'] = meta['time']+','+other['time']
+    new_meta['date'] = meta['date']+',' + other['date']
+
+    new_meta['xcoords'] = (max(meta['xcoords'][0],
+                               other['xcoords'][0]),
+                           min(meta['xcoords'][1],
+                               other['xcoords'][1]))
+
+    new_meta['ycoords'] = (max(meta['ycoords'][0],
+                               other['ycoords'][0]),
+                           min(meta['ycoords'][1],
+                               other['ycoords'][1]))
+    return new_meta
 
 
 class SatMap(object):
@@ -26,7 +255,7 @@ class SatMap(object):
 
     """
 
-    def __init__(self, meta: dict, data):
+    def __init__(self, meta: dict, data, mask=None):
         """
         Takes metadata and image data, and initialises a SatMap object.
 
@@ -63,6 +292,11 @@ class SatMap(object):
         data : numpy array
             Contains the measurement data in question.
             For images, this is the image data as an array. 
+        mask : numpy array, optional
+            Where the data is valid: a boolean array of the shape of the
+            data, True where there is data, or its bitmask (see
+            aigeanpy.masks), which is how it is kept. The default is
+            valid data everywhere.
 
         Example
         -------
@@ -94,6 +328,7 @@ class SatMap(object):
         self.meta = meta.copy()
         self.data = data.copy()
         self.shape = self.data.shape
+        self.mask = masks.check(mask, self.shape)
         self.meta['xcoords'] = np.array(self.meta['xcoords']).astype(int)
         self.meta['ycoords'] = np.array(self.meta['ycoords']).astype(int)
         self.fov = (meta['xcoords'][1] - meta['xcoords'][0],
@@ -101,6 +336,37 @@ class SatMap(object):
         self.centre = ((meta['xcoords'][1] - meta['xcoords'][0])/2,
                        (meta['ycoords'][1] - meta['ycoords'][0])/2)
 
+    @property
+    def valid(self):
+        """
+        Boolean array, True where the map has data.
+        """
+        if self.mask is None:
+            return np.ones(self.shape, dtype=bool)
+        return masks.unpack(self.mask, self.shape)
+
+    def coverage(self):
+        """
+        Fraction of the pixels of the map that have data.
+
+        Example
+        -------
+        >>> data = np.array([[1., 2.], [3., 4.]])
+        >>> meta = {'date': '2022-12-01','time': '21:43:42', 'instrument': 'lir', 'resolution': 1, 'xcoords': [0., 2.], 'ycoords': [0., 2.]}
+        >>> SatMap(meta, data, mask=np.array([[True, False], [True, True]])).coverage()
+        0.75
+
+        """
+        return masks.count(self.mask, self.shape) / max(self.data.size, 1)
+
+    def masked(self):
+        """
+        The data as a numpy masked array, without the pixels that have no
+        data, for statistics over the valid pixels only (e.g.
+        `satmap.masked().mean()`).
+        """
+        return np.ma.MaskedArray(dtypes.values(self), mask=~self.valid)
+
     def pixel_to_earth(self, p_x, p_y):
         """
         Function to convert a given pixel coordinate to the corresponding 
@@ -190,6 +456,157 @@ class SatMap(object):
         pixel = (int(p_x), int(p_y))
         return pixel
 
+    def crop(self, bbox):
+        """
+        The part of the SatMap inside a box of earth coordinates.
+
+        Parameters
+        ----------
+        bbox : tuple
+            (xmin, ymin, xmax, ymax) in meters. Every pixel overlapping the
+            box is kept.
+
+        Raises
+        ------
+        ValueError
+            If the box does not overlap the image.
+
+        Returns
+        -------
+        SatMap
+            the pixels inside the box, with the coordinates of their edges.
+
+        Example
+        -------
+        >>> data = np.arange(12).reshape(3, 4)
+        >>> meta = {'date': '2022-12-01','time': '21:43:42', 'instrument': 'lir', 'resolution': 2, 'xcoords': [0., 8.], 'ycoords': [0., 6.]}
+        >>> window = SatMap(meta, data).crop((3, 0, 5, 3))
+        >>> window.data
+        array([[ 5,  6],
+               [ 9, 10]])
+        >>> window.meta['xcoords'], window.meta['ycoords']
+        (array([2, 6]), array([0, 4]))
+
+        """
+        rows, cols, xcoords, ycoords = _window(self.meta, self.shape, bbox)
+        meta = self.meta.copy()
+        meta['xcoords'] = xcoords
+        meta['ycoords'] = ycoords
+        return SatMap(meta, self.data[rows, cols],
+                      masks.window(self.mask, self.shape, rows, cols))
+
+    def pack(self, dtype='uint16'):
+        """
+        The map with its data stored as scaled unsigned integers, a quarter
+        of the size of float64 with uint16 (see aigeanpy.dtypes.pack).
+
+        Arithmetic and mosaics unpack such maps themselves; other functions
+        expect the values, from `unpack`.
+
+        Example
+        -------
+        >>> data = np.array([[200., 350.], [np.nan, 500.]])
+        >>> meta = {'date': '2022-12-01','time': '21:43:42', 'instrument': 'lir', 'resolution': 1, 'xcoords': [0., 2.], 'ycoords': [0., 2.]}
+        >>> packed = SatMap(meta, data).pack()
+        >>> packed.data
+        array([[    0, 32767],
+               [65535, 65534]], dtype=uint16)
+        >>> packed.unpack().data.round(2)
+        array([[200., 350.],
+               [ nan, 500.]])
+
+        """
+        data, packing = dtypes.pack(dtypes.values(self), dtype)
+        return _wrap(dict(_unpacked(self.meta), **packing), data, self.mask)
+
+    def unpack(self, dtype=None):
+        """
+        The map with the values of its data, if it is packed, as floats of
+        `dtype`, or otherwise of the working type of the dtype policy.
+        """
+        dtype = dtype or dtypes.working_dtype(
+            np.float64 if dtypes.is_packed(self.meta) else self.data.dtype)
+        return SatMap(_unpacked(self.meta), dtypes.values(self, dtype), self.mask)
+
+    def sample(self, points, method: str = 'nearest'):
+        """
+        The values of the map at points of earth coordinates, all at once.
+
+        Parameters
+        ----------
+        points : array
+            (x, y) of a point, or an (n, 2) array of points, in meters.
+        method : str, optional
+            'nearest' takes the value of the pixel holding each point;
+            'bilinear' interpolates between the centres of the four pixels
+            around it (and along the edge, beyond the outermost centres).
+
+        Returns
+        -------
+        numpy array
+            the n values, NaN at points outside the map or on pixels without
+            data (for 'bilinear', if any pixel interpolated from has none).
+
+        Example
+        -------
+        >>> data = np.array([[0., 2.], [4., 6.]])
+        >>> meta = {'date': '2022-12-01','time': '21:43:42', 'instrument': 'lir', 'resolution': 2, 'xcoords': [0., 4.], 'ycoords': [0., 4.]}
+        >>> SatMap(meta, data).sample([[1, 3], [2, 2], [5, 1]])
+        array([ 0.,  6., nan])
+        >>> SatMap(meta, data).sample([[1, 3], [2, 2], [5, 1]], method='bilinear')
+        array([ 0.,  3., nan])
+
+        """
+        if method not in ('nearest', 'bilinear'):
+            raise ValueError(f"Unknown sampling method '{method}'.")
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        resolution = float(self.meta['resolution'])
+        west, east = (float(x) for x in self.meta['xcoords'])
+        south, north = (float(y) for y in self.meta['ycoords'])
+        rows, cols = self.shape
+        dtype = dtypes.working_dtype(
+            np.float64 if dtypes.is_packed(self.meta) else self.data.dtype)
+        values = np.full(len(points), np.nan, dtype=dtype)
+        x, y = points[:, 0], points[:, 1]
+        inside = (x >= west) & (x <= east) & (y >= south) & (y <= north)
+        if not inside.any():
+            return values
+        # Positions in pixels from the top left corner of the image.
+        u = (x[inside] - west) / resolution
+        v = (north - y[inside]) / resolution
+
+        if method == 'nearest':
+            r = np.minimum(v.astype(np.intp), rows - 1)
+            c = np.minimum(u.astype(np.intp), cols - 1)
+            samples = [(r, c, 1)]
+        else:
+            # Positions from the centre of the top left pixel, held at the
+            # outermost centres.
+            v = np.clip(v - 0.5, 0, rows - 1)
+            u = np.clip(u - 0.5, 0, cols - 1)
+            r0 = np.minimum(v.astype(np.intp), max(rows - 2, 0))
+            c0 = np.minimum(u.astype(np.intp), max(cols - 2, 0))
+            r1 = np.minimum(r0 + 1, rows - 1)
+            c1 = np.minimum(c0 + 1, cols - 1)
+            fv, fu = v - r0, u - c0
+            samples = [(r0, c0, (1 - fv) * (1 - fu)), (r0, c1, (1 - fv) * fu),
+                       (r1, c0, fv * (1 - fu)), (r1, c1, fv * fu)]
+
+        total = np.zeros(len(u), dtype=dtype)
+        for r, c, weight in samples:
+            pixels = self.data[r, c]
+            if dtypes.is_packed(self.meta):
+                pixels = dtypes.unpack(pixels, self.meta, dtype)
+            pixels = pixels.astype(dtype, copy=False)
+            if self.mask is not None:
+                # The bit of each pixel, read from the packed mask.
+                bits = (self.mask[r, c >> 3] >> (7 - (c & 7))) & 1
+                pixels = np.where(bits == 1, pixels, np.nan)
+            # Pixels of weight 0 do not count, even without data.
+            total += np.where(weight > 0, weight * pixels, 0)
+        values[inside] = total
+        return values
+
     def __str__(self):
         """
         This method allows a SatMap to be converted directly into a string.
@@ -211,13 +628,16 @@ class SatMap(object):
         summary = (f"< {self.meta['observatory'].upper()}/ {self.meta['instrument']}: ({self.meta['xcoords'][0]},{self.meta['ycoords'][0]}) - ({self.meta['xcoords'][1]},{self.meta['ycoords'][1]}) {self.meta['resolution']} m/px")
         return summary
 
+    @profiling.instrument('SatMap.__add__', sizes=_map_sizes)
     def __add__(self, OtherMap):
         """
         This method allows you to 'add' two SatMap objects into a new SatMap, 
         with the natural syntax "a + b".
 
-        For images, the data will be added in the earth coordinate system. Any
-        overlapping area will be the average of the two. 
+        For images, the data will be added in the earth coordinate system. In
+        any overlapping area, the pixels of the second map with data cover
+        those of the first (SatMap.mosaic can average them instead). Pixels
+        neither map has data for are left at zero, and masked out.
 
         This method is written with the restriction that the two SatMaps being 
         added are from the same instrument, and from the same day, so any data
@@ -256,70 +676,13 @@ class SatMap(object):
 
         """
 
-        if self.meta['resolution'] != OtherMap.meta['resolution']:
-            raise Exception("Different resolution")
-
-        if self.meta['date'] != OtherMap.meta['date']:
-            raise Exception("Different date")
-
-        new_meta = self.meta.copy()
-        new_meta['time'] = self.meta['time']+',' + OtherMap.meta['time']
-        new_meta['xcoords'] = (min(self.meta['xcoords'][0],
-                                   OtherMap.meta['xcoords'][0]),
-                               max(self.meta['xcoords'][1],
-                                   OtherMap.meta['xcoords'][1]))
-
-        new_meta['ycoords'] = (min(self.meta['ycoords'][0],
-                                   OtherMap.meta['ycoords'][0]),
-                               max(self.meta['ycoords'][1],
-                                   OtherMap.meta['ycoords'][1]))
-
-        new_meta['resolution'] = self.meta['resolution']
-
-        arry_shape_0 = round(
-            (new_meta['ycoords'][1] - new_meta['ycoords'][0])/new_meta['resolution'])
-        arry_shape_1 = round(
-            (new_meta['xcoords'][1] - new_meta['xcoords'][0])/new_meta['resolution'])
-
-        new_data = np.zeros((arry_shape_0, arry_shape_1))
+        if _deferred or not isinstance(OtherMap, SatMap):
+            from aigeanpy.expression import defer
+            return defer(self) + OtherMap
 
-        if (new_meta['xcoords'][0] == self.meta['xcoords'][0] and
-                new_meta['ycoords'][0] == self.meta['ycoords'][0]):
-            new_data[-self.data.shape[0]:, :self.data.shape[1]] = self.data
-
-        elif (new_meta['xcoords'][1] == self.meta['xcoords'][1] and
-              new_meta['ycoords'][1] == self.meta['ycoords'][1]):
-            new_data[:self.data.shape[0], -self.data.shape[1]:] = self.data
-
-        elif (new_meta['xcoords'][0] == self.meta['xcoords'][0] and
-              new_meta['ycoords'][1] == self.meta['ycoords'][1]):
-            new_data[:self.data.shape[0], :self.data.shape[1]] = self.data
-
-        elif (new_meta['xcoords'][1] == self.meta['xcoords'][1] and
-              new_meta['ycoords'][0] == self.meta['ycoords'][0]):
-            new_data[-self.data.shape[0]:, -self.data.shape[1]:] = self.data
-
-        if (new_meta['xcoords'][0] == OtherMap.meta['xcoords'][0] and
-                new_meta['ycoords'][0] == OtherMap.meta['ycoords'][0]):
-            new_data[-OtherMap.data.shape[0]:,
-                     :OtherMap.data.shape[1]] = OtherMap.data
-
-        elif (new_meta['xcoords'][1] == OtherMap.meta['xcoords'][1] and
-              new_meta['ycoords'][1] == OtherMap.meta['ycoords'][1]):
-            new_data[:OtherMap.data.shape[0],
-                     -OtherMap.data.shape[1]:] = OtherMap.data
-
-        elif new_meta['xcoords'][0] == OtherMap.meta['xcoords'][0] and new_meta['ycoords'][1] == OtherMap.meta['ycoords'][1]:
-            new_data[:OtherMap.data.shape[0],
-                     :OtherMap.data.shape[1]] = OtherMap.data
-
-        elif (new_meta['xcoords'][1] == OtherMap.meta['xcoords'][1] and
-              new_meta['ycoords'][0] == OtherMap.meta['ycoords'][0]):
-            new_data[-OtherMap.data.shape[0]:,
-                     -OtherMap.data.shape[1]:] = OtherMap.data
-
-        return SatMap(meta=new_meta, data=new_data)
+        return _add(self, OtherMap)
 
+    @profiling.instrument('SatMap.__sub__', sizes=_map_sizes)
     def __sub__(self, OtherMap):
         """
         A method allowing SatMap objects to be subtracted from one another
@@ -365,83 +728,14 @@ class SatMap(object):
 
         """
 
-        if self.meta['instrument'] != OtherMap.meta['instrument']:
-            raise Exception("Different instrument")
-
-        if self.meta['date'] == OtherMap.meta['date']:
-            raise Exception("Same date")
+        if _deferred or not isinstance(OtherMap, SatMap):
+            from aigeanpy.expression import defer
+            return defer(self) - OtherMap
 
-        if (self.meta['xcoords'][1] < OtherMap.meta['xcoords'][0] or
-            self.meta['xcoords'][0] > OtherMap.meta['xcoords'][1] or
-            self.meta['ycoords'][1] < OtherMap.meta['ycoords'][0] or
-                self.meta['ycoords'][0] > OtherMap.meta['ycoords'][1]):
-            raise Exception("Non-overlapping images")
+        return _subtract(self, OtherMap)
 
-        new_meta = self.meta.copy()
-        new_meta['time'] = self.meta['time']+','+OtherMap.meta['time']
-        new_meta['date'] = self.meta['date']+',' + OtherMap.meta['date']
-
-        new_meta['xcoords'] = (max(self.meta['xcoords'][0],
-                                   OtherMap.meta['xcoords'][0]),
-                               min(self.meta['xcoords'][1],
-                                   OtherMap.meta['xcoords'][1]))
-
-        new_meta['ycoords'] = (max(self.meta['ycoords'][0],
-                                   OtherMap.meta['ycoords'][0]),
-                               min(self.meta['ycoords'][1],
-                                   OtherMap.meta['ycoords'][1]))
-
-        arry_shape_0 = round(
-            (new_meta['ycoords'][1] - new_meta['ycoords'][0])
-            / new_meta['resolution'])
-        arry_shape_1 = round(
-            (new_meta['xcoords'][1] - new_meta['xcoords'][0])
-            / new_meta['resolution'])
-
-        # This seems like an unnecessary step, leaving it in for now.
-        new_data = np.zeros((arry_shape_0, arry_shape_1))
-
-        # Placing in positive data
-        if (new_meta['xcoords'][0] == self.meta['xcoords'][0] and
-                new_meta['ycoords'][0] == self.meta['ycoords'][0]):
-            new_data = self.data[-new_data.shape[0]:, :new_data.shape[1]]
-
-        elif (new_meta['xcoords'][1] == self.meta['xcoords'][1] and
-              new_meta['ycoords'][1] == self.meta['ycoords'][1]):
-            new_data = self.data[:new_data.shape[0], -new_data.shape[1]:]
-
-        elif (new_meta['xcoords'][0] == self.meta['xcoords'][0] and
-              new_meta['ycoords'][1] == self.meta['ycoords'][1]):
-            new_data = self.data[:new_data.shape[0], :new_data.shape[1]]
-
-        elif (new_meta['xcoords'][1] == self.meta['xcoords'][1] and
-              new_meta['ycoords'][0] == self.meta['ycoords'][0]):
-            new_data = self.data[-new_data.shape[0]:, -new_data.shape[1]:]
-
-        # Subtracting negative data
-        if (new_meta['xcoords'][0] == OtherMap.meta['xcoords'][0] and
-                new_meta['ycoords'][0] == OtherMap.meta['ycoords'][0]):
-            new_data = new_data-OtherMap.data[-new_data.shape[0]:,
-                                              :new_data.shape[1]]
-
-        elif (new_meta['xcoords'][1] == OtherMap.meta['xcoords'][1] and
-              new_meta['ycoords'][1] == OtherMap.meta['ycoords'][1]):
-            new_data = new_data-OtherMap.data[:new_data.shape[0],
-                                              -new_data.shape[1]:]
-
-        elif (new_meta['xcoords'][0] == OtherMap.meta['xcoords'][0] and
-              new_meta['ycoords'][1] == OtherMap.meta['ycoords'][1]):
-            new_data = new_data-OtherMap.data[:new_data.shape[0],
-                                              :new_data.shape[1]]
-
-        elif (new_meta['xcoords'][1] == OtherMap.meta['xcoords'][1] and
-              new_meta['ycoords'][0] == OtherMap.meta['ycoords'][0]):
-            new_data = new_data-OtherMap.data[-new_data.shape[0]:,
-                                              -new_data.shape[1]:]
-
-        return SatMap(meta=new_meta, data=new_data)
-
-    def mosaic(self, OtherMap, resolution=None, padding=True):
+    @profiling.instrument('SatMap.mosaic', sizes=_map_sizes)
+    def mosaic(self, OtherMap, resolution=None, padding=True, average=False):
         """
         Takes two SatMaps and makes a mosaic: an image with the data of both, 
         including in overlap regions.
@@ -464,6 +758,10 @@ class SatMap(object):
             When False, the final image will be the largest possible which 
             contains no pixels without any data.
             The default is True.
+        average : bool, optional
+            When True, pixels where both maps have data take the mean of the
+            two; otherwise those of OtherMap cover those of the first map.
+            The default is False.
 
         Raises
         ------
@@ -498,8 +796,14 @@ class SatMap(object):
                 self.meta['ycoords'][0] > OtherMap.meta['ycoords'][1]):
             raise Exception("Non-overlapping images")
 
-        map_1 = copy.deepcopy(self)
-        map_2 = copy.deepcopy(OtherMap)
+        from skimage.transform import rescale
+
+        # The maps are rescaled in the working type, and their data is only
+        # copied by rescaling (or by casting it to that type).
+        working = dtypes.working_dtype(self.data.dtype, OtherMap.data.dtype)
+        map_1 = _wrap(_unpacked(self.meta), dtypes.values(self, working), self.mask)
+        map_2 = _wrap(_unpacked(OtherMap.meta), dtypes.values(OtherMap, working),
+                      OtherMap.mask)
 
         if map_1.meta['resolution'] == map_2.meta['resolution']:
             raise Exception(
@@ -525,6 +829,11 @@ class SatMap(object):
             map_2.data = rescale(map_2.data, factor2)
             map_2.meta['resolution'] = resolution
 
+        # The masks follow the rescaled data, to the nearest pixel.
+        for part, original in ((map_1, self), (map_2, OtherMap)):
+            part.mask = masks.resample(original.mask, original.shape, part.data.shape)
+            part.shape = part.data.shape
+
         if (map_1.fov[0] % map_1.meta['resolution'] != 0 or
             map_1.fov[1] % map_1.meta['resolution'] != 0 or
             map_2.fov[0] % map_1.meta['resolution'] != 0 or
@@ -533,39 +842,42 @@ class SatMap(object):
                 'Changes in resolution may necessitate changes in field-of-view')
 
         if padding:
-            new_Satmap = map_1+map_2
+            new_Satmap = _add(map_1, map_2, average)
             new_Satmap.meta['instrument'] = map_1.meta['instrument'] + \
                 ','+map_2.meta['instrument']
             return new_Satmap
 
         else:
             if self.fov[0]*self.fov[1] > OtherMap.fov[0]*OtherMap.fov[1]:
-                new_Satmap = map_1+map_1
+                new_Satmap = _add(map_1, map_1)
                 new_Satmap.meta['instrument'] = map_1.meta['instrument'] + \
                     ','+map_2.meta['instrument']
                 return new_Satmap
             else:
-                new_Satmap = map_2+map_2
+                new_Satmap = _add(map_2, map_2)
                 new_Satmap.meta['instrument'] = map_1.meta['instrument'] + \
                     ','+map_2.meta['instrument']
                 return new_Satmap
 
+    @profiling.instrument('SatMap.visualise', sizes=_own_sizes)
     def visualise(self, save=False, savepath='.'):
         """
         Creates a figure to visualise the data in a SatMap using matplotlib.
 
+        Saved figures are drawn off-screen by the renderer of the process
+        (see aigeanpy.rendering), which is reused from one call to the next,
+        so saving many figures does not accumulate them.
+
         Parameters
         ----------
         save : bool, optional
-            When True, creates a file. The default is False.
+            When True, creates a file. When False, the figure is shown in a
+            window and closed once the window is. The default is False.
 
         savepath : str, optional
             The path of the directory to save the file to. 
             The default location is the current working directory.
 
-        **kwargs : TYPE
-            DESCRIPTION.
-
         Returns
         -------
         path : path
@@ -582,29 +894,88 @@ class SatMap(object):
         >>> os.remove('aigeanlir20221201214342.png')
 
         """
-
-        plt.imshow(self.data, cmap='viridis', extent=(
-            self.meta['xcoords'][0], self.meta['xcoords'][1], self.meta['ycoords'][0], self.meta['ycoords'][1]))
-        plt.colorbar(label="Depth", orientation="vertical")
+        from aigeanpy import rendering
 
         if save:
-            filename = self.meta['observatory']+self.meta['instrument'] + \
-                self.meta['date'].replace(
-                    '-', '')+self.meta['time'].replace(':', '')+'.png'
-
-            path = os.path.join(savepath, filename)
-            plt.savefig(path)
+            filename = rendering.figure_name(self.meta)
+            rendering.default_renderer().render(self, os.path.join(savepath, filename))
             return filename
 
         else:
+            import matplotlib.pyplot as plt
+
+            fig, ax = plt.subplots()
+            image = ax.imshow(dtypes.values(self), cmap='viridis', extent=(
+                self.meta['xcoords'][0], self.meta['xcoords'][1], self.meta['ycoords'][0], self.meta['ycoords'][1]))
+            fig.colorbar(image, ax=ax, label="Depth", orientation="vertical")
             plt.show()
+            plt.close(fig)
+
+
+def _window(meta, shape, bbox, margin: int = 0):
+    """
+    Pixel slices of the part of an image that overlaps a box of earth
+    coordinates (xmin, ymin, xmax, ymax), widened by `margin` pixels on
+    every side, and the coordinates of its edges. Row 0 of the image is its
+    northern (ymax) edge.
+    """
+    xmin, ymin, xmax, ymax = bbox
+    resolution = float(meta['resolution'])
+    west = float(meta['xcoords'][0])
+    north = float(meta['ycoords'][1])
+    col_start = max(0, int(np.floor((xmin - west) / resolution)) - margin)
+    col_stop = min(shape[1], int(np.ceil((xmax - west) / resolution)) + margin)
+    row_start = max(0, int(np.floor((north - ymax) / resolution)) - margin)
+    row_stop = min(shape[0], int(np.ceil((north - ymin) / resolution)) + margin)
+    if col_start >= col_stop or row_start >= row_stop:
+        raise NoOverlapError("The bounding box does not overlap the image.")
+    xcoords = [west + col_start * resolution, west + col_stop * resolution]
+    ycoords = [north - row_stop * resolution, north - row_start * resolution]
+    return (slice(row_start, row_stop), slice(col_start, col_stop),
+            xcoords, ycoords)
+
+
+def _npy_header(f):
+    """
+    Reads the header of a .npy file object, leaving it at the start of the
+    data. Returns (shape, dtype), or None for layouts whose rows cannot be
+    read on their own (Fortran order, object arrays, unknown versions).
+    """
+    version = np.lib.format.read_magic(f)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+    elif version == (2, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+    else:
+        return None
+    if fortran_order or dtype.hasobject or len(shape) != 2:
+        return None
+    return shape, dtype
 
 
-def get_satmap(filename: str):
+def _open_asdf(filename, memmap):
+    import asdf
+    try:
+        return asdf.open(filename, memmap=memmap)
+    except TypeError:
+        # asdf before 3.1 memory-maps unless told to copy the arrays.
+        return asdf.open(filename, copy_arrays=not memmap)
+
+
+def _file_format(filename, *args, **kwargs):
+    return 'get_satmap[' + os.path.splitext(str(filename))[1].lstrip('.') + ']'
+
+
+@profiling.instrument(_file_format, sizes=_map_sizes)
+def get_satmap(filename: str, bbox=None, margin: int = 0):
     """
     Takes a string specifying a data file produced by Aigean, and converts 
     said file into a SatMap object.
 
+    With a bounding box, only the part of the image inside it is read: a
+    hyperslab of the HDF5 dataset, a slice of the memory-mapped asdf block,
+    or the band of rows needed from the .npy file in a zip archive.
+
     Parameters
     ----------
     filename : str
@@ -613,11 +984,19 @@ def get_satmap(filename: str):
         be specified.
         Files can be found at https://dokku-app.dokku.arc.ucl.ac.uk/isa-archive/
         Currently, only asdf, hdf5, and zip files holding a json are supported.
+    bbox : tuple, optional
+        (xmin, ymin, xmax, ymax) in meters, the window to read, as for
+        `SatMap.crop`. By default the whole image is read.
+    margin : int, optional
+        number of pixels read around the bounding box, e.g. the neighbours
+        needed to interpolate at points near its edges.
 
     Raises
     ------
     Exception
         Throws an error when an inappropriate file name is supplied.
+    NoOverlapError
+        If the bounding box does not overlap the image (a ValueError).
 
     Returns
     -------
@@ -635,27 +1014,71 @@ def get_satmap(filename: str):
 
     if "asdf" in filename:
         try:
-            af = asdf.open(filename)
+            af = _open_asdf(filename, memmap=bbox is not None)
         except:
             raise Exception('File does not exist')
-        meta = get_meta(dict(af))
-        data = af['data'][:]
-        return SatMap(meta, data)
+        with af:
+            meta = get_meta(dict(af))
+            if bbox is None:
+                data = af['data'][:]
+            else:
+                rows, cols, meta['xcoords'], meta['ycoords'] = _window(
+                    meta, af['data'].shape, bbox, margin)
+                # Copied before the file, and its memory map, are closed.
+                data = np.array(af['data'][rows, cols])
+        return _loaded(meta, data)
 
     elif "hdf5" in filename:
+        import h5py
         try:
             f = h5py.File(filename, 'r')
         except:
             raise Exception('File does not exist')
-        meta = {}
-        for key in f.attrs.keys():
-            meta[key] = f.attrs[key]
-        for key in f['observation'].attrs.keys():
-            meta[key] = f['observation'].attrs[key]
-        data = f['observation']['data'][:]
-        return SatMap(meta, data)
+        with f:
+            meta = {}
+            for key in f.attrs.keys():
+                meta[key] = f.attrs[key]
+            for key in f['observation'].attrs.keys():
+                meta[key] = f['observation'].attrs[key]
+            dataset = f['observation']['data']
+            if bbox is None:
+                data = dataset[:]
+            else:
+                rows, cols, meta['xcoords'], meta['ycoords'] = _window(
+                    meta, dataset.shape, bbox, margin)
+                data = dataset[rows, cols]
+        return _loaded(meta, data)
 
     elif "zip" in filename:
+        if bbox is not None:
+            try:
+                zf = ZipFile(filename, 'r')
+            except:
+                raise Exception('File does not exist')
+            with zf:
+                with zf.open("metadata.json") as f:
+                    meta = json.load(f)
+                with zf.open("observation.npy") as f:
+                    header = _npy_header(f)
+                    if header is None:
+                        f.seek(0)
+                        data = np.load(f)
+                        shape = data.shape
+                    else:
+                        shape, dtype = header
+                    rows, cols, meta['xcoords'], meta['ycoords'] = _window(
+                        meta, shape, bbox, margin)
+                    if header is not None:
+                        # Skips to the first row wanted and reads only the
+                        # band of rows of the window.
+                        row_bytes = shape[1] * dtype.itemsize
+                        f.seek(f.tell() + rows.start * row_bytes)
+                        data = np.frombuffer(f.read((rows.stop - rows.start) * row_bytes),
+                                             dtype=dtype).reshape(-1, shape[1])
+                        rows = slice(None)
+                    data = data[rows, cols]
+            return _loaded(meta, data)
+
         try:
             zip_file = io.BytesIO(open(filename, "rb").read())
         except:
@@ -666,16 +1089,79 @@ def get_satmap(filename: str):
                 data = np.load(f)
             with zf.open("metadata.json") as f:
                 meta = json.load(f)
-        return SatMap(data=data, meta=meta)
+        return _loaded(meta, data)
 
     elif "ecn" in filename:
         raise ValueError(
-            "Data from the Ecne instrument cannot be put into a SatMap, since it doesn't contain an image.")
+            "Data from the Ecne instrument cannot be put into a SatMap, since it doesn't contain an image; "
+            "read it with aigeanpy.get_ecne.")
 
     else:
         raise Exception("Unknown file type")
 
 
+def read_window(filename: str, bbox, margin: int = 0):
+    """
+    Reads only the part of an image file inside a box of earth coordinates
+    (xmin, ymin, xmax, ymax), and `margin` pixels around it; the same as
+    get_satmap(filename, bbox=bbox, margin=margin).
+    """
+    return get_satmap(filename, bbox=bbox, margin=margin)
+
+
+@profiling.instrument('sample_maps', sizes=lambda result, *args, **kwargs:
+                      {'points': result.size})
+def sample_maps(satmaps, points, method: str = 'nearest'):
+    """
+    The values of many maps at the same points, e.g. the depth at every
+    Ecne station on every date.
+
+    Maps given as files are read only over the bounding box of the points
+    (and a pixel around it, for interpolation), so a long series of large
+    images is sampled without loading any of them whole.
+
+    Parameters
+    ----------
+    satmaps : list of SatMap or str
+        the maps, or the names of their files.
+    points : array
+        an (n, 2) array of the (x, y) of the points, in meters.
+    method : str, optional
+        'nearest' or 'bilinear', as for `SatMap.sample`.
+
+    Returns
+    -------
+    numpy array
+        (maps, points) array of the values, NaN where a point is outside a
+        map or on pixels without data. A file whose image misses all the
+        points gives a row of NaN; other errors reading files are raised.
+
+    Example
+    -------
+    >>> files = ['aigeanpy/tests/test-files/aigean_man_20230105_135624.hdf5', 'aigeanpy/tests/test-files/aigean_lir_20230105_135624.asdf']
+    >>> np.isnan(sample_maps(files, [[100, 300], [1000, 100]]))
+    array([[False,  True],
+           [ True, False]])
+
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    values = np.full((len(satmaps), len(points)), np.nan,
+                     dtype=dtypes.working_dtype(np.float64))
+    if not len(points):
+        return values
+    bbox = (points[:, 0].min(), points[:, 1].min(),
+            points[:, 0].max(), points[:, 1].max())
+    for i, satmap in enumerate(satmaps):
+        if not isinstance(satmap, SatMap):
+            filename = str(satmap)
+            try:
+                satmap = get_satmap(filename, bbox=bbox, margin=1)
+            except NoOverlapError:
+                continue
+        values[i] = satmap.sample(points, method)
+    return values
+
+
 if __name__ == "__main__":
     import doctest
     doctest.testmod()
@@ -0,0 +1,143 @@
+import numpy as np
+from aigeanpy import dtypes
+from aigeanpy.satmap import SatMap, _unpacked
+from aigeanpy.analysis import KMeansModel
+
+
+def _check_coregistered(maps):
+    first = maps[0]
+    for other in maps[1:]:
+        if (other.shape != first.shape or
+                other.meta['resolution'] != first.meta['resolution'] or
+                np.any(other.meta['xcoords'] != first.meta['xcoords']) or
+                np.any(other.meta['ycoords'] != first.meta['ycoords'])):
+            raise ValueError(
+                "The maps to segment must cover the same area at the same "
+                "resolution; mosaic or crop them first.")
+
+
+def segment(maps, clusters: int = 3, sample_size: int = 100000,
+            tile_rows: int = 256, iterations: int = 50, standardise: bool = True,
+            seed: int = None, backend: str = 'numpy'):
+    """
+    Segments one or more co-registered SatMaps into regions, e.g. water,
+    wetland and land, with k-means on the value of each pixel.
+
+    Each pixel is described by its value in every map given. The clusters
+    are fitted on a random sample of the pixels, and every pixel is then
+    allocated to a cluster a block of rows at a time, so the memory needed
+    stays bounded whatever the size of the scene.
+
+    Clusters are numbered in increasing order of the first map's value at
+    their centre, so the numbering is the same from one run to the next.
+    Pixels without a finite value in every map, or masked out of any (see
+    SatMap.mask), are left out of the fit and labelled as nodata: the
+    largest value of the label type (255 for up to 255 regions, 65535
+    beyond). They are masked out of the result.
+
+    Parameters
+    ----------
+    maps : SatMap or list of SatMap
+        the maps whose values make up the features of each pixel. They must
+        share their coordinates and resolution.
+    clusters : int, optional
+        number of regions. The default is 3.
+    sample_size : int, optional
+        number of pixels used to fit the clusters.
+    tile_rows : int, optional
+        number of image rows allocated at once.
+    iterations : int, optional
+        maximum number of k-means iterations.
+    standardise : bool, optional
+        When True (the default) each feature is scaled to zero mean and unit
+        variance, so maps with different ranges weigh the same.
+    seed : int, optional
+        seed for the pixel sample and the starting centres.
+    backend : str, optional
+        'numpy' or 'hamerly'.
+
+    Returns
+    -------
+    SatMap
+        A map with the same coordinates as the inputs whose data is the
+        region of each pixel, or the nodata label.
+
+    Raises
+    ------
+    ValueError
+        If no pixel has a finite value in every map.
+
+    Example
+    -------
+    >>> data = np.array([[0., 0., 9.], [0., 0., 9.], [0., 9., 9.]])
+    >>> meta = {'date': '2022-12-01','time': '21:43:42', 'observatory': 'aigean', 'instrument': 'lir', 'resolution': 1, 'xcoords': [0., 3.], 'ycoords': [0., 3.]}
+    >>> segment(SatMap(meta, data), clusters=2, seed=0).data
+    array([[0, 0, 1],
+           [0, 0, 1],
+           [0, 1, 1]], dtype=uint8)
+
+    """
+    if isinstance(maps, SatMap):
+        maps = [maps]
+    maps = list(maps)
+    _check_coregistered(maps)
+
+    shape = maps[0].shape
+    n_pixels = shape[0] * shape[1]
+    layers = [np.asarray(dtypes.values(m)).reshape(-1) for m in maps]
+    dtype = np.float32 if all(layer.dtype == np.float32 for layer in layers) \
+        else np.float64
+
+    valid = np.ones(n_pixels, dtype=bool)
+    for m, layer in zip(maps, layers):
+        valid &= np.isfinite(layer)
+        if m.mask is not None:
+            valid &= m.valid.reshape(-1)
+    valid_index = np.flatnonzero(valid)
+    if not len(valid_index):
+        raise ValueError("No pixel has a value in every map to segment.")
+
+    rng = np.random.default_rng(seed)
+    if len(valid_index) > sample_size:
+        sample_index = np.sort(valid_index[rng.choice(len(valid_index), sample_size,
+                                                      replace=False)])
+    else:
+        sample_index = valid_index
+    sample = np.column_stack([layer[sample_index] for layer in layers]).astype(dtype)
+
+    offset = np.zeros(len(layers), dtype=dtype)
+    scale = np.ones(len(layers), dtype=dtype)
+    if standardise:
+        offset = sample.mean(axis=0).astype(dtype)
+        scale = sample.std(axis=0).astype(dtype)
+        scale[scale == 0] = 1
+        sample = (sample - offset) / scale
+
+    model = KMeansModel(clusters, iterations, backend, seed=int(rng.integers(2**32)))
+    model.fit(sample, verbose=False)
+
+    # Renumber the clusters in increasing order of the first feature.
+    order = np.argsort(model.centres[:, 0], kind='stable')
+    renumber = np.empty(clusters, dtype=np.uint8 if clusters < 256 else np.uint16)
+    renumber[order] = np.arange(clusters)
+    nodata = np.iinfo(renumber.dtype).max
+
+    labels = np.full(shape, nodata, dtype=renumber.dtype)
+    row_pixels = shape[1]
+    for row in range(0, shape[0], tile_rows):
+        start, stop = row * row_pixels, min(row + tile_rows, shape[0]) * row_pixels
+        tile_valid = valid[start:stop]
+        tile = np.column_stack([layer[start:stop][tile_valid] for layer in layers]
+                               ).astype(dtype)
+        if not len(tile):
+            continue
+        if standardise:
+            tile -= offset
+            tile /= scale
+        tile_labels = labels[row:row + tile_rows].reshape(-1)
+        tile_labels[tile_valid] = renumber[model.predict(tile)]
+
+    # The labels are not packed, even if the maps are.
+    meta = _unpacked(maps[0].meta)
+    meta['instrument'] = ','.join(str(m.meta['instrument']) for m in maps)
+    return SatMap(meta, labels, mask=valid.reshape(shape))
@@ -0,0 +1,309 @@
+import os
+import json
+import datetime
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from aigeanpy import dtypes
+from aigeanpy.satmap import SatMap, get_satmap
+
+# The per-pixel arrays making up the state of an accumulator.
+_STATE = ('count', 'mean_t', 'mean_value', 'm2_t', 'm2_value', 'c_t',
+          'min_value', 'max_value')
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def _days(meta):
+    """
+    Time of an observation, in days since 1970.
+    """
+    when = datetime.datetime.strptime(str(meta['date']) + ' ' + str(meta['time']),
+                                      '%Y-%m-%d %H:%M:%S')
+    return (when - _EPOCH).total_seconds() / 86400
+
+
+def _welford(t, value, count, mean_t, mean_value, m2_t, m2_value, c_t,
+             min_value, max_value):
+    """
+    Welford's update of the state arrays, in place, with an observation at
+    time `t` of the values `value`.
+    """
+    count += 1
+    d_t = t - mean_t
+    mean_t += d_t / count
+    m2_t += d_t * (t - mean_t)
+    d_value = value - mean_value
+    mean_value += d_value / count
+    residual = value - mean_value
+    m2_value += d_value * residual
+    c_t += d_t * residual
+    np.minimum(min_value, value, out=min_value)
+    np.maximum(max_value, value, out=max_value)
+
+
+class TemporalStats(object):
+    """
+    Per-pixel statistics of a history of observations of the same area,
+    accumulated one SatMap at a time.
+
+    Only a few numbers are kept for each pixel, whatever the number of
+    observations: how many observations had data there, the mean and the
+    sum of squared deviations of the value (Welford's updates), their
+    minimum and maximum, and the mean and co-moments of the observation time
+    from which the linear trend follows. Pixels without data in an
+    observation (NaN, or masked out) are left out of that observation's
+    update.
+
+    Accumulators fed with different observations, e.g. by parallel workers,
+    are combined with `merge`, and saved to and loaded from a checkpoint
+    file with `save` and `load`.
+
+    Example
+    -------
+    >>> meta = {'date': '2022-12-01', 'time': '12:00:00', 'observatory': 'aigean', 'instrument': 'lir', 'resolution': 1, 'xcoords': [0., 2.], 'ycoords': [0., 1.]}
+    >>> stats = TemporalStats()
+    >>> for day, depth in [('01', [1., 2.]), ('02', [3., 2.]), ('03', [5., 2.])]:
+    ...     stats.update(SatMap(dict(meta, date='2022-12-' + day), np.array([depth])))
+    >>> stats.mean().data
+    array([[3., 2.]])
+    >>> stats.trend(per_days=1).data
+    array([[2., 0.]])
+
+    """
+
+    def __init__(self):
+        self.meta = None
+        self.shape = None
+        self.first = None
+        self.last = None
+        self.observations = 0
+        for name in _STATE:
+            setattr(self, name, None)
+
+    def _start(self, meta, shape):
+        self.meta = {key: meta[key] for key in ('observatory', 'instrument',
+                                                'resolution', 'xcoords', 'ycoords')
+                     if key in meta}
+        self.shape = tuple(shape)
+        for name in _STATE:
+            setattr(self, name, np.zeros(shape, dtype=np.float64))
+        self.min_value[...] = np.inf
+        self.max_value[...] = -np.inf
+
+    def _check_grid(self, meta, shape):
+        if (tuple(shape) != self.shape or
+                meta['resolution'] != self.meta['resolution'] or
+                np.any(np.asarray(meta['xcoords']) != np.asarray(self.meta['xcoords'])) or
+                np.any(np.asarray(meta['ycoords']) != np.asarray(self.meta['ycoords']))):
+            raise ValueError("The observations must cover the same area at the "
+                             "same resolution.")
+
+    def _dates(self, meta):
+        stamp = str(meta['date']) + ' ' + str(meta['time'])
+        self.first = stamp if self.first is None else min(self.first, stamp)
+        self.last = stamp if self.last is None else max(self.last, stamp)
+
+    def update(self, satmap):
+        """
+        Adds an observation to the statistics.
+        """
+        if self.count is None:
+            self._start(satmap.meta, satmap.shape)
+        else:
+            self._check_grid(satmap.meta, satmap.shape)
+        self._dates(satmap.meta)
+        self.observations += 1
+
+        t = _days(satmap.meta)
+        value = dtypes.values(satmap, np.float64)
+        valid = np.isfinite(value)
+        if satmap.mask is not None:
+            valid &= satmap.valid
+        if valid.all():
+            _welford(t, value, *[getattr(self, name) for name in _STATE])
+        else:
+            # Updates the pixels with data, then puts them back.
+            state = [getattr(self, name)[valid] for name in _STATE]
+            _welford(t, value[valid], *state)
+            for name, part in zip(_STATE, state):
+                getattr(self, name)[valid] = part
+
+    def merge(self, other):
+        """
+        Adds the observations accumulated by another TemporalStats (Chan et
+        al.'s pairwise formulas).
+        """
+        if other.count is None:
+            return self
+        if self.count is None:
+            self._start(other.meta, other.shape)
+        else:
+            self._check_grid(other.meta, other.shape)
+        for stamp in (other.first, other.last):
+            self.first = stamp if self.first is None else min(self.first, stamp)
+            self.last = stamp if self.last is None else max(self.last, stamp)
+        self.observations += other.observations
+
+        count = self.count + other.count
+        with np.errstate(invalid='ignore', divide='ignore'):
+            share = np.where(count > 0, other.count / count, 0)
+        cross = self.count * share  # n_a * n_b / n
+        d_t = other.mean_t - self.mean_t
+        d_value = other.mean_value - self.mean_value
+        self.m2_t += other.m2_t + d_t**2 * cross
+        self.m2_value += other.m2_value + d_value**2 * cross
+        self.c_t += other.c_t + d_t * d_value * cross
+        self.mean_t += d_t * share
+        self.mean_value += d_value * share
+        self.count = count
+        np.minimum(self.min_value, other.min_value, out=self.min_value)
+        np.maximum(self.max_value, other.max_value, out=self.max_value)
+        return self
+
+    def save(self, filename):
+        """
+        Saves the state to a checkpoint file (numpy .npz), replacing it
+        atomically so an interrupted save leaves the previous checkpoint.
+        """
+        if self.count is None:
+            raise ValueError("No observation has been accumulated.")
+        info = {'meta': {key: np.asarray(value).tolist() for key, value in self.meta.items()},
+                'first': self.first, 'last': self.last,
+                'observations': self.observations}
+        tmp_name = str(filename) + '.tmp.npz'
+        np.savez(tmp_name, info=json.dumps(info),
+                 **{name: getattr(self, name) for name in _STATE})
+        os.replace(tmp_name, filename)
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Loads a checkpoint saved with `save`.
+        """
+        loaded = cls()
+        with np.load(filename) as f:
+            info = json.loads(str(f['info']))
+            for name in _STATE:
+                setattr(loaded, name, f[name])
+        loaded.meta = info['meta']
+        loaded.shape = loaded.count.shape
+        loaded.first = info['first']
+        loaded.last = info['last']
+        loaded.observations = info['observations']
+        return loaded
+
+    def _satmap(self, statistic, data):
+        meta = dict(self.meta)
+        date, time = self.last.split(' ')
+        meta.update({'date': date, 'time': time, 'statistic': statistic,
+                     'first': self.first, 'last': self.last})
+        return SatMap(meta, data)
+
+    def _having(self, values, minimum):
+        return np.where(self.count >= minimum, values, np.nan)
+
+    def counts(self):
+        """
+        SatMap of the number of observations with data at each pixel.
+        """
+        return self._satmap('count', self.count.astype(np.int64))
+
+    def mean(self):
+        """
+        SatMap of the mean value of each pixel (NaN where never observed).
+        """
+        return self._satmap('mean', self._having(self.mean_value, 1))
+
+    def variance(self):
+        """
+        SatMap of the sample variance of each pixel (NaN with fewer than two
+        observations).
+        """
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self._satmap('variance', self._having(self.m2_value / (self.count - 1), 2))
+
+    def minimum(self):
+        """
+        SatMap of the smallest value of each pixel.
+        """
+        return self._satmap('min', self._having(self.min_value, 1))
+
+    def maximum(self):
+        """
+        SatMap of the largest value of each pixel.
+        """
+        return self._satmap('max', self._having(self.max_value, 1))
+
+    def trend(self, per_days: float = 365.25):
+        """
+        SatMap of the slope of the least-squares line through the values of
+        each pixel against time, per `per_days` days (by default per year).
+        NaN where the pixel was observed at fewer than two times.
+        """
+        with np.errstate(invalid='ignore', divide='ignore'):
+            slope = np.where(self.m2_t > 0, self.c_t / self.m2_t * per_days, np.nan)
+        return self._satmap('trend', self._having(slope, 2))
+
+    def results(self):
+        """
+        All the statistics, as a dict of SatMaps keyed by name.
+        """
+        return {'count': self.counts(), 'mean': self.mean(),
+                'variance': self.variance(), 'min': self.minimum(),
+                'max': self.maximum(), 'trend': self.trend()}
+
+
+def _accumulate(filenames):
+    stats = TemporalStats()
+    for filename in filenames:
+        stats.update(get_satmap(filename))
+    return stats
+
+
+def accumulate(filenames, workers: int = None, checkpoint: str = None,
+               checkpoint_every: int = 50):
+    """
+    Accumulates the statistics of the observations in a list of files.
+
+    With several workers, the files are split in contiguous runs that are
+    accumulated in parallel processes, and the partial results merged.
+    With a checkpoint file (and a single worker), the state is saved every
+    `checkpoint_every` files, and a run that was interrupted carries on from
+    the last checkpoint: the files it had accumulated are skipped.
+
+    Parameters
+    ----------
+    filenames : list of str
+        files of the observations, of the same instrument and area.
+    workers : int, optional
+        number of worker processes; one per core by default.
+    checkpoint : str, optional
+        checkpoint file to save the progress to, and resume from.
+    checkpoint_every : int, optional
+        number of files accumulated between checkpoints.
+
+    Returns
+    -------
+    TemporalStats
+
+    """
+    filenames = list(filenames)
+    if checkpoint is not None:
+        stats = TemporalStats.load(checkpoint) if os.path.exists(checkpoint) \
+            else TemporalStats()
+        for i, filename in enumerate(filenames[stats.observations:],
+                                     start=stats.observations + 1):
+            stats.update(get_satmap(filename))
+            if i % checkpoint_every == 0 or i == len(filenames):
+                stats.save(checkpoint)
+        return stats
+
+    workers = max(1, min(workers or os.cpu_count() or 1, len(filenames)))
+    if workers == 1:
+        return _accumulate(filenames)
+    bounds = np.linspace(0, len(filenames), workers + 1).astype(int)
+    runs = [filenames[start:stop] for start, stop in zip(bounds[:-1], bounds[1:])]
+    stats = TemporalStats()
+    with ProcessPoolExecutor(workers) as executor:
+        for partial in executor.map(_accumulate, runs):
+            stats.merge(partial)
+    return stats
@@ -1,7 +1,12 @@
 from aigeanpy.net import query_isa, download_isa
-from aigeanpy.analysis import kmeans
+from aigeanpy.analysis import kmeans, KMeansModel
 from aigeanpy.satmap import get_satmap
+from aigeanpy.segmentation import segment
+from aigeanpy.rendering import render_many
+from aigeanpy.temporal import TemporalStats
 from aigeanpy import satmap
-from aigeanpy import clustering, clustering_numpy
+from aigeanpy import clustering, clustering_numpy, clustering_minibatch
+from aigeanpy import clustering_hamerly, clustering_parallel
 from aigeanpy import analysis
-from aigeanpy import utilis
\ No newline at end of file
+from aigeanpy import utilis
+from aigeanpy import profiling, rendering, quicklook, tiles
\ No newline at end of file
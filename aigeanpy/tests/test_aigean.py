@@ -10,6 +10,7 @@ import asdf
 import h5py
 import zipfile
 import json
+import os
 import csv
 import numpy as np
 import pytest
@@ -18,7 +19,21 @@ from ..net import *
 from ..analysis import *
 from unittest.mock import patch
 from aigeanpy import satmap
+from aigeanpy import clustering, clustering_numpy, clustering_hamerly
+from aigeanpy import clustering_parallel
+from aigeanpy.segmentation import segment
+from aigeanpy import profiling
+from aigeanpy import rendering, quicklook
+from aigeanpy import tiles
+from aigeanpy.temporal import TemporalStats, accumulate
+from aigeanpy.expression import Expression, defer, deferred
+from aigeanpy import dtypes, masks
+from aigeanpy.ecne import EcneTable, get_ecne
+from aigeanpy.utilis import read_csv
 import random
+import warnings
+import subprocess
+import sys
 
 ##############################################################################
 
@@ -78,6 +93,52 @@ class TestQuery(unittest.TestCase):
             query_isa('2022-12-08', '2022-12-09', 'Lir')
 
 
+class TestDownload:
+    """
+    Tests for the conditional re-download in download_isa.
+    """
+    filename = 'aigean_lir_20230105_135624.asdf'
+
+    @staticmethod
+    def fake_response(status, content=b'', headers=None):
+        response = unittest.mock.Mock()
+        response.status_code = status
+        response.ok = status < 400
+        response.content = content
+        response.headers = headers or {}
+        return response
+
+    def test_download_stores_validators(self, tmp_path):
+        ok = self.fake_response(200, b'abc', {'ETag': '"v1"'})
+        with patch.object(requests, 'get', return_value=ok) as mock_get:
+            assert download_isa(self.filename, str(tmp_path))
+        assert mock_get.call_args.kwargs['headers'] == {}
+        assert (tmp_path / self.filename).read_bytes() == b'abc'
+        with open(tmp_path / '.aigean_validators.json') as f:
+            stored = json.load(f)[self.filename]
+        assert stored['etag'] == '"v1"' and stored['size'] == 3
+
+    def test_download_not_modified(self, tmp_path):
+        ok = self.fake_response(200, b'abc', {'ETag': '"v1"',
+                                              'Last-Modified': 'Thu, 05 Jan 2023'})
+        not_modified = self.fake_response(304)
+        with patch.object(requests, 'get', side_effect=[ok, not_modified]) as mock_get:
+            download_isa(self.filename, str(tmp_path))
+            assert not download_isa(self.filename, str(tmp_path))
+        headers = mock_get.call_args.kwargs['headers']
+        assert headers['If-None-Match'] == '"v1"'
+        assert headers['If-Modified-Since'] == 'Thu, 05 Jan 2023'
+        assert (tmp_path / self.filename).read_bytes() == b'abc'
+
+    def test_download_changed_size_is_unconditional(self, tmp_path):
+        ok = self.fake_response(200, b'abc', {'ETag': '"v1"'})
+        with patch.object(requests, 'get', side_effect=[ok, ok]) as mock_get:
+            download_isa(self.filename, str(tmp_path))
+            (tmp_path / self.filename).write_bytes(b'truncated file')
+            assert download_isa(self.filename, str(tmp_path))
+        assert mock_get.call_args.kwargs['headers'] == {}
+
+
 class TestGetSatMap:
     """
     Contains tests for the get_satmap fucntion
@@ -87,6 +148,40 @@ class TestGetSatMap:
             satmap.get_satmap('aigeanpy/tests/test-files/aigean_ecn_20230105_135624.csv')
     
 
+class TestWindow:
+    """
+    Tests for reading and cropping a window of earth coordinates.
+    """
+    @pytest.mark.parametrize('filename', ['aigean_lir_20230105_135624.asdf',
+                                          'aigean_man_20230105_135624.hdf5',
+                                          'aigean_fan_20230105_135624.zip'])
+    def test_read_window_matches_crop(self, filename):
+        full = satmap.get_satmap(prefix+filename)
+        west, east = full.meta['xcoords']
+        south, north = full.meta['ycoords']
+        bbox = (west + 0.3 * (east - west), south + 0.2 * (north - south),
+                west + 0.6 * (east - west), south + 0.7 * (north - south))
+        window = satmap.read_window(prefix+filename, bbox)
+        cropped = full.crop(bbox)
+        assert np.array_equal(window.data, cropped.data)
+        assert np.array_equal(window.meta['xcoords'], cropped.meta['xcoords'])
+        assert np.array_equal(window.meta['ycoords'], cropped.meta['ycoords'])
+        assert window.shape[0] < full.shape[0] and window.shape[1] < full.shape[1]
+
+    def test_clipped_coordinates(self):
+        # Lir covers x 500-1100 and y 0-300 at 30 m/px.
+        window = satmap.get_satmap(prefix+'aigean_lir_20230105_135624.asdf',
+                                   bbox=(1000, 250, 2000, 1000))
+        assert list(window.meta['xcoords']) == [980, 1100]
+        assert list(window.meta['ycoords']) == [240, 300]
+        assert np.array_equal(window.data, lir_0105_0.data[:2, -4:])
+
+    def test_outside_image(self):
+        with pytest.raises(ValueError):
+            satmap.get_satmap(prefix+'aigean_man_20230105_135624.hdf5',
+                              bbox=(2000, 0, 3000, 100))
+
+
 class TestSatMapInit:
     """
     A class containing unit tests for SatMap initialisation.
@@ -241,6 +336,238 @@ class TestSatMapAddSub:
         
         assert np.array_equiv(ms.data, np.array([[0.9, 0.8],[-0.1, -0.1]]))
         
+class TestDeferred:
+    """
+    Tests for the deferred evaluation of SatMap arithmetic.
+    """
+
+    def test_eager_by_default(self):
+        assert isinstance(map_1 + map_2, satmap.SatMap)
+        with deferred():
+            assert isinstance(map_1 + map_2, Expression)
+        assert isinstance(map_1 - map_3, satmap.SatMap)
+
+    @pytest.mark.parametrize('tile_rows', [None, 1, 3])
+    def test_matches_eager(self, tile_rows):
+        """
+        A deferred expression gives the result of the eager operators.
+        """
+        expressions = [lambda: (map_1 + map_2) - map_1x,
+                       lambda: map_1x - (map_1 + map_2),
+                       lambda: fan_0105_0 + fan_0105_1 + fan_0105_2,
+                       lambda: fan_0105_2 + (fan_0105_1 + (fan_0105_0 + fan_0105_1))]
+        for expression in expressions:
+            eager = expression()
+            with deferred():
+                result = expression().compute(tile_rows)
+            assert result.data.dtype == eager.data.dtype
+            assert np.array_equal(result.data, eager.data)
+            assert result.meta['time'] == eager.meta['time']
+            assert np.array_equal(result.valid, eager.valid)
+            assert np.array_equal(result.meta['xcoords'], eager.meta['xcoords'])
+            assert np.array_equal(result.meta['ycoords'], eager.meta['ycoords'])
+
+    def test_defer(self):
+        """
+        Deferring one operand defers the whole expression, in any mode.
+        """
+        expression = map_1x - (defer(map_1) + map_2)
+        assert isinstance(expression, Expression)
+        assert np.array_equal(expression.compute().data, (map_1x - (map_1 + map_2)).data)
+
+    def test_no_shared_corner(self):
+        """
+        Maps are placed by their coordinates, also when the operands of a
+        difference share no corner.
+        """
+        with deferred():
+            result = (map_3 - (map_1 + map_2)).compute()
+        assert np.allclose(result.data, data_3 - np.array([[0, 0, 0],
+                                                           [1, 0, 0],
+                                                           [0, 0, 0]]))
+
+    @pytest.mark.parametrize('tile_rows', [None, 1, 3])
+    def test_sum_with_gaps(self, tile_rows):
+        """
+        A sum with gaps only covers the maps under it where it has data.
+        """
+        meta = {'date': '2023-01-01', 'time': '12:00:00', 'instrument': 'Lir',
+                'resolution': 1}
+        a = satmap.SatMap(dict(meta, xcoords=[0, 4], ycoords=[0, 4]), np.ones((4, 4)))
+        c = satmap.SatMap(dict(meta, xcoords=[0, 2], ycoords=[0, 2]), np.full((2, 2), 2.))
+        d = satmap.SatMap(dict(meta, xcoords=[2, 4], ycoords=[2, 4]), np.full((2, 2), 3.))
+        eager = a + (c + d)
+        result = (defer(a) + (defer(c) + d)).compute(tile_rows)
+        assert np.array_equal(result.data, eager.data)
+        assert np.array_equal(result.data, [[1, 1, 3, 3], [1, 1, 3, 3],
+                                            [2, 2, 1, 1], [2, 2, 1, 1]])
+        assert np.array_equal(result.valid, eager.valid)
+
+    def test_checked_when_built(self):
+        """
+        Operands that cannot be combined raise as the expression is built.
+        """
+        with pytest.raises(Exception, match="Different date"):
+            defer(map_1) + map_3
+
+    def test_masked_operands(self):
+        """
+        Maps with a validity mask are combined eagerly, in the graph.
+        """
+        valid = np.ones(fan_0105_1.shape, dtype=bool)
+        valid[:, :10] = False
+        hidden = satmap.SatMap(fan_0105_1.meta, fan_0105_1.data, mask=valid)
+        expressions = [lambda: fan_0105_0 + hidden + fan_0105_2,
+                       lambda: fan_0105_0 + (fan_0105_2 + hidden),
+                       lambda: map_1 - satmap.SatMap(map_3.meta, map_3.data,
+                                                     mask=map_3.data > 0.15)]
+        for expression in expressions:
+            eager = expression()
+            with deferred():
+                result = expression()
+            assert isinstance(result, Expression)
+            result = result.compute()
+            assert np.array_equal(result.data, eager.data)
+            assert np.array_equal(result.valid, eager.valid)
+
+
+class TestDtypes:
+    """
+    Tests for the dtype policy of SatMap data.
+    """
+
+    def test_inputs_keep_their_type(self):
+        map_a = satmap.SatMap(fan_0105_0.meta, fan_0105_0.data.astype(np.float32))
+        map_b = satmap.SatMap(fan_0105_1.meta, fan_0105_1.data.astype(np.float32))
+        assert (map_a + map_b).data.dtype == np.float32
+        # Integer maps are still added on a float64 canvas.
+        assert (map_1 + map_2).data.dtype == np.float64
+
+    def test_working_type(self):
+        with dtypes.policy(working='float32'):
+            lir = satmap.get_satmap(prefix + 'aigean_lir_20230105_135624.asdf')
+            assert lir.data.dtype == np.float32
+            assert (fan_0105_0 + fan_0105_1).data.dtype == np.float32
+            assert (map_1 - map_3).data.dtype == np.float32
+            assert lir.mosaic(man_0105_1).data.dtype == np.float32
+        assert np.allclose(lir.data, lir_0105_0.data)
+        assert dtypes.get_policy() == {'working': None, 'storage': None}
+
+    def test_working_type_must_be_float(self):
+        with pytest.raises(ValueError):
+            dtypes.set_policy(working='int32')
+
+    def test_pack(self):
+        data = fan_0105_0.data.copy()
+        data[0, :3] = np.nan
+        packed = satmap.SatMap(fan_0105_0.meta, data).pack()
+        assert packed.data.dtype == np.uint16
+        scale = packed.meta['scale_factor']
+        unpacked = packed.unpack()
+        assert 'scale_factor' not in unpacked.meta
+        assert np.isnan(unpacked.data[0, :3]).all()
+        assert np.nanmax(np.abs(unpacked.data - data)) <= scale / 2 * 1.001
+
+    def test_storage_type(self):
+        """
+        Results are stored packed, and packed maps can be combined.
+        """
+        eager = (fan_0105_0 + fan_0105_1) + fan_0105_2
+        with dtypes.policy(storage='uint16'):
+            packed = fan_0105_0 + fan_0105_1
+            assert packed.data.dtype == np.uint16
+            result = packed + fan_0105_2
+            with deferred():
+                deferred_result = ((fan_0105_0 + fan_0105_1) + fan_0105_2).compute()
+        for stored in (result, deferred_result):
+            assert stored.data.dtype == np.uint16
+            assert np.allclose(stored.unpack().data, eager.data,
+                               atol=2 * stored.meta['scale_factor'])
+
+    def test_packed_consumers(self, tmp_path):
+        """
+        Functions reading the data of maps read the values of packed maps.
+        """
+        eager = map_1 + map_2
+        with dtypes.policy(storage='uint16'):
+            packed = map_1 + map_2
+        atol = 2 * packed.meta['scale_factor']
+        assert np.isclose(packed.masked().mean(), eager.masked().mean(), atol=atol)
+        canvas, *_ = tiles.compose([packed])
+        assert np.allclose(canvas, tiles.compose([eager])[0], atol=atol, equal_nan=True)
+        stats = TemporalStats()
+        stats.update(map_1.pack())
+        assert np.allclose(stats.mean().data, map_1.data, atol=1e-3)
+        assert np.array_equal(segment(packed, clusters=2, seed=0).data,
+                              segment(eager, clusters=2, seed=0).data)
+        quicklook.quicklook(packed, str(tmp_path), filename='packed.png')
+        quicklook.quicklook(eager, str(tmp_path), filename='eager.png')
+        assert (tmp_path / 'packed.png').read_bytes() == (tmp_path / 'eager.png').read_bytes()
+
+
+class TestMasks:
+    """
+    Tests for the validity masks of SatMaps.
+    """
+
+    def test_bitmask(self):
+        valid = np.isfinite(fan_0105_0.data)
+        valid[2, 3] = False
+        masked = satmap.SatMap(fan_0105_0.meta, fan_0105_0.data, mask=valid)
+        assert masked.mask.dtype == np.uint8
+        assert masked.mask.shape == (10, 6)
+        assert np.array_equal(masked.valid, valid)
+        assert masked.coverage() == 449 / 450
+        assert np.isclose(masked.masked().mean(),
+                          np.delete(fan_0105_0.data.ravel(), 2 * 45 + 3).mean())
+        assert satmap.SatMap(fan_0105_0.meta, fan_0105_0.data, mask=np.ones((10, 45), bool)).mask is None
+        with pytest.raises(ValueError):
+            satmap.SatMap(fan_0105_0.meta, fan_0105_0.data, mask=np.ones((3, 3), bool))
+
+    def test_loaded_from_nan(self, tmp_path):
+        data = fan_0105_0.data.copy()
+        data[:, :5] = np.nan
+        filename = str(tmp_path / 'aigean_fan_20230105_135624.zip')
+        with zipfile.ZipFile(filename, 'w') as zf:
+            with zf.open('observation.npy', 'w') as f:
+                np.save(f, data)
+            meta = {key: np.asarray(value).tolist() for key, value in fan_0105_0.meta.items()}
+            zf.writestr('metadata.json', json.dumps(meta))
+        loaded = satmap.get_satmap(filename)
+        assert np.array_equal(loaded.valid, np.isfinite(data))
+        window = satmap.get_satmap(filename, bbox=(0, 400, 50, 450))
+        assert not window.valid[:, :5].any() and window.valid[:, 5:].all()
+        assert np.array_equal(loaded.crop((10, 400, 60, 450)).valid, loaded.valid[:, 2:12])
+
+    def test_addition_coverage(self):
+        """
+        Pixels neither map covers are masked, and masked pixels of the
+        second map do not cover the first.
+        """
+        fan_add = fan_0105_0 + fan_0105_2
+        assert fan_add.coverage() == 2 * 450 / (40 * 195)
+        valid = np.ones(fan_0105_0.shape, dtype=bool)
+        valid[:, :10] = False
+        hidden = satmap.SatMap(fan_0105_0.meta, np.zeros(fan_0105_0.shape), mask=valid)
+        covered = fan_0105_0 + hidden
+        assert covered.mask is None
+        assert np.array_equal(covered.data[:, :10], fan_0105_0.data[:, :10])
+        assert not covered.data[:, 10:].any()
+
+    def test_subtraction_coverage(self):
+        # The overlap of map_1 and map_3 is the bottom-left of map_3.
+        valid = np.ones(map_3.shape, dtype=bool)
+        valid[2, 0] = False
+        ms = map_1 - satmap.SatMap(map_3.meta, map_3.data, mask=valid)
+        assert np.array_equal(ms.valid, [[True, True], [False, True]])
+
+    def test_mosaic_average(self):
+        coarse = satmap.SatMap(dict(meta_1, resolution=3), np.array([[9.]]))
+        average = map_1.mosaic(coarse, average=True)
+        assert np.allclose(average.data, (data_1 + 9) / 2)
+        assert np.allclose(map_1.mosaic(coarse).data, 9)
+
+
 class TestSatMapMosaic:
     """
     Tests for the mosaic function
@@ -276,6 +603,18 @@ class TestSatMapMosaic:
         man = man_0105_1
         fan = fan_0105_2
         assert np.all(man.mosaic(fan).data - fan.mosaic(man).data)==0
+
+    def test_mosaic_deferred(self):
+        """
+        Mosaics are evaluated eagerly in deferred mode, with or without padding.
+        """
+        for padding in (True, False):
+            eager = lir_0105_0.mosaic(man_0105_1, padding=padding)
+            with deferred():
+                result = lir_0105_0.mosaic(man_0105_1, padding=padding)
+            assert isinstance(result, satmap.SatMap)
+            assert np.array_equal(result.data, eager.data, equal_nan=True)
+            assert result.meta['instrument'] == eager.meta['instrument']
         
         
 def test_backaction():
@@ -324,4 +663,703 @@ def test_kmeans():
     else:
         assert False
 
-    
\ No newline at end of file
+    
+
+class TestNumpyKernel:
+    """
+    Tests for the vectorised k-means kernel in clustering_numpy.
+    """
+    def test_squared_distances(self):
+        points = np.random.random((50, 4))
+        centres = np.random.random((3, 4))
+        expected = ((points[:, None, :] - centres[None, :, :])**2).sum(axis=2)
+        assert np.allclose(clustering_numpy.squared_distances(points, centres),
+                           expected)
+
+    def test_lloyd_dimensions_and_dtype(self):
+        f1, indice1 = cluster_2data()
+        for dim in [1, 5]:
+            points = np.hstack([f1[:, :1]]*dim).astype(np.float32)
+            centres, alloc, n_iter = clustering_numpy.lloyd(
+                points, points[[0, 150]], 20)
+            assert centres.dtype == np.float32
+            assert centres.shape == (2, dim)
+            assert sorted(np.flatnonzero(alloc == 0)) == indice1[0]
+            assert n_iter < 20
+
+    def test_lloyd_empty_cluster(self):
+        """
+        A centre far away from every point must not end up as NaN.
+        """
+        f1, _ = cluster_2data()
+        start = np.array([f1[0], f1[150], [1000., 1000., 1000.]])
+        centres, alloc, _ = clustering_numpy.lloyd(f1, start, 10)
+        assert np.all(np.isfinite(centres))
+        assert len(np.unique(alloc)) == 3
+
+
+def test_kmeans_minibatch(tmp_path):
+    """
+    Mini-batch mode over two files should find the same two groups, with the
+    labels written in the order of the input rows.
+    """
+    f1, indice1 = cluster_2data()
+    files = [tmp_path / 'day1.csv', tmp_path / 'day2.csv']
+    np.savetxt(files[0], f1[::2], delimiter=',')
+    np.savetxt(files[1], f1[1::2], delimiter=',')
+    labels_file = tmp_path / 'labels.txt'
+
+    centres = kmeans(files, 2, 3, batch_size=16, labels_file=labels_file).centres
+
+    labels = np.loadtxt(labels_file, dtype=int)
+    order = np.concatenate([np.arange(0, 200, 2), np.arange(1, 200, 2)])
+    rows = order[labels == labels[0]]
+    assert centres.shape == (2, 3)
+    assert sorted(rows) in indice1
+    assert len(rows) == 100
+
+
+def test_kmeans_minibatch_sorted(tmp_path):
+    """
+    The starting centres are sampled from all the rows, so mini-batch mode
+    finds every group even when the first batch holds only one of them.
+    """
+    rng = np.random.default_rng(1)
+    blobs = np.array([[0., 0., 0.], [10., 0., 0.], [0., 10., 0.]])
+    points = np.concatenate([blob + rng.normal(0, 0.5, (60, 3)) for blob in blobs])
+    filename = tmp_path / 'sorted.csv'
+    np.savetxt(filename, points, delimiter=',')
+
+    centres = kmeans(filename, 3, 3, batch_size=16, seed=0, verbose=False).centres
+
+    distances = np.linalg.norm(centres[:, None] - blobs[None], axis=2)
+    assert np.all(distances.min(axis=0) < 1)
+
+
+class TestSeeding:
+    """
+    Tests for k-means++ seeding and multiple restarts.
+    """
+    def test_kmeans_plusplus_spreads_centres(self):
+        f1, _ = cluster_2data()
+        rng = np.random.default_rng(0)
+        centres = clustering_numpy.kmeans_plusplus(f1, 2, rng)
+        assert (centres[:, 0] > 0).sum() == 1
+
+    def test_seed_reproducible(self):
+        points = np.random.random((300, 3))
+        run1 = clustering_numpy.best_run(points, 4, 5, seed=7)
+        run2 = clustering_numpy.best_run(points, 4, 5, seed=7)
+        assert np.array_equal(run1[0], run2[0])
+        pure1 = clustering.best_run(list(map(tuple, points)), 4, 5, seed=7)
+        pure2 = clustering.best_run(list(map(tuple, points)), 4, 5, seed=7)
+        assert pure1[0] == pure2[0]
+
+    def test_n_init_keeps_lowest_inertia(self):
+        points = np.random.random((300, 3))
+        singles = [clustering_numpy.single_run(points, 5, 3, seed=run_seed)[3]
+                   for run_seed in np.random.SeedSequence(3).spawn(4)]
+        best = clustering_numpy.best_run(points, 5, 3, n_init=4, seed=3,
+                                         workers=2)
+        assert best[3] == min(singles)
+        pure = clustering.best_run(list(map(tuple, points)), 5, 3, n_init=2,
+                                   seed=3, workers=2)
+        assert pure[2] <= 3
+
+
+@pytest.mark.parametrize('dtype', [np.float64, np.float32])
+def test_hamerly_matches_lloyd(dtype):
+    """
+    The accelerated backend must give the same clusters as the standard one,
+    while computing fewer distances.
+    """
+    rng = np.random.default_rng(4)
+    regimes = rng.normal(size=(8, 3)) * 5
+    points = regimes[rng.integers(8, size=3000)] + rng.normal(size=(3000, 3))
+    points = points.astype(dtype)
+    start = clustering_numpy.kmeans_plusplus(points, 8, rng)
+    stats = {}
+    centres1, alloc1, n_iter1 = clustering_numpy.lloyd(points, start, 30)
+    centres2, alloc2, n_iter2 = clustering_hamerly.hamerly(points, start, 30,
+                                                           stats=stats)
+    assert np.array_equal(alloc1, alloc2)
+    assert np.allclose(centres1, centres2)
+    assert n_iter1 == n_iter2
+    assert stats['distances'] < stats['lloyd_distances']
+
+
+@pytest.mark.parametrize('seed', [237, 266])
+def test_hamerly_matches_lloyd_float32_ties(seed):
+    """
+    Float32 points far from the origin, whose distances are close to the
+    rounding error of the standard backend, are clustered the same.
+    """
+    rng = np.random.default_rng(seed)
+    n, k, d = int(rng.integers(50, 3000)), int(rng.integers(2, 20)), int(rng.integers(1, 5))
+    regimes = rng.normal(size=(k, d)) * rng.uniform(0.5, 10)
+    points = (regimes[rng.integers(k, size=n)] + rng.normal(size=(n, d)) * rng.uniform(0.1, 3)
+              + rng.uniform(-100, 100)).astype(np.float32)
+    start = clustering_numpy.kmeans_plusplus(points, k, rng)
+    centres1, alloc1, n_iter1 = clustering_numpy.lloyd(points, start, 100, 0)
+    centres2, alloc2, n_iter2 = clustering_hamerly.hamerly(points, start, 100, 0)
+    assert np.array_equal(alloc1, alloc2)
+    assert n_iter1 == n_iter2
+
+
+def test_pure_python_dimensions():
+    """
+    The pure python backend should work for any number of columns.
+    """
+    f1, indice1 = cluster_2data()
+    for dim in [1, 5]:
+        points = [tuple(row) for row in np.hstack([f1[:, :1]]*dim)]
+        centres, alloc, n_iter, _ = clustering.single_run(points, 2, 10, seed=0)
+        assert len(centres[0]) == dim
+        assert sorted(j for j, a in enumerate(alloc) if a == alloc[0]) in indice1
+
+
+class TestKmeansInMemory:
+    """
+    Tests for clustering points already held in memory.
+    """
+    def test_kmeans_array(self):
+        f1, indice1 = cluster_2data()
+        for backend in ['python', 'numpy', 'hamerly']:
+            result = kmeans(f1, 2, 10, backend=backend, seed=0, verbose=False)
+            assert result.labels.dtype == np.uint8
+            assert result.centres.shape == (2, 3)
+            assert result.n_iter <= 10
+            assert result.inertia > 0
+            assert sorted(result.indices) == indice1
+
+    def test_kmeans_memoryview_float32(self):
+        f1, indice1 = cluster_2data()
+        points = f1.astype(np.float32)
+        result = kmeans(memoryview(points), 2, 10, Numpy=True, seed=0,
+                        verbose=False)
+        assert result.centres.dtype == np.float32
+        assert sorted(list(result)) == indice1
+
+    def test_indices_cached(self):
+        result = KMeansResult(np.array([1, 0, 1]), np.array([[0.], [2.]]), 0.5, 2)
+        assert [result[i] for i in range(2)] == [[1], [0, 2]]
+        assert result.indices is result.indices
+        result.labels = np.array([0, 0, 1], dtype=np.uint8)
+        assert list(result) == [[0, 1], [2]]
+
+    def test_kmeans_quiet(self, capsys):
+        f1, _ = cluster_2data()
+        kmeans(f1, 2, 10, Numpy=True, verbose=False)
+        assert capsys.readouterr().out == ''
+        kmeans(f1, 2, 10, Numpy=True)
+        assert 'Cluster 1 is centred at' in capsys.readouterr().out
+
+
+class TestKMeansModel:
+    """
+    Tests for saving, loading and warm-starting cluster models.
+    """
+    def test_save_load_predict(self, tmp_path):
+        f1, indice1 = cluster_2data()
+        model = KMeansModel(clusters=2, seed=1, meta={'date': '2023-01-05'})
+        result = model.fit(f1, verbose=False)
+        model.save(tmp_path / 'model.json')
+
+        loaded = KMeansModel.load(tmp_path / 'model.json')
+        assert np.array_equal(loaded.centres, model.centres)
+        assert loaded.meta == {'date': '2023-01-05'}
+        assert np.array_equal(loaded.predict(f1), result.labels)
+
+        np.savetxt(tmp_path / 'day.csv', f1, delimiter=',')
+        assert np.array_equal(loaded.predict(tmp_path / 'day.csv'), result.labels)
+
+    def test_warm_start(self):
+        f1, indice1 = cluster_2data()
+        model = KMeansModel(clusters=2, seed=1)
+        model.fit(f1, verbose=False)
+        next_day = f1 + np.random.normal(0, 0.01, f1.shape)
+        result = model.fit(next_day, verbose=False)
+        assert result.n_iter <= 2
+        assert sorted(result.indices) == indice1
+
+    def test_predict_unfitted(self):
+        with pytest.raises(ValueError):
+            KMeansModel().predict(np.zeros((2, 3)))
+
+
+def test_parallel_matches_lloyd():
+    """
+    Splitting the assignment step over processes should not change the
+    clusters found.
+    """
+    f1, indice1 = cluster_2data()
+    points = np.vstack([f1, np.random.random((1000, 3))])
+    start = points[[0, 150, 250]]
+    centres1, alloc1, n_iter1 = clustering_numpy.lloyd(points, start, 20)
+    centres2, alloc2, n_iter2 = clustering_parallel.parallel_lloyd(
+        points, start, 20, workers=3)
+    assert np.array_equal(alloc1, alloc2)
+    assert np.allclose(centres1, centres2)
+    assert n_iter1 == n_iter2
+
+    result = kmeans(f1, 2, 10, backend='parallel', workers=2, seed=0,
+                    verbose=False)
+    assert sorted(result.indices) == indice1
+
+
+class TestSegment:
+    """
+    Tests for k-means segmentation of SatMaps.
+    """
+    def test_segment_georeferencing(self):
+        labels = segment(lir_0105_0, clusters=3, sample_size=50, tile_rows=3,
+                         seed=0)
+        assert labels.shape == lir_0105_0.shape
+        assert np.array_equal(labels.meta['xcoords'], lir_0105_0.meta['xcoords'])
+        assert np.array_equal(labels.meta['ycoords'], lir_0105_0.meta['ycoords'])
+        assert set(np.unique(labels.data)) == {0, 1, 2}
+        # Regions are numbered by increasing depth
+        assert lir_0105_0.data[labels.data == 0].max() < \
+            lir_0105_0.data[labels.data == 2].min()
+
+    def test_segment_several_maps(self):
+        depth = satmap.SatMap(meta_1, data_1 * 10.)
+        other = satmap.SatMap(meta_1, data_1[::-1].copy())
+        labels = segment([depth, other], clusters=3, seed=0)
+        assert labels.meta['instrument'] == 'lir,lir'
+        assert len(np.unique(labels.data)) == 3
+
+    def test_segment_packed(self):
+        labels = segment(lir_0105_0.pack(), clusters=3, sample_size=50, seed=0)
+        assert not dtypes.is_packed(labels.meta)
+        assert np.array_equal(dtypes.values(labels), labels.data)
+        assert np.array_equal(labels.data, segment(lir_0105_0, clusters=3,
+                                                   sample_size=50, seed=0).data)
+
+    def test_segment_nan(self):
+        data = lir_0105_0.data.copy()
+        data[0, 0] = np.nan
+        labels = segment(satmap.SatMap(lir_0105_0.meta, data), clusters=3, seed=0)
+        assert labels.data[0, 0] == 255
+        assert set(np.unique(labels.data[1:])) == {0, 1, 2}
+        assert np.array_equal(labels.data.reshape(-1)[1:],
+                              segment(lir_0105_0, clusters=3, seed=0).data.reshape(-1)[1:])
+
+    def test_segment_masked(self):
+        # Pixels without coverage hold zeros, which must not form a region.
+        valid = np.zeros(lir_0105_0.shape, dtype=bool)
+        valid[:, :10] = True
+        gaps = satmap.SatMap(lir_0105_0.meta, np.where(valid, lir_0105_0.data, 0.),
+                             mask=valid)
+        labels = segment(gaps, clusters=2, seed=0)
+        assert np.array_equal(labels.valid, valid)
+        assert (labels.data[~valid] == 255).all()
+        assert set(np.unique(labels.data[valid])) == {0, 1}
+
+    def test_segment_not_coregistered(self):
+        with pytest.raises(ValueError):
+            segment([map_1, map_2])
+
+
+class TestProfiling:
+    """
+    Tests for the opt-in instrumentation.
+    """
+    def setup_method(self):
+        profiling.reset()
+
+    def teardown_method(self):
+        profiling.disable()
+        profiling.reset()
+
+    def test_disabled_records_nothing(self):
+        profiling.disable()
+        map_1 + map_2
+        assert profiling.summary() == {}
+
+    def test_enabled_records_operations(self, tmp_path):
+        profiling.enable()
+        added = map_1 + map_2
+        satmap.get_satmap(prefix+'aigean_fan_20230105_135624.zip')
+        stats = profiling.summary()
+        assert stats['SatMap.__add__']['calls'] == 1
+        assert stats['SatMap.__add__']['pixels'] == added.data.size
+        assert stats['get_satmap[zip]']['bytes'] == fan_0105_0.data.nbytes
+
+        profiling.report(str(tmp_path / 'metrics.json'))
+        with open(tmp_path / 'metrics.json') as f:
+            assert json.load(f)['SatMap.__add__']['calls'] == 1
+
+        profiling.report(str(tmp_path / 'metrics.prom'))
+        text = (tmp_path / 'metrics.prom').read_text()
+        assert 'aigeanpy_operation_calls_total{operation="SatMap.__add__"} 1' in text
+
+
+
+class TestRendering:
+    """
+    Tests for the off-screen renderer and batch rendering.
+    """
+    def test_renderer_reuses_figure(self, tmp_path):
+        renderer = rendering.Renderer()
+        for m in [map_1, lir_0105_0, map_2]:
+            renderer.render(m, str(tmp_path / 'figure.png'))
+        # One image and one colorbar, whatever the number of maps drawn.
+        assert len(renderer.figure.axes) == 2
+        assert len(renderer.axes.images) == 1
+        assert renderer.image.get_extent() == [*map_2.meta['xcoords'],
+                                               *map_2.meta['ycoords']]
+        assert renderer.image.get_clim() == (map_2.data.min(), map_2.data.max())
+
+    def test_visualise_leaves_no_figures(self, tmp_path):
+        import matplotlib.pyplot as plt
+        plt.close('all')
+        name = lir_0105_0.visualise(save=True, savepath=str(tmp_path))
+        assert name == 'AigeanLir20230105135624.png'
+        assert (tmp_path / name).exists()
+        assert plt.get_fignums() == []
+
+    @pytest.mark.parametrize('workers', [1, 2])
+    def test_render_many(self, tmp_path, workers):
+        maps = [lir_0105_0, prefix+'aigean_man_20230105_135624.hdf5',
+                fan_0105_0]
+        paths = rendering.render_many(maps, str(tmp_path), workers=workers)
+        assert [os.path.basename(p) for p in paths] == [
+            'AigeanLir20230105135624.png', 'AigeanManannan20230105135624.png',
+            'AigeanFand20230105135624.png']
+        assert all(os.path.getsize(p) > 0 for p in paths)
+
+
+
+class TestQuicklook:
+    """
+    Tests for the matplotlib-free thumbnails.
+    """
+    def test_png_matches_colour_map(self, tmp_path):
+        import matplotlib
+        import matplotlib.image
+        name = quicklook.quicklook(lir_0105_0, str(tmp_path), size=64)
+        image = matplotlib.image.imread(str(tmp_path / name))
+        data = quicklook.decimate(lir_0105_0.data, 64)
+        assert image.shape == data.shape + (3,)
+        assert max(image.shape) <= 64
+        norm = matplotlib.colors.Normalize(data.min(), data.max())
+        expected = matplotlib.colormaps['viridis'](norm(data.astype(np.float32)))[..., :3]
+        assert np.abs(image - expected).max() <= 2 / 255
+
+    def test_fixed_range(self):
+        bright = quicklook.colourise(np.array([[0., 10.]]), vmin=0, vmax=20)
+        dark = quicklook.colourise(np.array([[10., 20.]]), vmin=0, vmax=20)
+        assert (bright[0, 1] == dark[0, 0]).all()
+        assert (quicklook.colourise(np.array([[-5., 25.]]), 0, 20) ==
+                quicklook.VIRIDIS[[0, -1]]).all()
+
+    def test_without_matplotlib(self):
+        code = ("import sys, aigeanpy.quicklook, aigeanpy.satmap; "
+                "print('matplotlib' in sys.modules)")
+        assert subprocess.run([sys.executable, '-c', code], check=True,
+                              capture_output=True, text=True).stdout.strip() == 'False'
+
+    def test_missing_values(self):
+        rgb = quicklook.colourise(np.array([[np.nan, 1., 2.]]))
+        assert (rgb[0, 0] == quicklook.VIRIDIS[0]).all()
+        assert (rgb[0, 2] == quicklook.VIRIDIS[-1]).all()
+
+
+
+class TestTiles:
+    """
+    Tests for the z/x/y tile export.
+    """
+    @staticmethod
+    def tile_map():
+        # 16 x 16 pixels, the eastern half without data.
+        data = np.arange(256, dtype=float).reshape(16, 16)
+        data[:, 8:] = np.nan
+        meta = {'date': '2023-01-05', 'time': '13:56:24', 'observatory': 'Aigean',
+                'instrument': 'Fand', 'resolution': 5,
+                'xcoords': [0, 80], 'ycoords': [0, 80]}
+        return satmap.SatMap(meta, data)
+
+    def test_reduce_ignores_missing(self):
+        level = np.array([[1, np.nan, np.nan], [3, np.nan, 4]], dtype=np.float32)
+        assert np.allclose(tiles.reduce(level), [[2, 4]])
+        assert np.isnan(tiles.reduce(np.full((2, 2), np.nan, dtype=np.float32))).all()
+
+    def test_tree_skips_empty_tiles(self, tmp_path):
+        counts = tiles.export_tiles(self.tile_map(), str(tmp_path), tile_size=4,
+                                    workers=1)
+        assert counts['max_zoom'] == 2
+        # Zoom 2 has 4 x 4 tiles, of which the eastern half are empty.
+        assert (tmp_path / '2' / '1' / '3.png').exists()
+        assert not (tmp_path / '2' / '2' / '0.png').exists()
+        assert counts['written'] == 1 + 2 + 8
+        assert counts['empty'] == 2 + 8
+
+    def test_incremental_export(self, tmp_path):
+        m = self.tile_map()
+        tiles.export_tiles(m, str(tmp_path), tile_size=4, vmin=0, vmax=300)
+        assert tiles.export_tiles(m, str(tmp_path), tile_size=4, vmin=0,
+                                  vmax=300)['written'] == 0
+        m.data[0, 0] += 1
+        # One tile changes on each zoom level.
+        counts = tiles.export_tiles(m, str(tmp_path), tile_size=4, vmin=0, vmax=300)
+        assert counts['written'] == 3
+        assert counts['unchanged'] == 8
+
+    def test_recomputes_changed_maps_only(self, tmp_path):
+        west = self.tile_map()
+        west.data[:, 8:] = 1.
+        east = satmap.SatMap(dict(west.meta, xcoords=[80, 160]), west.data * 2)
+        first = tiles.export_tiles([west, east], str(tmp_path / 'kept'), tile_size=4,
+                                   vmin=0, vmax=600, workers=1)
+        east.data[5, 5] = 7.
+        counts = tiles.export_tiles([west, east], str(tmp_path / 'kept'), tile_size=4,
+                                    vmin=0, vmax=600, workers=1)
+        # The eastern half of the tiles of each zoom level, down to the
+        # single tile of zoom 0.
+        assert counts['recomputed'] == 16 + 4 + 1 + 1 < first['recomputed']
+        assert counts['written'] == 4
+        tiles.export_tiles([west, east], str(tmp_path / 'fresh'), tile_size=4,
+                           vmin=0, vmax=600, workers=1)
+        kept = sorted(p.relative_to(tmp_path / 'kept') for p in (tmp_path / 'kept').rglob('*')
+                      if p.suffix in ('.png', '.npy'))
+        fresh = sorted(p.relative_to(tmp_path / 'fresh') for p in (tmp_path / 'fresh').rglob('*')
+                       if p.suffix in ('.png', '.npy'))
+        assert kept == fresh
+        for path in kept:
+            assert (tmp_path / 'kept' / path).read_bytes() == \
+                (tmp_path / 'fresh' / path).read_bytes()
+
+    def test_no_data(self, tmp_path):
+        m = self.tile_map()
+        m.data[...] = np.nan
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            counts = tiles.export_tiles(m, str(tmp_path), tile_size=4, workers=1)
+        assert counts['written'] == 0 and counts['empty'] == 21
+
+    def test_parallel_matches_serial(self, tmp_path):
+        tiles.export_tiles(self.tile_map(), str(tmp_path / 'serial'), tile_size=4,
+                           workers=1)
+        tiles.export_tiles(self.tile_map(), str(tmp_path / 'parallel'), tile_size=4,
+                           workers=2)
+        for png in (tmp_path / 'serial').rglob('*.png'):
+            twin = tmp_path / 'parallel' / png.relative_to(tmp_path / 'serial')
+            assert png.read_bytes() == twin.read_bytes()
+
+
+
+class TestTemporalStats:
+    """
+    Tests for the streaming per-pixel statistics.
+    """
+    @staticmethod
+    def history(days=8):
+        rng = np.random.default_rng(0)
+        meta = {'date': '2023-01-01', 'time': '12:00:00', 'observatory': 'Aigean',
+                'instrument': 'Lir', 'resolution': 30,
+                'xcoords': [0, 300], 'ycoords': [0, 240]}
+        maps = []
+        for day in range(days):
+            data = rng.normal(500 - 3 * day, 5, (8, 10))
+            data[rng.random(data.shape) < 0.2] = np.nan
+            maps.append(satmap.SatMap(dict(meta, date=f'2023-01-{day + 1:02d}'), data))
+        return maps
+
+    def test_matches_numpy(self):
+        maps = self.history()
+        stats = TemporalStats()
+        for m in maps:
+            stats.update(m)
+        values = np.array([m.data for m in maps])
+        results = stats.results()
+        assert np.allclose(results['mean'].data, np.nanmean(values, axis=0))
+        assert np.allclose(results['variance'].data, np.nanvar(values, axis=0, ddof=1))
+        assert np.allclose(results['min'].data, np.nanmin(values, axis=0))
+        assert np.allclose(results['max'].data, np.nanmax(values, axis=0))
+        days = np.arange(len(maps))
+        valid = np.isfinite(values[:, 0, 0])
+        slope = np.polyfit(days[valid], values[valid, 0, 0], 1)[0]
+        assert np.isclose(stats.trend(per_days=1).data[0, 0], slope)
+        assert results['trend'].meta['date'] == '2023-01-08'
+
+    def test_merge_and_checkpoint(self, tmp_path):
+        maps = self.history()
+        whole, first, second = TemporalStats(), TemporalStats(), TemporalStats()
+        for i, m in enumerate(maps):
+            whole.update(m)
+            (first if i < 3 else second).update(m)
+        first.save(str(tmp_path / 'first.npz'))
+        merged = TemporalStats.load(str(tmp_path / 'first.npz')).merge(second)
+        assert merged.observations == whole.observations
+        for name in ['mean', 'variance', 'trend', 'minimum']:
+            assert np.allclose(getattr(merged, name)().data, getattr(whole, name)().data,
+                               equal_nan=True)
+
+    def test_different_area(self):
+        stats = TemporalStats()
+        stats.update(map_1)
+        with pytest.raises(ValueError):
+            stats.update(map_2)
+
+    def test_accumulate_resumes(self, tmp_path):
+        filenames = []
+        for i, m in enumerate(self.history(4)):
+            filenames.append(str(tmp_path / f'aigean_lir_{i}.zip'))
+            meta = {key: np.asarray(value).tolist() for key, value in m.meta.items()}
+            with zipfile.ZipFile(filenames[-1], 'w') as zf:
+                with zf.open('observation.npy', 'w') as f:
+                    np.save(f, m.data)
+                zf.writestr('metadata.json', json.dumps(meta))
+        checkpoint = str(tmp_path / 'stats.npz')
+        accumulate(filenames[:2], checkpoint=checkpoint)
+        resumed = accumulate(filenames, checkpoint=checkpoint)
+        parallel = accumulate(filenames, workers=2)
+        assert resumed.observations == parallel.observations == 4
+        assert np.allclose(resumed.mean().data, parallel.mean().data, equal_nan=True)
+
+
+class TestSample:
+    """
+    Tests for sampling maps at points.
+    """
+    prefix = 'aigeanpy/tests/test-files/'
+    files = ['aigean_lir_20230105_135624.asdf', 'aigean_man_20230105_135624.hdf5',
+             'aigean_fan_20230105_135624.zip']
+
+    def test_nearest_matches_earth_to_pixel(self):
+        lir = satmap.get_satmap(self.prefix + self.files[0])
+        rng = np.random.default_rng(0)
+        points = rng.uniform([501, 1], [1099, 299], (50, 2))
+        expected = [lir.data[lir.earth_to_pixel(x, y)] for x, y in points]
+        assert np.array_equal(lir.sample(points), expected)
+
+    def test_bilinear_plane(self):
+        meta = {'date': '2022-12-01', 'time': '21:43:42', 'instrument': 'lir',
+                'resolution': 10, 'xcoords': [0, 50], 'ycoords': [0, 40]}
+        rows, cols = np.mgrid[:4, :5]
+        points = np.array([[5, 35], [12.5, 21], [33, 6], [45, 5]])
+        # A plane through the pixel centres is interpolated exactly.
+        plane = satmap.SatMap(meta, 2. * cols - 3. * rows)
+        x, y = points.T
+        expected = 2 * (x / 10 - 0.5) - 3 * ((40 - y) / 10 - 0.5)
+        assert np.allclose(plane.sample(points, 'bilinear'), expected)
+        assert np.allclose(plane.pack().sample(points, 'bilinear'), expected, atol=1e-3)
+        masked = satmap.SatMap(meta, plane.data, mask=(rows != 1) | (cols != 1))
+        assert np.isnan(masked.sample(points, 'bilinear')).tolist() == [False, True, False, False]
+        assert np.isnan(masked.sample([[15, 25], [-1, 5]])).all()
+        with pytest.raises(ValueError):
+            plane.sample(points, 'cubic')
+        with pytest.raises(ValueError):
+            plane.sample([[-1, -1]], 'cubic')
+
+    @pytest.mark.parametrize('method', ['nearest', 'bilinear'])
+    def test_windowed_files(self, method):
+        points = np.array([[100, 300], [510, 150], [1000, 100], [800, 280], [100, 420], [5000, 0]])
+        filenames = [self.prefix + f for f in self.files]
+        values = satmap.sample_maps(filenames, points, method)
+        expected = [satmap.get_satmap(f).sample(points, method) for f in filenames]
+        assert values.shape == (3, 6)
+        assert np.allclose(values, expected, equal_nan=True)
+        assert np.isnan(values[:, -1]).all()
+
+    def test_bad_file_raises(self, tmp_path):
+        """
+        Only files missing the points give NaN; other errors are raised.
+        """
+        filename = str(tmp_path / 'aigean_lir_20230105_135624.zip')
+        meta = {'date': '2023-01-05', 'time': '13:56:24', 'instrument': 'Lir',
+                'resolution': 'thirty', 'xcoords': [0, 60], 'ycoords': [0, 60]}
+        with zipfile.ZipFile(filename, 'w') as zf:
+            with zf.open('observation.npy', 'w') as f:
+                np.save(f, np.ones((2, 2)))
+            zf.writestr('metadata.json', json.dumps(meta))
+        with pytest.raises(ValueError):
+            satmap.sample_maps([filename], [[10, 10]])
+        assert np.isnan(satmap.sample_maps([self.prefix + self.files[0]], [[0, 0]])).all()
+
+
+class TestEcne:
+    """
+    Tests for the columnar tables of Ecne measurements.
+    """
+    filename = 'aigeanpy/tests/test-files/aigean_ecn_20230105_135624.csv'
+
+    def test_matches_read_csv(self):
+        table = get_ecne(self.filename)
+        rows = np.array(read_csv(self.filename), dtype=float)
+        assert len(table) == len(rows)
+        assert np.array_equal(table['salinity'], rows[:, 1])
+        assert table['salinity'].flags['C_CONTIGUOUS']
+        assert table['date'][0] == np.datetime64('2023-01-05T13:56:24')
+
+    def test_many_files(self, tmp_path):
+        rng = np.random.default_rng(0)
+        filenames = []
+        for day in [5, 6, 7]:
+            filenames.append(str(tmp_path / f'aigean_ecn_202301{day:02d}_120000.csv'))
+            with open(filenames[-1], 'w') as f:
+                f.write('x,y,turbulence,salinity,algal_density\n')
+                for x, y in [(0, 0), (100, 0), (0, 100)]:
+                    f.write(f'{x},{y},{rng.random()},{30 + day},{rng.random()}\n')
+        table = get_ecne(filenames)
+        assert len(table) == 9
+        days, salinity = table.group('day', 'salinity')
+        assert np.array_equal(salinity, [35, 36, 37])
+        assert days[0] == np.datetime64('2023-01-05')
+        (stations, days), counts = table.group(('station', 'day'), 'salinity', 'count')
+        assert len(counts) == 9 and (counts == 1).all()
+        assert len(table.filter(day=('2023-01-06', None), x=0)) == 4
+
+        distances, station = table.nearest([90, 10])
+        assert np.array_equal(table.stations[station], [100, 0])
+        assert np.isclose(distances, np.hypot(10, 10))
+        assert len(table.within([0, 0], 100)) == 3
+        assert len(table.at(table.within([0, 0], 50))) == 3
+
+    def test_first_row_not_a_header(self, tmp_path):
+        filename = tmp_path / 'aigean_ecn_20230105_120000.csv'
+        filename.write_text('1e-3,2.5,nan\n0.5,inf,3\n')
+        table = get_ecne(str(filename))
+        assert table.names == ['turbulence', 'salinity', 'algal_density', 'date']
+        assert table['turbulence'].tolist() == [1e-3, 0.5]
+        assert np.isnan(table['algal_density'][0])
+
+    def test_no_locations(self):
+        with pytest.raises(ValueError):
+            get_ecne(self.filename).nearest([0, 0])
+
+
+class TestStartup:
+    """
+    The console scripts must not import the heavy dependencies up front.
+    """
+    # Seconds allowed for importing a console script, well above the ~0.3s
+    # it takes with numpy alone, and well below the ~3s of importing
+    # matplotlib, scikit-image, asdf and h5py as well.
+    IMPORT_BUDGET = 1.5
+
+    @pytest.mark.parametrize('script', ['aigean_metadata', 'aigean_mosaic',
+                                        'aigean_today'])
+    def test_script_imports_are_lazy(self, script):
+        code = ("import sys, aigeanpy." + script + "; print(' '.join(m for m in "
+                "('matplotlib', 'skimage', 'asdf', 'h5py') if m in sys.modules))")
+        loaded = subprocess.run([sys.executable, '-c', code], check=True,
+                                capture_output=True, text=True).stdout.split()
+        assert loaded == []
+
+    def test_import_time_budget(self):
+        code = ("import time; tic = time.perf_counter(); "
+                "import aigeanpy.aigean_metadata; print(time.perf_counter() - tic)")
+        seconds = min(float(subprocess.run([sys.executable, '-c', code], check=True,
+                                           capture_output=True, text=True).stdout)
+                      for _ in range(3))
+        assert seconds < self.IMPORT_BUDGET
+
+    def test_lazy_package_attributes(self):
+        import aigeanpy
+        assert aigeanpy.get_satmap is satmap.get_satmap
+        assert aigeanpy.satmap is satmap
+        with pytest.raises(AttributeError):
+            aigeanpy.not_a_function
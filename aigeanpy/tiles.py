@@ -0,0 +1,392 @@
+"""
+Export of SatMaps as a z/x/y tree of PNG tiles, for web maps.
+
+The maps are laid on one canvas at the finest of their resolutions, which is
+the most detailed zoom level; each coarser level halves the resolution of
+the one below it (a reduction pyramid), down to a single tile at zoom 0.
+Tile (x, y) of zoom z is written to `outdir/z/x/y.png`, with x growing
+eastwards and y southwards from the north-west corner of the maps.
+
+Pixels no map covers are transparent, and tiles without any data are not
+written. The levels of the pyramid are kept with the tiles, and a manifest
+keeps a hash of every map and of the data behind every tile, so exporting
+again only recomputes the parts of the pyramid, and the tiles, under the
+maps that changed, and only rewrites the tiles whose data changed.
+"""
+import os
+import json
+import hashlib
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from aigeanpy import profiling, dtypes
+from aigeanpy.quicklook import colourise, write_png
+
+MANIFEST = 'tiles.json'
+# Directory, in the tile tree, of the levels of the pyramid.
+PYRAMID = 'pyramid'
+
+
+def _grid(maps):
+    """
+    Resolution, west and north edges, and shape of the canvas of maps.
+    """
+    resolution = float(min(m.meta['resolution'] for m in maps))
+    west = float(min(m.meta['xcoords'][0] for m in maps))
+    east = float(max(m.meta['xcoords'][1] for m in maps))
+    south = float(min(m.meta['ycoords'][0] for m in maps))
+    north = float(max(m.meta['ycoords'][1] for m in maps))
+    shape = (int(np.ceil((north - south) / resolution)),
+             int(np.ceil((east - west) / resolution)))
+    return resolution, west, north, shape
+
+
+def _footprint(m, grid):
+    """
+    The pixels of the canvas a map covers, as (first row, last row + 1,
+    first column, last column + 1).
+    """
+    resolution, west, north, shape = grid
+    factor = m.meta['resolution'] / resolution
+    row = int(round((north - m.meta['ycoords'][1]) / resolution))
+    col = int(round((m.meta['xcoords'][0] - west) / resolution))
+    rows = min(int(round(m.data.shape[0] * factor)), shape[0] - row)
+    cols = min(int(round(m.data.shape[1] * factor)), shape[1] - col)
+    return row, row + rows, col, col + cols
+
+
+def _paint(part, m, grid, window):
+    """
+    Lays a map on `part`, the window (first row, last row + 1, first column,
+    last column + 1) of the canvas. Only pixels with data cover what is
+    already there.
+    """
+    factor = m.meta['resolution'] / grid[0]
+    row, row_end, col, col_end = _footprint(m, grid)
+    r0, r1 = max(row, window[0]), min(row_end, window[1])
+    c0, c1 = max(col, window[2]), min(col_end, window[3])
+    if r0 >= r1 or c0 >= c1:
+        return
+    if factor == 1:
+        index = (slice(r0 - row, r1 - row), slice(c0 - col, c1 - col))
+    else:
+        index = np.ix_(((np.arange(r0, r1) - row) / factor).astype(int),
+                       ((np.arange(c0, c1) - col) / factor).astype(int))
+    data = m.data[index]
+    if dtypes.is_packed(m.meta):
+        data = dtypes.unpack(data, m.meta, np.float32)
+    target = part[r0 - window[0]:r1 - window[0], c0 - window[2]:c1 - window[2]]
+    valid = np.isfinite(data)
+    if m.mask is not None:
+        valid &= m.valid[index]
+    if valid.all():
+        target[...] = data
+    else:
+        target[valid] = data[valid]
+
+
+def compose(maps):
+    """
+    Lays SatMaps on one canvas at the finest of their resolutions, later
+    maps covering earlier ones where they overlap.
+
+    Coarser maps are enlarged by repeating their pixels (nearest neighbour),
+    and every map is placed to the nearest pixel of the canvas. Pixels
+    masked out, or NaN, leave what is under them.
+
+    Returns
+    -------
+    canvas : numpy array
+        float32 image, NaN where no map has data. Row 0 is the northern edge.
+    resolution : float
+        size of the canvas' pixels, in meters.
+    origin : tuple
+        (west, north) coordinates of the canvas' corner, in meters.
+    """
+    grid = _grid(maps)
+    resolution, west, north, shape = grid
+    canvas = np.full(shape, np.nan, dtype=np.float32)
+    for m in maps:
+        _paint(canvas, m, grid, (0, shape[0], 0, shape[1]))
+    return canvas, resolution, (west, north)
+
+
+def reduce(level):
+    """
+    Halves the resolution of an image, each pixel becoming the mean of the
+    (up to four) pixels with data it replaces, or NaN if none has.
+    """
+    rows, cols = level.shape
+    padded = np.full((rows + rows % 2, cols + cols % 2), np.nan, dtype=np.float32)
+    padded[:rows, :cols] = level
+    quarters = [padded[i::2, j::2] for i in (0, 1) for j in (0, 1)]
+    sums = np.zeros(quarters[0].shape, dtype=np.float32)
+    counts = np.zeros(quarters[0].shape, dtype=np.float32)
+    for quarter in quarters:
+        valid = np.isfinite(quarter)
+        sums += np.where(valid, quarter, 0)
+        counts += valid
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # 0 / 0 gives NaN where no pixel had data.
+        return sums / counts
+
+
+def pyramid(canvas, tile_size: int = 256):
+    """
+    The levels of the reduction pyramid, from zoom 0 (the whole canvas in one
+    tile) to the full resolution.
+    """
+    max_zoom = max(0, int(np.ceil(np.log2(max(canvas.shape) / tile_size))))
+    levels = [canvas]
+    for _ in range(max_zoom):
+        levels.append(reduce(levels[-1]))
+    return levels[::-1]
+
+
+def _tile(level, x: int, y: int, tile_size: int):
+    """
+    Tile (x, y) of a level, padded with NaN at the edges of the canvas.
+    """
+    data = level[y * tile_size:(y + 1) * tile_size, x * tile_size:(x + 1) * tile_size]
+    if data.shape == (tile_size, tile_size):
+        return data
+    tile = np.full((tile_size, tile_size), np.nan, dtype=np.float32)
+    tile[:data.shape[0], :data.shape[1]] = data
+    return tile
+
+
+def _write_tile(args):
+    path, tile, vmin, vmax = args
+    rgba = np.empty(tile.shape + (4,), dtype=np.uint8)
+    rgba[..., :3] = colourise(tile, vmin, vmax)
+    rgba[..., 3] = np.where(np.isfinite(tile), 255, 0)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    write_png(path, rgba)
+    return path
+
+
+def _fingerprint(m):
+    """
+    Hash of the data, mask and placement of a map.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr((np.asarray(m.meta['xcoords']).tolist(),
+                        np.asarray(m.meta['ycoords']).tolist(),
+                        float(m.meta['resolution']), m.data.shape,
+                        str(m.data.dtype), sorted(
+                            (key, m.meta[key]) for key in dtypes.PACKING_KEYS
+                            if key in m.meta))).encode())
+    digest.update(np.ascontiguousarray(m.data).data)
+    if m.mask is not None:
+        digest.update(np.ascontiguousarray(m.mask).data)
+    return digest.hexdigest()
+
+
+def _value_range(level):
+    """
+    The minimum and maximum of an image, or (0, 1) if it has no data.
+    """
+    finite = np.isfinite(level)
+    if not finite.any():
+        return 0.0, 1.0
+    return (float(np.min(level, where=finite, initial=np.inf)),
+            float(np.max(level, where=finite, initial=-np.inf)))
+
+
+def _write_manifest(path, manifest):
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f)
+    os.replace(path + '.tmp', path)
+
+
+def _update(levels, maps, grid, regions):
+    """
+    Recomposes the given regions of the finest level of a pyramid, and the
+    parts of the coarser levels over them.
+
+    Returns
+    -------
+    list
+        the regions changed on each level, from zoom 0.
+    """
+    changed = [regions]
+    for r0, r1, c0, c1 in regions:
+        part = np.full((r1 - r0, c1 - c0), np.nan, dtype=np.float32)
+        for m in maps:
+            _paint(part, m, grid, (r0, r1, c0, c1))
+        levels[-1][r0:r1, c0:c1] = part
+    for zoom in range(len(levels) - 2, -1, -1):
+        regions = [(r0 // 2, -(-r1 // 2), c0 // 2, -(-c1 // 2))
+                   for r0, r1, c0, c1 in regions]
+        for r0, r1, c0, c1 in regions:
+            levels[zoom][r0:r1, c0:c1] = reduce(
+                levels[zoom + 1][2 * r0:2 * r1, 2 * c0:2 * c1])
+        changed.insert(0, regions)
+    return changed
+
+
+@profiling.instrument('export_tiles')
+def export_tiles(maps, outdir: str, tile_size: int = 256, workers: int = None,
+                 vmin: float = None, vmax: float = None):
+    """
+    Writes SatMaps as a z/x/y tree of PNG tiles, for all zoom levels.
+
+    The levels of the pyramid are kept in `outdir`, with a hash of every map
+    and of every tile. Exporting again to the same directory, with the maps
+    on the same canvas, only recomposes the parts of the canvas under the
+    maps that changed, only recomputes the tiles over them, and only
+    rewrites those whose data changed.
+
+    Parameters
+    ----------
+    maps : SatMap or list of SatMap
+        the maps to export; several maps are mosaicked, later ones on top.
+    outdir : str
+        directory of the tile tree. A manifest of the tiles written is kept
+        there, so that running the export again only rewrites the tiles
+        whose data changed and removes those left without data.
+    tile_size : int, optional
+        side of the tiles in pixels. The default is 256.
+    workers : int, optional
+        number of processes encoding the tiles; one per core by default.
+    vmin, vmax : float, optional
+        the values mapped to the ends of the colour map. They default to the
+        range of the data; fix them so that adding a map with a different
+        range does not change the colours, and so rewrite, every tile.
+
+    Returns
+    -------
+    dict
+        number of tiles 'recomputed', of those 'written', 'unchanged' in
+        all, 'removed' and 'empty' (skipped for lack of data, among those
+        recomputed), and the 'max_zoom' level.
+
+    """
+    if not isinstance(maps, (list, tuple)):
+        maps = [maps]
+    grid = _grid(maps)
+    resolution, west, north, shape = grid
+    max_zoom = max(0, int(np.ceil(np.log2(max(shape) / tile_size))))
+    sources = [{'hash': _fingerprint(m), 'footprint': list(_footprint(m, grid))}
+               for m in maps]
+
+    manifest_path = os.path.join(outdir, MANIFEST)
+    previous = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            previous = json.load(f)
+    layout = {'tile_size': tile_size, 'resolution': resolution,
+              'origin': [west, north], 'shape': list(shape), 'max_zoom': max_zoom}
+    cache = [os.path.join(outdir, PYRAMID, f'{zoom}.npy') for zoom in range(max_zoom + 1)]
+    incremental = (all(previous.get(key) == value for key, value in layout.items())
+                   and len(previous.get('sources') or []) == len(sources)
+                   and all(os.path.exists(path) for path in cache))
+
+    if incremental:
+        regions = []
+        for new, old in zip(sources, previous['sources']):
+            if new['hash'] != old['hash']:
+                regions += [tuple(new['footprint']), tuple(old['footprint'])]
+        regions = [r for r in dict.fromkeys(regions) if r[0] < r[1] and r[2] < r[3]]
+        # The cache is out of step with the manifest until the update ends.
+        _write_manifest(manifest_path, dict(previous, sources=None))
+        levels = [np.load(path, mmap_mode='r+') for path in cache]
+        changed = _update(levels, maps, grid, regions)
+    else:
+        canvas, _, _ = compose(maps)
+        levels = pyramid(canvas, tile_size)
+        os.makedirs(os.path.join(outdir, PYRAMID), exist_ok=True)
+        for name in os.listdir(os.path.join(outdir, PYRAMID)):
+            os.remove(os.path.join(outdir, PYRAMID, name))
+        for level, path in zip(levels, cache):
+            np.save(path, level)
+        changed = [[(0, level.shape[0], 0, level.shape[1])] for level in levels]
+
+    if vmin is None or vmax is None:
+        low, high = _value_range(levels[-1])
+        vmin = low if vmin is None else vmin
+        vmax = high if vmax is None else vmax
+    settings = repr((vmin, vmax, tile_size))
+    if settings != previous.get('settings'):
+        # Every tile is coloured differently.
+        changed = [[(0, level.shape[0], 0, level.shape[1])] for level in levels]
+
+    old_tiles = previous.get('tiles', {})
+    tiles = dict(old_tiles) if incremental else {}
+    tasks, recomputed, empty = [], 0, 0
+    for zoom, (level, regions) in enumerate(zip(levels, changed)):
+        keys = set()
+        for r0, r1, c0, c1 in regions:
+            keys.update((x, y) for y in range(r0 // tile_size, -(-r1 // tile_size))
+                        for x in range(c0 // tile_size, -(-c1 // tile_size)))
+        for x, y in sorted(keys):
+            recomputed += 1
+            key = f'{zoom}/{x}/{y}'
+            tile = _tile(level, x, y, tile_size)
+            if not np.isfinite(tile).any():
+                empty += 1
+                tiles.pop(key, None)
+                continue
+            tiles[key] = hashlib.blake2b(tile.tobytes() + settings.encode(),
+                                         digest_size=16).hexdigest()
+            path = os.path.join(outdir, str(zoom), str(x), f'{y}.png')
+            if old_tiles.get(key) != tiles[key] or not os.path.exists(path):
+                tasks.append((path, np.array(tile), vmin, vmax))
+    for level in levels:
+        if isinstance(level, np.memmap):
+            level.flush()
+
+    workers = max(1, min(workers or os.cpu_count() or 1, len(tasks)))
+    if workers == 1:
+        for task in tasks:
+            _write_tile(task)
+    else:
+        with ProcessPoolExecutor(workers) as executor:
+            list(executor.map(_write_tile, tasks,
+                              chunksize=max(1, len(tasks) // (workers * 4))))
+
+    removed = 0
+    for key in set(old_tiles) - set(tiles):
+        path = os.path.join(outdir, *key.split('/')) + '.png'
+        if os.path.exists(path):
+            os.remove(path)
+            removed += 1
+            # Removes the column and zoom directories if they are now empty.
+            for directory in (os.path.dirname(path), os.path.dirname(os.path.dirname(path))):
+                try:
+                    os.rmdir(directory)
+                except OSError:
+                    break
+
+    os.makedirs(outdir, exist_ok=True)
+    _write_manifest(manifest_path, dict(layout, settings=settings, sources=sources,
+                                        tiles=tiles))
+
+    return {'recomputed': recomputed, 'written': len(tasks),
+            'unchanged': len(tiles) - len(tasks), 'removed': removed,
+            'empty': empty, 'max_zoom': max_zoom}
+
+
+def process():
+    """
+    function to create command line interface
+    """
+    from aigeanpy.satmap import get_satmap
+
+    parser = ArgumentParser(description='Export SatMaps as a z/x/y tree of PNG tiles')
+    parser.add_argument('filename', nargs='+', help='Files of the maps to export')
+    parser.add_argument('--outdir', default='tiles', help='Directory of the tiles')
+    parser.add_argument('--tile-size', type=int, default=256)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--vmin', type=float, default=None)
+    parser.add_argument('--vmax', type=float, default=None)
+    arguments = parser.parse_args()
+    counts = export_tiles([get_satmap(f) for f in arguments.filename],
+                          arguments.outdir, arguments.tile_size, arguments.workers,
+                          arguments.vmin, arguments.vmax)
+    print(f"{counts['written']} tiles written, {counts['unchanged']} unchanged, "
+          f"{counts['removed']} removed, zoom levels 0 to {counts['max_zoom']}.")
+
+
+if __name__ == "__main__":
+    process()
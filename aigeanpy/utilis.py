@@ -17,6 +17,15 @@ def get_meta(meta_dict):
     return meta
 
 
+def figure_name(meta):
+    """
+    Name of the image file of a SatMap, made of its observatory, instrument,
+    date and time, e.g. 'aigeanlir20221201214342.png'.
+    """
+    return (meta['observatory'] + meta['instrument'] +
+            meta['date'].replace('-', '') + meta['time'].replace(':', '') + '.png')
+
+
 def read_csv(filename: Union[Path, str]):
 
     lines = open(filename, 'r').readlines()
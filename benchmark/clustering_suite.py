@@ -0,0 +1,200 @@
+"""
+Scaling benchmark of the k-means backends.
+
+For every number of points, number of clusters and dimensionality in the
+sweep, uniform random points are clustered with each backend, and the
+throughput is reported as points per second per iteration. Parsing the CSV
+file is timed on its own, from a file written once per data set, so the
+clustering times contain only the clustering. The parallel backend is run
+for every worker count in the sweep.
+
+Results are written as JSON, and optionally plotted.
+
+    python benchmark/clustering_suite.py --n 1e3 1e5 1e7 --k 3 16 --dims 2 8 \\
+        --workers 1 4 --output clustering.json --plot clustering.png
+
+To benchmark a new backend, add it to BACKENDS.
+"""
+from aigeanpy import clustering
+from aigeanpy.analysis import _load_points
+from aigeanpy.clustering_numpy import lloyd
+from aigeanpy.clustering_hamerly import hamerly
+from aigeanpy.clustering_parallel import parallel_lloyd
+from aigeanpy.utilis import read_csv
+from argparse import ArgumentParser
+from timeit import default_timer as timer
+import numpy as np
+import platform
+import tempfile
+import json
+import sys
+import os
+
+
+def _python_fit(points, k, iterations, workers):
+    # The pure-Python backend seeds its own centres; 'random' seeding costs
+    # next to nothing, so the time is that of the iterations.
+    return clustering.single_run(points, k, iterations, 'random', seed=0)[2]
+
+
+def _kernel_fit(kernel):
+    def fit(points, k, iterations, workers):
+        # tol=0, so the iterations only stop when no point changes cluster.
+        return kernel(points, points[:k].copy(), iterations, tol=0)[2]
+    return fit
+
+
+def _parallel_fit(points, k, iterations, workers):
+    return parallel_lloyd(points, points[:k].copy(), iterations, tol=0,
+                          workers=workers)[2]
+
+
+def _python_points(data):
+    return [tuple(row) for row in data.tolist()]
+
+
+# Name: (parser of a CSV file, conversion of an in-memory array to the
+# backend's input, fit returning the number of iterations made, whether the
+# backend uses the worker count).
+BACKENDS = {'python': (read_csv, _python_points, _python_fit, False),
+            'numpy': (_load_points, np.asarray, _kernel_fit(lloyd), False),
+            'hamerly': (_load_points, np.asarray, _kernel_fit(hamerly), False),
+            'parallel': (_load_points, np.asarray, _parallel_fit, True)}
+
+
+def time_once(function, *args):
+    """
+    Runs the function once, returning its result and the time it took.
+    """
+    tic = timer()
+    result = function(*args)
+    toc = timer()
+    return result, toc - tic
+
+
+def run(n_values, k_values, dims_values, workers_values, backends,
+        iterations: int = 10, repeat: int = 3, parse_max: int = 10**6,
+        python_max: int = 10**5, seed: int = 0):
+    """
+    Runs the sweep, returning a list with one record per backend and setting.
+
+    Parsing is timed for data sets of at most `parse_max` points, and the
+    pure-Python backend only runs up to `python_max` points. The fit time
+    recorded is the fastest of `repeat` runs.
+    """
+    rng = np.random.default_rng(seed)
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for n in n_values:
+            for dims in dims_values:
+                data = rng.random((n, dims))
+                path = None
+                if n <= parse_max:
+                    path = os.path.join(workdir, f'points_{n}_{dims}.csv')
+                    np.savetxt(path, data, delimiter=',')
+                parse_times = {}
+
+                for backend in backends:
+                    parse, convert, fit, uses_workers = BACKENDS[backend]
+                    if backend == 'python' and n > python_max:
+                        continue
+                    if path is not None and parse not in parse_times:
+                        parse_times[parse] = time_once(parse, path)[1]
+                    points = convert(data)
+
+                    for k in k_values:
+                        if k > n:
+                            continue
+                        for workers in (workers_values if uses_workers else [1]):
+                            times, n_iter = [], 0
+                            for _ in range(repeat):
+                                n_iter, seconds = time_once(fit, points, k,
+                                                            iterations, workers)
+                                times.append(seconds)
+                            fit_seconds = min(times)
+                            record = {'backend': backend, 'n': n, 'k': k,
+                                      'dims': dims, 'workers': workers,
+                                      'parse_seconds': parse_times.get(parse),
+                                      'fit_seconds': fit_seconds,
+                                      'n_iter': n_iter,
+                                      'points_per_second': n * n_iter / fit_seconds}
+                            results.append(record)
+                            print(f"{backend:<9} n={n:<9} k={k:<4} d={dims:<3} "
+                                  f"workers={workers:<3} "
+                                  f"{record['points_per_second']/1e6:9.3f} M points/s/iter"
+                                  + (f"   parse {record['parse_seconds']:.3f} s"
+                                     if record['parse_seconds'] is not None else ''))
+                    del points
+                if path is not None:
+                    os.remove(path)
+    return results
+
+
+def plot(results, filename: str):
+    """
+    Plots the throughput of each backend against the number of points, for
+    the first k and dimensionality of the sweep and the most workers.
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    k, dims = results[0]['k'], results[0]['dims']
+    fig, ax = plt.subplots()
+    for backend in dict.fromkeys(r['backend'] for r in results):
+        records = [r for r in results if r['backend'] == backend and
+                   r['k'] == k and r['dims'] == dims]
+        workers = max(r['workers'] for r in records)
+        records = [r for r in records if r['workers'] == workers]
+        label = backend if backend != 'parallel' else f'{backend} ({workers} workers)'
+        ax.loglog([r['n'] for r in records],
+                  [r['points_per_second'] for r in records], marker='.', label=label)
+    ax.set_xlabel('number of points')
+    ax.set_ylabel('points per second per iteration')
+    ax.set_title(f'k-means throughput, k={k}, {dims} dimensions')
+    ax.legend()
+    fig.savefig(filename)
+    plt.close(fig)
+
+
+def main(argv=None):
+    count = lambda text: int(float(text))  # accepts 1e7
+    parser = ArgumentParser(description='Benchmark the k-means backends')
+    parser.add_argument('--n', type=count, nargs='+', default=[10**3, 10**4, 10**5, 10**6],
+                        help='Numbers of points')
+    parser.add_argument('--k', type=int, nargs='+', default=[3, 8, 32],
+                        help='Numbers of clusters')
+    parser.add_argument('--dims', type=int, nargs='+', default=[2, 3, 8],
+                        help='Dimensionalities of the points')
+    parser.add_argument('--workers', type=int, nargs='+',
+                        default=sorted({1, os.cpu_count() or 1}),
+                        help='Worker counts for the parallel backend')
+    parser.add_argument('--backends', nargs='+', default=list(BACKENDS),
+                        choices=list(BACKENDS))
+    parser.add_argument('--iterations', type=int, default=10,
+                        help='Maximum number of k-means iterations')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Number of timed runs of each case')
+    parser.add_argument('--parse-max', type=count, default=10**6,
+                        help='Largest data set whose CSV parsing is timed')
+    parser.add_argument('--python-max', type=count, default=10**5,
+                        help='Largest data set given to the pure-Python backend')
+    parser.add_argument('--output', default='clustering_benchmark.json',
+                        help='JSON file to write the results to')
+    parser.add_argument('--plot', default=None,
+                        help='Image file to plot the throughput to')
+    args = parser.parse_args(argv)
+
+    results = run(args.n, args.k, args.dims, args.workers, args.backends,
+                  args.iterations, args.repeat, args.parse_max, args.python_max)
+    with open(args.output, 'w') as f:
+        json.dump({'python': sys.version, 'numpy': np.__version__,
+                   'platform': platform.platform(), 'cpu_count': os.cpu_count(),
+                   'iterations': args.iterations, 'repeat': args.repeat,
+                   'results': results}, f, indent=1)
+    if args.plot and results:
+        plot(results, args.plot)
+
+
+if __name__ == "__main__":
+    main()
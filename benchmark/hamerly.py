@@ -0,0 +1,50 @@
+from aigeanpy.clustering_numpy import lloyd, kmeans_plusplus
+from aigeanpy.clustering_hamerly import hamerly
+import matplotlib.pyplot as plt
+from timeit import default_timer as timer
+import numpy as np
+from pathlib import Path
+import os
+current_folder = Path(__file__).absolute().parent
+os.chdir(current_folder)
+
+# Blobs of points around random water-quality regimes, so that most points
+# settle into their cluster after a few iterations, as with real Ecne data.
+rng = np.random.default_rng(0)
+points_num = [10000, 100000, 1000000]
+clusters_num = [3, 10, 30, 100]
+iterations = 50
+
+saved = np.zeros([len(points_num), len(clusters_num)])
+print(f"{'n':>8} {'k':>4} {'iters':>5} {'lloyd(s)':>9} {'hamerly(s)':>10} "
+      f"{'distances avoided':>17}")
+for i, num in enumerate(points_num):
+    for j, k in enumerate(clusters_num):
+        regimes = rng.normal(size=(k, 3)) * 5
+        f = regimes[rng.integers(k, size=num)] + rng.normal(size=(num, 3))
+        start = kmeans_plusplus(f, k, np.random.default_rng(1))
+
+        tic = timer()
+        centres1, alloc1, n_iter = lloyd(f, start, iterations, tol=0)
+        toc = timer()
+        t_lloyd = toc - tic
+
+        stats = {}
+        tic = timer()
+        centres2, alloc2, _ = hamerly(f, start, iterations, tol=0, stats=stats)
+        toc = timer()
+        t_hamerly = toc - tic
+
+        assert np.array_equal(alloc1, alloc2), 'The two backends disagree'
+        saved[i, j] = 1 - stats['distances'] / stats['lloyd_distances']
+        print(f"{num:>8} {k:>4} {n_iter:>5} {t_lloyd:>9.3f} {t_hamerly:>10.3f} "
+              f"{saved[i, j]:>16.1%}")
+
+for i, num in enumerate(points_num):
+    plt.plot(clusters_num, 100 * saved[i], marker='.', label=f'{num} points')
+plt.xscale('log')
+plt.xlabel('number of clusters')
+plt.ylabel('distance computations avoided (%)')
+plt.title('Hamerly bounds against standard k-means')
+plt.legend()
+plt.savefig('hamerly.png')
@@ -0,0 +1,53 @@
+from aigeanpy.clustering_numpy import lloyd
+from aigeanpy.clustering_parallel import parallel_lloyd
+import matplotlib.pyplot as plt
+from timeit import default_timer as timer
+import numpy as np
+from pathlib import Path
+import os
+
+
+# Throughput of the shared-memory parallel backend against the number of
+# worker processes. tol=0 and uniform points so every run makes the same
+# number of iterations; the time includes copying the points into shared
+# memory and starting the workers.
+if __name__ == "__main__":
+    current_folder = Path(__file__).absolute().parent
+    os.chdir(current_folder)
+
+    points_num = [1000000, 3000000, 10000000]
+    workers_num = [1, 2, 4, 8, 16, 32]
+    workers_num = [w for w in workers_num if w <= (os.cpu_count() or 1)] or [1]
+    clusters = 8
+    iterations = 10
+
+    rng = np.random.default_rng(0)
+    for num in points_num:
+        f = rng.random((num, 3))
+        start = f[:clusters]
+
+        tic = timer()
+        _, _, n_iter = lloyd(f, start, iterations, tol=0)
+        toc = timer()
+        serial = num * n_iter / (toc - tic)
+        print(f"{num} points, serial: {serial/1e6:.1f} M points/s per iteration")
+
+        throughput = []
+        for workers in workers_num:
+            tic = timer()
+            _, _, n_iter = parallel_lloyd(f, start, iterations, tol=0,
+                                          workers=workers)
+            toc = timer()
+            throughput.append(num * n_iter / (toc - tic))
+            print(f"{num} points, {workers} workers: "
+                  f"{throughput[-1]/1e6:.1f} M points/s per iteration")
+
+        plt.plot(workers_num, np.array(throughput) / 1e6, marker='.',
+                 label=f'{num} points')
+        del f
+
+    plt.xlabel('number of workers')
+    plt.ylabel('million points per second per iteration')
+    plt.title(f'Parallel k-means assignment, k={clusters}')
+    plt.legend()
+    plt.savefig('parallel.png')
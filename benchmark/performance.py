@@ -1,5 +1,5 @@
-from aigeanpy.clustering_numpy import cluster_num
-from aigeanpy.clustering import cluster
+from aigeanpy.analysis import kmeans
+from aigeanpy.clustering_numpy import lloyd
 import matplotlib.pyplot as plt
 from timeit import default_timer as timer
 import numpy as np
@@ -19,21 +19,18 @@ t = np.zeros([len(points_num), 3])
 i = 0
 for num in points_num:
     f = np.random.random((num, 3))
-    np.savetxt('new_sample.csv', f, delimiter=',')
 
     tic = timer()
-    cluster('new_sample.csv', 3, 10)
+    kmeans(f, 3, 10, Numpy=False, verbose=False)
     toc = timer()
     t[i, 0] = toc - tic
 
     tic = timer()
-    cluster_num('new_sample.csv', 3, 10)
+    kmeans(f, 3, 10, Numpy=True, verbose=False)
     toc = timer()
     t[i, 1] = toc - tic
     i = i+1
 
-os.remove("new_sample.csv")
-
 C, S = t[:, 0], t[:, 1]
 plt.plot(points_num, C, marker='.', label='without numpy')
 plt.plot(points_num, S, marker='.', label='with numpy')
@@ -43,3 +40,62 @@ plt.title(' Time for clustering algorithm')
 plt.legend()
 os.chdir(current_folder)
 plt.savefig('performance.png')
+
+
+# Speedup of the vectorised numpy kernel against the previous one, which
+# filled the distance matrix cluster by cluster and took square roots.
+# Points are generated in memory so that only the kernel is timed.
+
+
+def loop_kernel(points, centres, iters):
+    cluster_num = centres.shape[0]
+    for j in range(iters):
+        distance = np.zeros([points.shape[0], cluster_num])
+        for i in range(cluster_num):
+            distance[:, i] = ((points[:, 0]-centres[i, 0])**2 + (points[:, 1] -
+                              centres[i, 1])**2 + (points[:, 2]-centres[i, 2])**2)**0.5
+        alloc = np.argmin(distance, axis=1)
+        for i in range(cluster_num):
+            centres[i] = np.sum(points[np.argwhere(alloc == i)],
+                                axis=0)/len(np.argwhere(alloc == i))
+    return centres, alloc
+
+
+kernel_points = np.logspace(3, 6, 7).astype(int)
+kernel_clusters = 8
+t_kernel = np.zeros([len(kernel_points), 3])
+for i, num in enumerate(kernel_points):
+    f = np.random.random((num, 3))
+    start = f[np.random.choice(num, kernel_clusters, replace=False)]
+
+    # lloyd stops once the allocation stops changing, even with tol=0, so
+    # the loop kernel runs for as many iterations as lloyd did, and the
+    # float32 run is compared per iteration.
+    tic = timer()
+    _, _, n_iter = lloyd(f, start, 10, tol=0)
+    toc = timer()
+    t_kernel[i, 1] = toc - tic
+
+    tic = timer()
+    _, _, n_iter32 = lloyd(f.astype(np.float32), start, 10, tol=0)
+    toc = timer()
+    t_kernel[i, 2] = (toc - tic) * n_iter / n_iter32
+
+    tic = timer()
+    loop_kernel(f, start.copy(), n_iter)
+    toc = timer()
+    t_kernel[i, 0] = toc - tic
+
+    print(f"{num} points, {n_iter} iterations ({n_iter32} in float32): "
+          f"{t_kernel[i, 0]/t_kernel[i, 1]:.1f}x faster (float64), "
+          f"{t_kernel[i, 0]/t_kernel[i, 2]:.1f}x faster (float32)")
+
+plt.figure()
+plt.loglog(kernel_points, t_kernel[:, 0], marker='.', label='loop kernel')
+plt.loglog(kernel_points, t_kernel[:, 1], marker='.', label='vectorised float64')
+plt.loglog(kernel_points, t_kernel[:, 2], marker='.', label='vectorised float32')
+plt.xlabel('number of points')
+plt.ylabel('time(s)')
+plt.title(f'Time for up to 10 numpy k-means iterations, k={kernel_clusters}')
+plt.legend()
+plt.savefig('performance_numpy.png')
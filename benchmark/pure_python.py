@@ -0,0 +1,92 @@
+from aigeanpy.clustering import single_run
+import matplotlib.pyplot as plt
+from timeit import default_timer as timer
+from random import Random
+from math import sqrt
+from pathlib import Path
+import os
+current_folder = Path(__file__).absolute().parent
+os.chdir(current_folder)
+
+
+def baseline_kernel(points, centres, clusters, iterations):
+    """
+    The loop of the original aigeanpy.clustering.cluster (before user-031),
+    unchanged: square roots for every distance, a filtered copy of all the
+    points for every cluster on every iteration, and no stopping early.
+    """
+    alloc = [None]*len(points)
+
+    n = 0
+    while n < iterations:
+
+        for i in range(len(points)):
+            select_point = points[i]
+            distance = [None] * clusters
+
+            for s, centre in enumerate(centres):
+                distance[s] = sqrt((select_point[0]-centre[0])**2 +
+                                   (select_point[1]-centre[1])**2 + (select_point[2]-centre[2])**2)
+
+            alloc[i] = distance.index(min(distance))
+
+        for i in range(clusters):
+
+            alloc_ps = [p for j, p in enumerate(points) if alloc[j] == i]
+            dim1 = sum([a[0] for a in alloc_ps]) / len(alloc_ps)
+            dim2 = sum([a[1] for a in alloc_ps]) / len(alloc_ps)
+            dim3 = sum([a[2] for a in alloc_ps]) / len(alloc_ps)
+            new_mean = (dim1, dim2, dim3)
+            centres[i] = new_mean
+        n = n+1
+    return centres, alloc
+
+
+def uniform(rng, num, k):
+    return [(rng.random(), rng.random(), rng.random()) for _ in range(num)]
+
+
+def clustered(rng, num, k):
+    blobs = uniform(rng, k, k)
+    return [tuple(rng.gauss(c, 0.05) for c in rng.choice(blobs))
+            for _ in range(num)]
+
+
+rng = Random(0)
+points_num = [1000, 5000, 20000, 50000]
+clusters_num = [3, 10]
+for data in (uniform, clustered):
+    for k in clusters_num:
+        t = []
+        for num in points_num:
+            points = data(rng, num, k)
+            # single_run with init='random' starts from Random(seed).sample
+            start = Random(1).sample(points, k)
+
+            tic = timer()
+            centres1, alloc1 = baseline_kernel(points, start, k, 10)
+            toc = timer()
+            t_old = toc - tic
+
+            tic = timer()
+            centres2, alloc2, n_iter, _ = single_run(points, k, 10, init='random', seed=1)
+            toc = timer()
+            t_new = toc - tic
+
+            assert list(alloc1) == list(alloc2), 'The two kernels disagree'
+            assert centres1 == centres2, 'The two kernels disagree'
+            t.append((t_old, t_new))
+            print(f"{data.__name__} k={k} {num} points: {t_old:.3f}s -> {t_new:.3f}s "
+                  f"({t_old/t_new:.1f}x faster, {n_iter} of 10 iterations needed; "
+                  f"per iteration {t_old/10*1e3:.1f}ms -> {t_new/n_iter*1e3:.1f}ms)")
+
+        plt.plot(points_num, [old for old, _ in t], marker='.',
+                 label=f'baseline, {data.__name__}, k={k}')
+        plt.plot(points_num, [new for _, new in t], marker='.',
+                 label=f'single pass, {data.__name__}, k={k}')
+
+plt.xlabel('number of points')
+plt.ylabel('time(s)')
+plt.title('Time for up to 10 pure python k-means iterations')
+plt.legend()
+plt.savefig('pure_python.png')
@@ -0,0 +1,36 @@
+from aigeanpy.rendering import render_many
+from timeit import default_timer as timer
+from satmap_suite import synthetic_satmap, INSTRUMENTS
+from aigeanpy.satmap import SatMap
+import numpy as np
+import resource
+import tempfile
+import os
+
+
+# Throughput of batch rendering against the number of worker processes, for
+# a day's worth of quick-looks, and the memory used by rendering one at a
+# time with SatMap.visualise, which should not grow with the number of maps.
+if __name__ == "__main__":
+    maps_num = 200
+    size = 512
+    instruments = list(INSTRUMENTS)
+    maps = [SatMap(*synthetic_satmap(instruments[i % 3], (size, size),
+                                     time=f'{10 + i // 60:02d}:{i % 60:02d}:00',
+                                     seed=i))
+            for i in range(maps_num)]
+    workers_num = [w for w in [1, 2, 4, 8, 16] if w <= (os.cpu_count() or 1)]
+
+    with tempfile.TemporaryDirectory() as outdir:
+        for workers in workers_num:
+            tic = timer()
+            render_many(maps, outdir, workers=workers)
+            toc = timer()
+            print(f"{workers} workers: {maps_num / (toc - tic):.1f} maps/s")
+
+        rss = []
+        for i, m in enumerate(maps):
+            m.visualise(save=True, savepath=outdir)
+            if i % 50 == 49:
+                rss.append(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024)
+        print("Peak RSS every 50 maps (MB):", np.round(rss, 1))
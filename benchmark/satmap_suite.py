@@ -0,0 +1,373 @@
+"""
+Benchmark suite for the SatMap operations and file formats used every day.
+
+Synthetic observations of a configurable size are written in each of the
+archive's file formats, then the reading, arithmetic, mosaicing, coordinate
+transforms and plotting are timed. Results are written as JSON, and the
+compare command flags operations that got slower than a stored baseline.
+
+With --memory, the peak memory of each operation is measured instead of its
+time: the tracemalloc peak (Python and numpy allocations), the rise of the
+process' resident set high-water mark, and the amplification, the tracemalloc
+peak divided by the size of the input data.
+
+    python benchmark/satmap_suite.py run --sizes 64 512 --output current.json
+    python benchmark/satmap_suite.py compare baseline.json current.json
+    python benchmark/satmap_suite.py run --memory --output memory.json
+    python benchmark/satmap_suite.py compare --statistic amplification \\
+        baseline_memory.json memory.json
+"""
+import matplotlib
+matplotlib.use('Agg')
+from aigeanpy.satmap import SatMap, get_satmap
+from aigeanpy.quicklook import quicklook
+from aigeanpy.expression import deferred
+from aigeanpy import dtypes
+from argparse import ArgumentParser
+from timeit import default_timer as timer
+from zipfile import ZipFile
+import matplotlib.pyplot as plt
+import numpy as np
+import platform
+import datetime
+import tempfile
+import tracemalloc
+import gc
+import asdf
+import h5py
+import json
+import sys
+import io
+import os
+
+# Name, resolution (m/px) and file format of each imager in the archive.
+INSTRUMENTS = {'lir': ('Lir', 30, 'asdf'),
+               'manannan': ('Manannan', 15, 'hdf5'),
+               'fand': ('Fand', 5, 'zip')}
+FORMATS = ['asdf', 'hdf5', 'zip']
+
+
+def synthetic_satmap(instrument: str, shape, origin=(0, 0),
+                     date='2023-01-05', time='13:56:24', seed=0):
+    """
+    A SatMap of smoothly varying depth, as the given instrument would take it
+    with its bottom-left corner at `origin` (in meters).
+    """
+    name, resolution, _ = INSTRUMENTS[instrument]
+    rows, cols = shape
+    x = np.linspace(0, 4 * np.pi, cols)
+    y = np.linspace(0, 4 * np.pi, rows)
+    rng = np.random.default_rng(seed)
+    data = 500 + 300 * np.sin(x)[None, :] * np.cos(y)[:, None] + \
+        rng.normal(0, 5, shape)
+    # In the working type of the dtype policy, as get_satmap would read it.
+    data = data.astype(dtypes.working_dtype(data.dtype), copy=False)
+    meta = {'archive': 'ISA', 'year': int(date[:4]), 'observatory': 'Aigean',
+            'instrument': name, 'date': date, 'time': time,
+            'resolution': resolution,
+            'xcoords': [float(origin[0]), float(origin[0] + cols * resolution)],
+            'ycoords': [float(origin[1]), float(origin[1] + rows * resolution)]}
+    return meta, data
+
+
+def write_observation(path: str, meta: dict, data, file_format: str):
+    """
+    Writes an observation in one of the archive's file formats, laid out as
+    the ISA archive does.
+    """
+    if file_format == 'asdf':
+        tree = dict(meta)
+        tree['data'] = data
+        asdf.AsdfFile(tree).write_to(path)
+    elif file_format == 'hdf5':
+        with h5py.File(path, 'w') as f:
+            f.attrs['archive'] = meta['archive']
+            f.attrs['year'] = meta['year']
+            observation = f.create_group('observation')
+            for key in ['date', 'instrument', 'observatory', 'resolution',
+                        'time', 'xcoords', 'ycoords']:
+                observation.attrs[key] = meta[key]
+            observation.create_dataset('data', data=data)
+    elif file_format == 'zip':
+        buffer = io.BytesIO()
+        np.save(buffer, data)
+        with ZipFile(path, 'w') as zf:
+            zf.writestr('observation.npy', buffer.getvalue())
+            zf.writestr('metadata.json', json.dumps(meta))
+    else:
+        raise ValueError("Unknown file format: " + file_format)
+
+
+def build_cases(size: int, workdir: str):
+    """
+    The benchmark cases for square images of `size` pixels a side.
+
+    Returns a list of (name, input bytes, function) where the function runs
+    the operation once. All files are written to `workdir` beforehand, so
+    only the operation itself is timed.
+    """
+    cases = []
+    shape = (size, size)
+
+    for file_format in FORMATS:
+        meta, data = synthetic_satmap('manannan', shape)
+        path = os.path.join(workdir, f'aigean_{size}.{file_format}')
+        write_observation(path, meta, data, file_format)
+        cases.append((f'get_satmap[{file_format}]', data.nbytes,
+                      lambda path=path: get_satmap(path)))
+        # A window of a tenth of the image a side, in its middle.
+        middle, half = size * 15 / 2, size * 15 / 20
+        bbox = (middle - half, middle - half, middle + half, middle + half)
+        cases.append((f'get_satmap[{file_format},bbox]', data.nbytes,
+                      lambda path=path, bbox=bbox: get_satmap(path, bbox=bbox)))
+
+    # Two maps of the same day, overlapping by a quarter of their width.
+    shift = size * 15 * 3 // 4
+    map_a = SatMap(*synthetic_satmap('manannan', shape))
+    map_b = SatMap(*synthetic_satmap('manannan', shape, origin=(shift, shift),
+                                     time='14:10:24', seed=1))
+    cases.append(('__add__', map_a.data.nbytes + map_b.data.nbytes,
+                  lambda: map_a + map_b))
+
+    # The same area on the next day.
+    map_c = SatMap(*synthetic_satmap('manannan', shape, origin=(shift, shift),
+                                     date='2023-01-06', seed=2))
+    cases.append(('__sub__', map_a.data.nbytes + map_c.data.nbytes,
+                  lambda: map_c - map_a))
+
+    # The sums of both days' maps, differenced: eagerly, and deferred.
+    map_d = SatMap(*synthetic_satmap('manannan', shape, date='2023-01-06',
+                                     time='14:10:24', seed=4))
+    cases.append(('(a+b)-(c+d)', 4 * map_a.data.nbytes,
+                  lambda: (map_a + map_b) - (map_c + map_d)))
+    with deferred():
+        expression = (map_a + map_b) - (map_c + map_d)
+    cases.append(('(a+b)-(c+d)[deferred]', 4 * map_a.data.nbytes,
+                  lambda: expression.compute()))
+    cases.append(('(a+b)-(c+d)[deferred,tiled]', 4 * map_a.data.nbytes,
+                  lambda: expression.compute(tile_rows=256)))
+
+    # Lir at half the resolution, overlapping the Manannan map.
+    lir = SatMap(*synthetic_satmap('lir', (size // 2, size // 2),
+                                   origin=(shift, shift), seed=3))
+    cases.append(('mosaic', map_a.data.nbytes + lir.data.nbytes,
+                  lambda: map_a.mosaic(lir)))
+
+    pixels = [(i % size, (7 * i) % size) for i in range(10000)]
+    earths = [map_a.pixel_to_earth(p_x, p_y) for p_x, p_y in pixels]
+    cases.append(('pixel_to_earth[x10000]', 0,
+                  lambda: [map_a.pixel_to_earth(p_x, p_y) for p_x, p_y in pixels]))
+    cases.append(('earth_to_pixel[x10000]', 0,
+                  lambda: [map_a.earth_to_pixel(e_x, e_y) for e_x, e_y in earths]))
+
+    def visualise():
+        map_a.visualise(save=True, savepath=workdir)
+        plt.close('all')
+    cases.append(('visualise', map_a.data.nbytes, visualise))
+    cases.append(('quicklook', map_a.data.nbytes,
+                  lambda: quicklook(map_a, workdir)))
+
+    return cases
+
+
+def time_case(function, repeat: int):
+    """
+    Runs the function `repeat` times, returning the time of each run.
+    """
+    times = []
+    for _ in range(repeat):
+        tic = timer()
+        function()
+        toc = timer()
+        times.append(toc - tic)
+    return times
+
+
+def _reset_rss_peak():
+    """
+    Resets the resident set high-water mark of this process, where the
+    operating system allows it (Linux). Returns whether it was reset.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _rss_peak():
+    """
+    The resident set high-water mark of this process, in bytes.
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def memory_case(function, input_bytes: int):
+    """
+    Runs the function once, returning its peak memory use.
+
+    If the resident set high-water mark cannot be reset, its rise only shows
+    operations that use more memory than any run before them.
+    """
+    gc.collect()
+    rss_reset = _reset_rss_peak()
+    rss_before = _rss_peak()
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    result = function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rss_rise = _rss_peak() - rss_before
+    del result
+    return {'tracemalloc_peak': peak,
+            'rss_peak_rise': rss_rise,
+            'rss_peak_reset': rss_reset,
+            'amplification': peak / input_bytes if input_bytes else None}
+
+
+def run(sizes, repeat: int, output: str, only=None, memory: bool = False,
+        working: str = None):
+    """
+    Runs every case for every size and writes the results as JSON.
+
+    With `memory`, each case is run once and its peak memory recorded
+    instead of its time. `working` sets the working type of the dtype
+    policy (see aigeanpy.dtypes), e.g. 'float32'.
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir, dtypes.policy(working):
+        for size in sizes:
+            for name, nbytes, function in build_cases(size, workdir):
+                if only and not any(pattern in name for pattern in only):
+                    continue
+                function()  # warm up caches and lazy imports
+                key = f'{name}/{size}'
+                results[key] = {'operation': name,
+                                'size': size,
+                                'input_bytes': nbytes}
+                if memory:
+                    results[key].update(memory_case(function, nbytes))
+                    amplification = results[key]['amplification']
+                    print(f"{key:<32} peak {results[key]['tracemalloc_peak']/1e6:10.2f} MB"
+                          f"   rss +{results[key]['rss_peak_rise']/1e6:8.2f} MB"
+                          + (f"   x{amplification:.2f} input" if amplification else ''))
+                    continue
+                times = time_case(function, repeat)
+                results[key].update({'repeat': repeat,
+                                     'min': min(times),
+                                     'median': float(np.median(times)),
+                                     'mean': float(np.mean(times))})
+                print(f"{key:<32} median {results[key]['median']*1e3:10.3f} ms"
+                      f"   min {results[key]['min']*1e3:10.3f} ms")
+
+    report = {'created': datetime.datetime.now().isoformat(timespec='seconds'),
+              'python': platform.python_version(),
+              'numpy': np.__version__,
+              'machine': platform.machine(),
+              'working_dtype': working,
+              'results': results}
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=1)
+    return report
+
+
+def compare(baseline: str, current: str, threshold: float = 0.1,
+            statistic: str = None):
+    """
+    Compares two result files, printing the ratio of current to baseline
+    for every case both contain.
+
+    The statistic compared defaults to the median time, or to the
+    tracemalloc peak for results of a memory run.
+
+    Returns
+    -------
+    regressions : list
+        the cases that are more than `threshold` (as a fraction) slower, or
+        use that much more memory.
+    """
+    with open(baseline) as f:
+        base = json.load(f)['results']
+    with open(current) as f:
+        new = json.load(f)['results']
+
+    common = sorted(set(base) & set(new))
+    if statistic is None:
+        statistic = 'median' if all('median' in new[key] for key in common) \
+            else 'tracemalloc_peak'
+    scale, unit = (1e3, 'ms') if statistic in ('min', 'median', 'mean') else \
+        (1, '') if statistic == 'amplification' else (1e-6, 'MB')
+
+    regressions = []
+    for key in common:
+        if not base[key].get(statistic) or new[key].get(statistic) is None:
+            continue
+        ratio = new[key][statistic] / base[key][statistic]
+        flag = ''
+        if ratio > 1 + threshold:
+            flag = 'REGRESSION'
+            regressions.append(key)
+        elif ratio < 1 - threshold:
+            flag = 'improved'
+        print(f"{key:<32} {base[key][statistic]*scale:10.3f} {unit} -> "
+              f"{new[key][statistic]*scale:10.3f} {unit}  x{ratio:5.2f}  {flag}")
+    for key in sorted(set(base) ^ set(new)):
+        print(f"{key:<32} only in {'baseline' if key in base else 'current'}")
+    return regressions
+
+
+def main(argv=None):
+    parser = ArgumentParser(description='Benchmark SatMap operations and I/O')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='Run the benchmarks')
+    run_parser.add_argument('--sizes', type=int, nargs='+', default=[64, 256, 1024],
+                            help='Side of the synthetic images in pixels')
+    run_parser.add_argument('--repeat', type=int, default=5,
+                            help='Number of timed runs of each case')
+    run_parser.add_argument('--only', nargs='+', default=None,
+                            help='Only run cases whose name contains one of these')
+    run_parser.add_argument('--memory', action='store_true',
+                            help='Measure peak memory instead of time')
+    run_parser.add_argument('--working-dtype', default=None,
+                            help='Working type of the SatMaps, e.g. float32')
+    run_parser.add_argument('--output', default='satmap_benchmark.json',
+                            help='JSON file to write the results to')
+
+    compare_parser = commands.add_parser(
+        'compare', help='Flag regressions against a baseline')
+    compare_parser.add_argument('baseline', help='Baseline JSON results')
+    compare_parser.add_argument('current', help='Current JSON results')
+    compare_parser.add_argument('--threshold', type=float, default=0.1,
+                                help='Slowdown, as a fraction, flagged as a regression')
+    compare_parser.add_argument('--statistic', default=None,
+                                choices=['min', 'median', 'mean', 'tracemalloc_peak',
+                                         'rss_peak_rise', 'amplification'],
+                                help='Statistic compared (median time, or '
+                                     'tracemalloc peak for memory results)')
+
+    args = parser.parse_args(argv)
+    if args.command == 'run':
+        run(args.sizes, args.repeat, args.output, args.only, args.memory,
+            args.working_dtype)
+    else:
+        regressions = compare(args.baseline, args.current, args.threshold,
+                              args.statistic)
+        if regressions:
+            print(f"{len(regressions)} regression(s) above {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Startup time of the console scripts.
+
+Each entry point is started in a fresh interpreter with --help, which parses
+the arguments and exits as soon as the script's imports are done, so the
+time measured is what a user waits before any work starts. The time for the
+interpreter alone is shown for reference, and -X importtime is used to list
+the modules that take longest to import for each script.
+
+    python benchmark/startup.py --repeat 10 --output startup.json
+"""
+from argparse import ArgumentParser
+from timeit import default_timer as timer
+import subprocess
+import statistics
+import platform
+import json
+import sys
+
+ENTRY_POINTS = ['aigean_today', 'aigean_metadata', 'aigean_mosaic']
+
+
+def time_command(command, repeat: int):
+    """
+    Runs the command `repeat` times, returning the wall time of each run.
+    """
+    times = []
+    for _ in range(repeat):
+        tic = timer()
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL)
+        toc = timer()
+        times.append(toc - tic)
+    return times
+
+
+def slowest_imports(module: str, top: int = 5):
+    """
+    The `top` packages with the largest cumulative import time (in seconds)
+    when importing `module`, from the output of -X importtime.
+    """
+    output = subprocess.run([sys.executable, '-X', 'importtime', '-c',
+                             'import ' + module],
+                            check=True, capture_output=True, text=True).stderr
+    imports = []
+    for line in output.splitlines():
+        fields = line.split('|')
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        imports.append((int(fields[1]) / 1e6, fields[2].strip()))
+    # Report packages as a whole and aigeanpy's own modules, skipping the
+    # module itself, which includes everything else.
+    imports = [i for i in imports if i[1] != module and
+               ('.' not in i[1] or i[1].startswith('aigeanpy.'))]
+    return sorted(imports, reverse=True)[:top]
+
+
+def main(argv=None):
+    parser = ArgumentParser(description='Time the startup of the console scripts')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Number of runs of each script')
+    parser.add_argument('--output', default=None,
+                        help='JSON file to write the results to')
+    args = parser.parse_args(argv)
+
+    results = {}
+    commands = {'python': [sys.executable, '-c', 'pass']}
+    for name in ENTRY_POINTS:
+        commands[name] = [sys.executable, '-m', 'aigeanpy.' + name, '--help']
+    for name, command in commands.items():
+        times = time_command(command, args.repeat)
+        results[name] = {'min': min(times), 'median': statistics.median(times)}
+        print(f"{name:<18} median {results[name]['median']*1e3:8.1f} ms"
+              f"   min {results[name]['min']*1e3:8.1f} ms")
+        if name != 'python':
+            for seconds, module in slowest_imports('aigeanpy.' + name):
+                print(f"    {module:<40} {seconds*1e3:8.1f} ms")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'python': sys.version, 'platform': platform.platform(),
+                       'repeat': args.repeat, 'results': results}, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
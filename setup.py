@@ -5,6 +5,7 @@ REQUIRES = [
     "asdf>=2.14.3",
     "matplotlib>=3.1.1",
     "numpy>=1.18",
+    "scipy>=1.4.1",
     "h5py>=3.6.0",
     "pathlib>=1.0",
     "scikit-image>=0.19.0",